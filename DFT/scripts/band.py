@@ -3,67 +3,30 @@
 # 2024-10
 
 import os
-import glob
 import logging
 import sys
 import numpy as np
 import matplotlib.pyplot as plt
-from pymatgen.io.vasp import Vasprun
-from pymatgen.electronic_structure.bandstructure import BandStructureSymmLine, BandStructure, Spin
+from band_loader import check_vasprun, read_band_structure, write_band_data, print_band_gap
 
 "Plot the band structure using the vasprun.xml and KPOINTS files from VASP calculations"
 "Usage: ----> band.py                   # default plot \
         ----> band.py --y -10 15        # set the y-axis \
         ----> band.py --band            # include the VBM and CBM limits \
-        ----> band.py --y -10 15 --band # Set range in y-axis and show horizontal lines of the VBM and CBM."
+        ----> band.py --y -10 15 --band # Set range in y-axis and show horizontal lines of the VBM and CBM. \
+        ----> band.py gap               # only print the VBM, CBM and band gap (as bandgap.py) \
+        ----> band.py dat               # only save band_data.dat (--npy: band_data.npy, [block, kpoint, (distance, energy)]) \
+        ----> band.py all --y -10 15    # band gap, band_data.dat and plot from one load of vasprun.xml"
 "IMPORTANT: For hybrid calculations, use the KPOINTS from PBE with the same path (only for plot)"
+"The band structure is read by band_loader.py (only eigenvalues, k-points, lattice and Fermi energy, kept in vasprun.xml.bands.cache/)"
 
-def check_vasprun():
-    "Find the vasprun.xml file"
-    directories = sorted(glob.glob("split-*")) or ["."]
-    vasprun_files = []
+# Subcommands, plot also saves band_data.dat
+COMMANDS = ('gap', 'dat', 'plot', 'all')
 
-    for directory in directories:
-        for file_extension in ["vasprun.xml", "vasprun.xml.gz"]:
-            vr_file_path = os.path.join(directory, file_extension)
-            if os.path.exists(vr_file_path):
-                vasprun_files.append(vr_file_path) 
-                break
-            else:
-                print("vasprun.xml file was not found")
-
-    return vasprun_files
-
-def compute_k_distance(kpoints):
-    "Calculate the k-distance from the k-points, using the OUTCAR"
-    "Value 1: 0 \
-     Value 2: norm([i + 1] - [i]) = distance 1 \
-     Value 3: norm([i + 2] - [i + 1]) + distance 1 = distance 2 \
-     Value 4: norm([i + 3] - [i + 2]) + distance 1 + distance 2 = distance 3 \
-     ..... "      
-    distances = [0.0]
-    for i in range(1, len(kpoints)):
-        dist = np.linalg.norm(kpoints[i].frac_coords - kpoints[i-1].frac_coords)
-        distances.append(distances[-1] + dist)
-    return distances
-
-def save_dat(bs, prefix=None, directory=None):
+def save_dat(bs, directory=None, binary=False):
     "Save band structure data"
     output_filename = os.path.join(directory or ".", "band_data.dat")
-    reference_energy = bs.efermi if bs.is_metal() else bs.get_vbm()["energy"]  # Identify the reference energy
-    
-    with open(output_filename, "w") as output_file:
-        output_file.write("# Distance Energies (eV)\n")
-
-        k_distances = compute_k_distance(bs.kpoints)
-
-        for spin in [Spin.up, Spin.down] if bs.is_spin_polarized else [Spin.up]:
-            for band in bs.bands[spin]:
-                for distance, energy in zip(k_distances, band):
-                    output_file.write(f"{distance:.8f} {energy - reference_energy:.8f}\n")
-                output_file.write("\n")
-
-    return output_filename
+    return write_band_data(bs, output_filename, binary)
 
 def print_repeated_values(filename):
     with open(filename, 'r') as file:
@@ -130,7 +93,77 @@ def analyze_files(band_structure_path, kpoints_path):
     unique_labels = read_kpoints(kpoints_path)
     return repeated_values, unique_labels
 
+def plot_band_structure(bs, y_min=None, y_max=None, draw_band_lines=False):
+    "Plot band_data.dat with the labels of KPOINTS and save band_structure_plot.png"
+    # Analyze the band structure data
+    repeated_values, unique_labels = analyze_files('band_data.dat', 'KPOINTS')
+
+    # Load data for the plot
+    data = np.loadtxt('band_data.dat')
+
+    # Create figure
+    fig, ax = plt.subplots()
+
+    # Detect changes indicating block separation
+    is_block_start = np.concatenate(([True], np.diff(data[:, 0]) < 0))
+    block_indices = np.where(is_block_start)[0]
+
+    # Plot the blocks
+    for i in range(len(block_indices)):
+        if i < len(block_indices) - 1:
+            block_data = data[block_indices[i]:block_indices[i + 1]]
+        else:
+            block_data = data[block_indices[i]:]  # Last block
+
+        # Separate the valence band and the conduction band
+        valence_band = block_data[block_data[:, 1] < 0]
+        conduction_band = block_data[block_data[:, 1] > 0]
+
+        # Plot VBM and CBM with different colors
+        if len(valence_band) > 0:
+            ax.plot(valence_band[:, 0], valence_band[:, 1], linestyle='-', markersize=1, c='blue')
+        
+        if len(conduction_band) > 0:
+            ax.plot(conduction_band[:, 0], conduction_band[:, 1], linestyle='-', markersize=1, c='red')
+
+    ax.set_ylabel('Energy (eV)', fontsize=14)
+
+    # Create a mapping between repeated_values and unique_labels
+    xticks = [data[np.isclose(data[:, 0], float(value), atol=1e-8)][0, 0] for value in repeated_values]
+    xtick_labels = unique_labels  # Use unique_labels as labels
+
+    ax.set_xticks(xticks)
+    ax.set_xticklabels(xtick_labels, fontsize=14)
+
+    # Plot vertical lines at k-points
+    for x in xticks:
+        ax.axvline(x=x, color='k', linestyle='-', linewidth=0.9)
+
+    # Set y-axis limits if provided
+    if y_min is not None and y_max is not None:
+        plt.ylim(y_min, y_max)
+
+    plt.xlim(min(xticks), max(xticks))  
+    fig.set_size_inches(12, 8)
+
+    # Draw band lines if --band is specified
+    if draw_band_lines:
+        cbm_info = bs.get_cbm()
+        vbm_info = bs.get_vbm()
+#                print("VBM Energy:", vbm_info["energy"])
+#                print("CBM Energy:", cbm_info["energy"])
+        plt.axhspan(0, cbm_info["energy"] - vbm_info["energy"], color='gray', alpha=0.4)                     
+        plt.axhline(y=0.00, color='g', linestyle='dashed')
+        plt.axhline(y=cbm_info["energy"] - vbm_info["energy"], color='g', linestyle='dashed')
+
+    plt.savefig('band_structure_plot.png', dpi=200, bbox_inches='tight') 
+    # Show the plot
+    plt.show()
+
 def main():
+    # Subcommand (gap, dat, plot or all), several outputs from one load of the band structure. By default: plot
+    command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[1] in COMMANDS else 'plot'
+
     # Check for command line arguments for y-axis limits and band lines
     y_min = None
     y_max = None
@@ -150,83 +183,29 @@ def main():
     # Find vasprun.xml files
     vasprun_files = check_vasprun()
     
-    for vr_file in vasprun_files:
-        # Parse the vasprun.xml file to get band structure
-        try:
-            vasprun = Vasprun(vr_file)
-            bs = vasprun.get_band_structure()
-
-            # Save the data
-            save_dat(bs, prefix=os.path.basename(vr_file).split('.')[0], directory='.')
-            print("Data has been saved")
-
-            # Analyze the band structure data
-            repeated_values, unique_labels = analyze_files('band_data.dat', 'KPOINTS')
-
-            # Load data for the plot
-            data = np.loadtxt('band_data.dat')
-
-            # Create figure
-            fig, ax = plt.subplots()
-
-            # Detect changes indicating block separation
-            is_block_start = np.concatenate(([True], np.diff(data[:, 0]) < 0))
-            block_indices = np.where(is_block_start)[0]
-
-            # Plot the blocks
-            for i in range(len(block_indices)):
-                if i < len(block_indices) - 1:
-                    block_data = data[block_indices[i]:block_indices[i + 1]]
-                else:
-                    block_data = data[block_indices[i]:]  # Last block
-
-                # Separate the valence band and the conduction band
-                valence_band = block_data[block_data[:, 1] < 0]
-                conduction_band = block_data[block_data[:, 1] > 0]
-
-                # Plot VBM and CBM with different colors
-                if len(valence_band) > 0:
-                    ax.plot(valence_band[:, 0], valence_band[:, 1], linestyle='-', markersize=1, c='blue')
-                
-                if len(conduction_band) > 0:
-                    ax.plot(conduction_band[:, 0], conduction_band[:, 1], linestyle='-', markersize=1, c='red')
-
-            ax.set_ylabel('Energy (eV)', fontsize=14)
-
-            # Create a mapping between repeated_values and unique_labels
-            xticks = [data[np.isclose(data[:, 0], float(value), atol=1e-8)][0, 0] for value in repeated_values]
-            xtick_labels = unique_labels  # Use unique_labels as labels
-
-            ax.set_xticks(xticks)
-            ax.set_xticklabels(xtick_labels, fontsize=14)
-
-            # Plot vertical lines at k-points
-            for x in xticks:
-                ax.axvline(x=x, color='k', linestyle='-', linewidth=0.9)
-
-            # Set y-axis limits if provided
-            if y_min is not None and y_max is not None:
-                plt.ylim(y_min, y_max)
-
-            plt.xlim(min(xticks), max(xticks))  
-            fig.set_size_inches(12, 8)
-
-            # Draw band lines if --band is specified
-            if draw_band_lines:
-                cbm_info = bs.get_cbm()
-                vbm_info = bs.get_vbm()
-#                print("VBM Energy:", vbm_info["energy"])
-#                print("CBM Energy:", cbm_info["energy"])
-                plt.axhspan(0, cbm_info["energy"] - vbm_info["energy"], color='gray', alpha=0.4)                     
-                plt.axhline(y=0.00, color='g', linestyle='dashed')
-                plt.axhline(y=cbm_info["energy"] - vbm_info["energy"], color='g', linestyle='dashed')
+    if not vasprun_files:
+        return
+
+    # Parse the vasprun.xml files to get band structure (split-XX folders are joined)
+    try:
+        bs = read_band_structure(vasprun_files)
+
+        if command in ('gap', 'all'):
+            print_band_gap(bs)
+            if command == 'gap':
+                return
+
+        # Save the data
+        # band.py dat --npy: binary band_data.npy instead of band_data.dat
+        binary = command == 'dat' and '--npy' in sys.argv
+        save_dat(bs, directory='.', binary=binary)
+        print("Data has been saved")
 
-            plt.savefig('band_structure_plot.png', dpi=200, bbox_inches='tight') 
-            # Show the plot
-            plt.show()
+        if command != 'dat':
+            plot_band_structure(bs, y_min, y_max, draw_band_lines)
 
-        except Exception as e:
-            logging.error(f"ERROR processing {vr_file}: {str(e)}")
+    except Exception as e:
+        logging.error(f"ERROR processing {', '.join(vasprun_files)}: {str(e)}")
 
 if __name__ == "__main__":
     main()
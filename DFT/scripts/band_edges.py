@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import os
+import json
+from vasprun_reader import load_vasprun
+
+"VBM and CBM of the perfect supercell, used by eigenplot.py, locplot.py and localized.py when --band is not given"
+"The band edges are taken from ../perfect: \
+       ----> perfect_band_edge_state.json (written by pydefect), if it exists \
+       ----> vasprun.xml: VBM = highest occupied state (occupancy >= 0.5), CBM = lowest unoccupied state (occupancy < 0.5)"
+"The values are stored in band_edges.json next to the perfect folder (one store per project), so the perfect vasprun.xml is not parsed \
+ again for every defect folder. The store is updated when the source file changes."
+"Usage: ----> band_edges.py              # print the VBM and CBM of ../perfect \
+        ----> vbm, cbm = get_band_edges('.')"
+
+STORE = 'band_edges.json'
+SOURCES = ('perfect_band_edge_state.json', 'vasprun.xml')
+
+
+def edges_from_pydefect(file_path):
+    "VBM and CBM from perfect_band_edge_state.json"
+    with open(file_path) as file:
+        state = json.load(file)
+    return state['vbm_info']['orbital_info']['energy'], state['cbm_info']['orbital_info']['energy']
+
+
+def edges_from_vasprun(file_path):
+    "VBM and CBM from the eigenvalues and occupations of vasprun.xml"
+    eigenvalues = load_vasprun(file_path)['eigenvalues']
+    energy, occupancy = eigenvalues[..., 0], eigenvalues[..., 1]
+    occupied = occupancy >= 0.5
+    return float(energy[occupied].max()), float(energy[~occupied].min())
+
+
+def read_store(store_file):
+    try:
+        with open(store_file) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def get_band_edges(directory='.'):
+    "VBM and CBM of directory/../perfect, from the store when it is up to date"
+    perfect = os.path.realpath(os.path.join(directory, '..', 'perfect'))
+    source = next((os.path.join(perfect, name) for name in SOURCES if os.path.exists(os.path.join(perfect, name))), None)
+    if source is None:
+        raise FileNotFoundError(f"No {' or '.join(SOURCES)} in {perfect}, use --band VBM CBM")
+
+    store_file = os.path.join(os.path.dirname(perfect), STORE)
+    store = read_store(store_file)
+    stat = os.stat(source)
+    key = os.path.relpath(source, os.path.dirname(perfect))
+    entry = store.get(key)
+    if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+        return entry['vbm'], entry['cbm']
+
+    if source.endswith('.json'):
+        vbm, cbm = edges_from_pydefect(source)
+    else:
+        vbm, cbm = edges_from_vasprun(source)
+
+    store[key] = {'vbm': vbm, 'cbm': cbm, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    # Several processes of the batch mode can update the store, write it in a temporary file and then rename it
+    tmp_file = f"{store_file}.tmp-{os.getpid()}"
+    try:
+        with open(tmp_file, 'w') as file:
+            json.dump(store, file, indent=1)
+        os.replace(tmp_file, store_file)
+    except OSError:
+        pass
+    return vbm, cbm
+
+
+def resolve_band(band, directory='.'):
+    "VBM and CBM given with --band, those of the perfect supercell, or those of directory in a dictionary of resolve_bands"
+    if isinstance(band, dict):
+        edges = band[directory]
+        # Error of resolve_bands for this folder, raised in the worker so only this folder fails
+        if isinstance(edges, Exception):
+            raise edges
+        return edges
+    if band is not None:
+        return tuple(band)
+    return get_band_edges(directory)
+
+
+def resolve_bands(band, dirs):
+    "VBM and CBM of each folder of the batch mode, {directory: (vbm, cbm)}. Each perfect folder is read only once, before the pool \
+     starts, so the workers do not parse ../perfect/vasprun.xml and write band_edges.json at the same time. If the edges of a folder \
+     cannot be found (e.g. no ../perfect) the error is kept instead of (vbm, cbm), and only that folder fails in run_batch"
+    edges = {}
+    perfects = {}
+    for directory in dirs:
+        perfect = os.path.realpath(os.path.join(directory, '..', 'perfect'))
+        if perfect not in perfects:
+            try:
+                perfects[perfect] = resolve_band(band, directory)
+            except (OSError, ValueError, KeyError) as error:
+                perfects[perfect] = error
+        edges[directory] = perfects[perfect]
+    return edges
+
+
+if __name__ == '__main__':
+    vbm, cbm = get_band_edges('.')
+    print(f"VBM = {vbm:.4f} eV")
+    print(f"CBM = {cbm:.4f} eV")
+    print(f"Band gap = {cbm - vbm:.4f} eV")
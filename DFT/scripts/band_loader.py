@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import os
+import re
+import glob
+import gzip
+import numpy as np
+from pymatgen.core import Lattice
+from pymatgen.io.vasp import Vasprun
+from pymatgen.io.vasp.inputs import Kpoints
+from pymatgen.electronic_structure.bandstructure import BandStructureSymmLine, BandStructure, Spin, get_reconstructed_band_structure
+from sidecar import load_sidecar
+from final_energy import map_file
+
+"Band structure loader shared by band.py, bandgap.py and extract_k-path_energies_bandstructure.py"
+"Only the information of the band structure is parsed from vasprun.xml (pymatgen Vasprun with parse_dos and \
+ parse_projected_eigen switched off): \
+       ----> eigenvalues[spin, kpoint, band, 2]    # column 0: energy, column 1: occupancy \
+       ----> kpoints[kpoint, 3] and weights[kpoint] \
+       ----> lattice[3, 3]                         # lattice of the final structure (real space) \
+       ----> efermi and hybrid                     # hybrid: LHFCALC or k-points with zero weight (path of the HSE band structure) \
+ Without the DOS, pymatgen does not read the Fermi energy (it is in the <dos> block), so it is found searching backward from \
+ the end of the file (rfind, as in final_energy.py). The arrays are kept in a binary sidecar (vasprun.xml.bands.cache/, see sidecar.py), so the three tools parse the file only \
+ the first time, and the pymatgen band structure is built from the arrays in the same way as Vasprun.get_band_structure()."
+"Usage: ----> bs = read_band_structure(check_vasprun())   # split-XX folders are joined in one band structure \
+        ----> write_band_data(bs, 'band_data.dat')       # distance and energy of each band (band.py and extract_k-path_energies_bandstructure.py) \
+        ----> band.py gap | dat | plot | all             # several outputs from one load"
+
+# Increase when the arrays saved in the sidecar change
+VERSION = 1
+SUFFIX = 'bands.cache'
+
+EFERMI = re.compile(rb'<i name="efermi">\s*([^<\s]+)\s*</i>')
+
+
+def check_vasprun():
+    "Find the vasprun.xml file"
+    directories = sorted(glob.glob("split-*")) or ["."]
+    vasprun_files = []
+
+    for directory in directories:
+        for file_extension in ["vasprun.xml", "vasprun.xml.gz"]:
+            vr_file_path = os.path.join(directory, file_extension)
+            if os.path.exists(vr_file_path):
+                vasprun_files.append(vr_file_path)
+                break
+            else:
+                print("vasprun.xml file was not found")
+
+    return vasprun_files
+
+
+def find_efermi(file_path):
+    "Last efermi of the vasprun.xml (None if not found)"
+    if file_path.endswith('.gz'):
+        with gzip.open(file_path, 'rb') as file:
+            content = file.read()
+        start = content.rfind(b'<i name="efermi">')
+        match = EFERMI.match(content, start) if start >= 0 else None
+        return float(match.group(1)) if match else None
+
+    with open(file_path, 'rb') as file:
+        vasprun = map_file(file)
+        if vasprun is None:
+            return None
+        with vasprun:
+            start = vasprun.rfind(b'<i name="efermi">')
+            match = EFERMI.match(vasprun, start) if start >= 0 else None
+            return float(match.group(1)) if match else None
+
+
+def read_band_data(file_path='vasprun.xml'):
+    "Eigenvalues, k-points, lattice and Fermi energy of the vasprun.xml (without DOS and projections)"
+    vasprun = Vasprun(file_path, parse_dos=False, parse_projected_eigen=False, parse_potcar_file=False)
+    spins = [Spin.up, Spin.down] if vasprun.is_spin else [Spin.up]
+    weights = np.array(vasprun.actual_kpoints_weights, dtype=float)
+    return {'eigenvalues': np.array([vasprun.eigenvalues[spin] for spin in spins], dtype=float),
+            'kpoints': np.array(vasprun.actual_kpoints, dtype=float),
+            'weights': weights,
+            'lattice': np.array(vasprun.final_structure.lattice.matrix),
+            'efermi': np.array(vasprun.efermi if vasprun.efermi is not None else find_efermi(file_path), dtype=float),
+            'hybrid': np.array(bool(vasprun.parameters.get("LHFCALC", False)) or bool(np.any(weights == 0.0)))}
+
+
+def load_band_data(file_path='vasprun.xml', rebuild=False):
+    "Arrays of read_band_data from the sidecar (the file is parsed only if the sidecar is missing or out of date)"
+    return load_sidecar(file_path, read_band_data, version=VERSION, rebuild=rebuild, suffix=SUFFIX)
+
+
+def band_structure(data, kpoints_filename=None, line_mode=False):
+    "pymatgen BandStructure (BandStructureSymmLine for a line-mode KPOINTS or line_mode=True) from the arrays of load_band_data"
+    kpoints = np.array(data['kpoints'])
+    eigenvalues = {spin: np.array(data['eigenvalues'][i, :, :, 0]).T for i, spin in enumerate([Spin.up, Spin.down][:len(data['eigenvalues'])])}
+    reciprocal = Lattice(Lattice(np.array(data['lattice'])).reciprocal_lattice.matrix)
+    efermi = float(data['efermi'])
+
+    kpoint_file = Kpoints.from_file(kpoints_filename) if kpoints_filename and os.path.isfile(kpoints_filename) else None
+    if kpoint_file is not None and kpoint_file.style == Kpoints.supported_modes.Line_mode:
+        line_mode = True
+    if not line_mode:
+        return BandStructure(kpoints, eigenvalues, reciprocal, efermi)
+    if kpoint_file is None:
+        raise RuntimeError("Kpoint file cannot be None for line mode.")
+
+    labels_dict = {}
+    if bool(data['hybrid']):
+        # Only the k-points of the path (zero weight) are kept
+        start = int(np.argmax(np.isclose(data['weights'], 0.0)))
+        for i in range(start, len(kpoint_file.kpts)):
+            if kpoint_file.labels is not None and kpoint_file.labels[i] is not None:
+                labels_dict[kpoint_file.labels[i]] = kpoint_file.kpts[i]
+        kpoints = kpoints[start:]
+        eigenvalues = {spin: values[:, start:] for spin, values in eigenvalues.items()}
+    elif kpoint_file.labels is not None:
+        labels_dict = {label: kpoint for label, kpoint in zip(kpoint_file.labels, kpoint_file.kpts) if label is not None}
+    return BandStructureSymmLine(kpoints, eigenvalues, reciprocal, efermi, labels_dict)
+
+
+def load_band_structure(file_path='vasprun.xml', line_mode=False, rebuild=False):
+    "Band structure of a vasprun.xml, with the KPOINTS of the same folder"
+    kpoints_filename = os.path.join(os.path.dirname(file_path), "KPOINTS")
+    return band_structure(load_band_data(file_path, rebuild), kpoints_filename, line_mode)
+
+
+def read_band_structure(vasprun_files, rebuild=False):
+    "Band structure of the vasprun.xml files, the split-XX calculations (see kpoints.py --split) are joined in one band structure"
+    if len(vasprun_files) == 1:
+        return load_band_structure(vasprun_files[0], rebuild=rebuild)
+
+    # Each split-XX/KPOINTS starts with the k-points of the IBZKPT, in line mode only the k-points of the path (zero weight) are kept
+    band_structures = [load_band_structure(vr_file, line_mode=True, rebuild=rebuild) for vr_file in vasprun_files]
+    return get_reconstructed_band_structure(band_structures)
+
+
+def compute_k_distance(bs):
+    "Cumulative Cartesian distance along the k-points (1/Å, 2*pi included), with the reciprocal lattice of the band structure"
+    "Value 1: 0 \
+     Value 2: |k2 - k1| = distance 1 \
+     Value 3: |k3 - k2| + distance 1 = distance 2 \
+     ..... "
+    cartesian = np.dot(np.array([kpoint.frac_coords for kpoint in bs.kpoints]), bs.lattice_rec.matrix)
+    return np.concatenate(([0.0], np.cumsum(np.linalg.norm(np.diff(cartesian, axis=0), axis=1))))
+
+
+def write_band_data(bs, output_filename, binary=False):
+    "Save the distance and energy (reference: VBM, or Fermi energy for metals) of each k-point, one block per band and spin"
+    "binary=True: the array [block, kpoint, (distance, energy)] is saved in a .npy file instead of the text file (much faster for large files)"
+    reference_energy = bs.efermi if bs.is_metal() else bs.get_vbm()["energy"]
+    spins = [Spin.up, Spin.down] if bs.is_spin_polarized else [Spin.up]
+    energies = np.concatenate([np.asarray(bs.bands[spin]) for spin in spins]) - reference_energy
+
+    # Columns (distance, energy) of all the blocks, formatted with a single operation
+    table = np.empty(energies.shape + (2,))
+    table[:, :, 0] = compute_k_distance(bs)
+    table[:, :, 1] = energies
+    if binary:
+        output_filename = os.path.splitext(output_filename)[0] + '.npy'
+        np.save(output_filename, table)
+        return output_filename
+
+    block = "%.8f %.8f\n" * energies.shape[1] + "\n"
+    with open(output_filename, "w") as output_file:
+        output_file.write("# Distance Energies (eV)\n")
+        output_file.write((block * energies.shape[0]) % tuple(table.ravel()))
+    return output_filename
+
+
+def print_band_gap(bs):
+    "Print the VBM, CBM and band gap"
+    cbm = bs.get_cbm()
+    vbm = bs.get_vbm()
+
+    if vbm:
+        print("Valence Band Maximum (VBM):")
+        print(f"  Energy: {vbm['energy']:.4f} eV")
+    else:
+        print("\nVBM not found (possibly metallic).")
+
+    if cbm:
+        print("\nConduction Band Minimum (CBM):")
+        print(f"  Energy: {cbm['energy']:.4f} eV")
+    else:
+        print("CBM not found (possibly metallic).")
+
+    if cbm and vbm:
+        band_gap = cbm["energy"] - vbm["energy"]
+        print(f"\nBand Gap: {band_gap:.4f} eV")
+    else:
+        print("\nNo band gap (metallic material).")
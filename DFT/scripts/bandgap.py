@@ -2,29 +2,10 @@
 # Written by Joseph P.Vera
 # 2024-10
 
-from pymatgen.io.vasp import Vasprun
-from pymatgen.electronic_structure.bandstructure import BandStructure
+from band_loader import check_vasprun, read_band_structure, print_band_gap
 
-vasprun = Vasprun("vasprun.xml")  
-band_structure = vasprun.get_band_structure()
+"Print the VBM, CBM and band gap. The band structure is read by band_loader.py (only eigenvalues, k-points, lattice and Fermi energy, \
+ kept in vasprun.xml.bands.cache/), the split-XX folders are joined. Same as band.py gap"
 
-cbm = band_structure.get_cbm()
-vbm = band_structure.get_vbm()
-
-if vbm:
-    print("Valence Band Maximum (VBM):")
-    print(f"  Energy: {vbm['energy']:.4f} eV")
-else:
-    print("\nVBM not found (possibly metallic).")
-    
-if cbm:
-    print("\nConduction Band Minimum (CBM):")
-    print(f"  Energy: {cbm['energy']:.4f} eV")
-else:
-    print("CBM not found (possibly metallic).")
-
-if cbm and vbm:
-    band_gap = cbm["energy"] - vbm["energy"]
-    print(f"\nBand Gap: {band_gap:.4f} eV")
-else:
-    print("\nNo band gap (metallic material).")
+if __name__ == '__main__':
+    print_band_gap(read_band_structure(check_vasprun()))
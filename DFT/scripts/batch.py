@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import os
+import json
+from functools import partial
+from multiprocessing import Pool
+
+"Batch mode (--dirs) shared by localized.py, locplot.py and defects.py"
+"The defect calculations under a root folder (e.g. V_B_0, V_B_-1, B_N_-2) are found with discover_dirs, the folders whose outputs are \
+ newer than their inputs and were written with the same options are skipped, and the analysis of the other folders is sent to a \
+ process pool. At the end a single index (<root>/<name>_index.dat) is written with the status and output of each folder, and the \
+ options of each folder are kept in <root>/<name>_options.json (e.g. locplot.py --dirs --tot runs again the folders plotted without --tot)."
+"Usage: ----> localized.py --dirs                # all the defect folders under the current folder \
+        ----> locplot.py --dirs calc --workers 8 # all the defect folders under calc/, using 8 processes \
+        ----> defects.py --dirs --force          # run again even if the outputs are up to date"
+
+# Folders that are not defect calculations
+SKIP_DIRS = ('perfect', 'localized-defects')
+
+
+def add_batch_arguments(parser):
+    "Options of the batch mode"
+    parser.add_argument('--dirs', nargs='?', const='.', default=None, metavar='ROOT', help="Run over every defect folder under ROOT (default: current folder)")
+    parser.add_argument('--workers', type=int, default=None, help="Number of processes in the batch mode. By default: number of CPUs")
+    parser.add_argument('--force', action='store_true', help="In the batch mode, run again the folders whose outputs are up to date")
+
+
+def discover_dirs(root, required_files, check=None):
+    "Folders under root that contain all the required files (and pass check(directory), if given)"
+    found = []
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = sorted(d for d in subdirs if d not in SKIP_DIRS and not d.startswith('.') and not d.endswith('.cache'))
+        if os.path.basename(os.path.abspath(directory)) in SKIP_DIRS:
+            continue
+        if all(name in files for name in required_files) and (check is None or check(directory)):
+            found.append(directory)
+    return found
+
+
+def is_up_to_date(inputs, outputs):
+    "True if all the outputs exist and are newer than all the inputs (False if none of the inputs exist)"
+    if not outputs or not all(os.path.exists(path) for path in outputs):
+        return False
+    newest_input = max((os.path.getmtime(path) for path in inputs if os.path.exists(path)), default=None)
+    if newest_input is None:
+        return False
+    return min(os.path.getmtime(path) for path in outputs) >= newest_input
+
+
+def read_options(options_file):
+    try:
+        with open(options_file) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def normalize(options):
+    "Options as they are read back from the json file (tuples ----> lists, other objects such as errors ----> text)"
+    return json.loads(json.dumps(options, default=repr))
+
+
+def run_task(task, directory):
+    "Run the analysis of one folder, the errors are returned instead of stopping the pool"
+    try:
+        return directory, 'done', task(directory)
+    except Exception as error:
+        return directory, 'failed', f"{type(error).__name__}: {error}"
+
+
+def run_batch(task, dirs, inputs, outputs, workers=None, force=False, root='.', name='batch', options=None):
+    "Run task(directory) over dirs with a process pool and write <root>/<name>_index.dat \
+     options(directory): dictionary of the options that change the outputs, a folder written with other options is run again"
+    options_file = os.path.join(root, f"{name}_options.json")
+    stored = read_options(options_file)
+    current = {os.path.relpath(directory, root): normalize(options(directory) if options else {}) for directory in dirs}
+
+    results = []
+    pending = []
+    for directory in dirs:
+        key = os.path.relpath(directory, root)
+        if not force and stored.get(key) == current[key] and is_up_to_date(inputs(directory), outputs(directory)):
+            results.append((directory, 'skipped', os.path.commonpath(outputs(directory))))
+        else:
+            pending.append(directory)
+
+    print(f"{len(dirs)} folders found, {len(pending)} to run, {len(dirs) - len(pending)} up to date")
+    if pending:
+        with Pool(min(workers or os.cpu_count(), len(pending))) as pool:
+            for directory, status, info in pool.imap_unordered(partial(run_task, task), pending):
+                print(f"{status:<8} {directory}")
+                results.append((directory, status, info))
+
+    for directory, status, _ in results:
+        if status == 'done':
+            key = os.path.relpath(directory, root)
+            stored[key] = current[key]
+    try:
+        with open(options_file, 'w') as file:
+            json.dump(stored, file, indent=1)
+    except OSError:
+        pass
+
+    index_file = os.path.join(root, f"{name}_index.dat")
+    with open(index_file, 'w') as file:
+        file.write(f"{'Folder':<30} {'Status':<10} {'Output'}\n")
+        for directory, status, info in sorted(results):
+            file.write(f"{os.path.relpath(directory, root):<30} {status:<10} {info}\n")
+    print(f"The index of results was saved in {index_file}")
+    return results
@@ -4,194 +4,484 @@
 
 from ase.io import read
 import numpy as np
+import matplotlib.pyplot as plt
+from scipy.spatial import cKDTree
 import os
+import csv
+import json
+import argparse
+from functools import partial
+from multiprocessing import Pool
+from batch import add_batch_arguments, discover_dirs, run_batch, run_task
 
 "Code to find vacancy, substitutional or interstitial defects by comparing perfect/POSCAR with defect/POSCAR"
 
-poscar_defect = read("POSCAR")                  
-poscar_perfect = read("../perfect/POSCAR")       
-
-# Get the lattice matrix to handle any crystal structure
-lattice_matrix = poscar_defect.get_cell()
-
-# Extract fractional positions and symbols
-frac_positions_defect = poscar_defect.get_scaled_positions()
-frac_positions_perfect = poscar_perfect.get_scaled_positions()
-symbols_defect = poscar_defect.get_chemical_symbols()
-symbols_perfect = poscar_perfect.get_chemical_symbols()
+"Usage: ----> defects.py          # compare ./POSCAR with ../perfect/POSCAR \
+        ----> defects.py --dirs   # Batch mode, all the defect folders under the current folder (see batch.py) \
+        ----> defects.py --library calc --shells 3   # Library mode, one table of all the defect folders under calc/ \
+        ----> defects.py --displacements            # Displacements of the atoms from POSCAR to CONTCAR around the defect"
 
 # Tolerance to compare the positions in different POSCAR's (for find the vacancy, substitutional, or interstitial atoms)
 tolerance = 0.001
 
-def cartesian_distance(frac_pos_a, frac_pos_b, lattice):
-    "Calculate the Cartesian distance between two fractional positions considering the lattice."
-    cart_pos_a = np.dot(frac_pos_a, lattice)
-    cart_pos_b = np.dot(frac_pos_b, lattice)
-    return np.linalg.norm(cart_pos_a - cart_pos_b)
+"The positions are compared with a periodic KD-tree (scipy cKDTree): the Cartesian positions of the atoms are repeated in the 27 \
+ neighbor cells (shifts -1, 0, 1 along each lattice vector) and each query returns the minimum image distance. This works for any \
+ cell shape and the search is O(N log N) instead of comparing all the pairs of atoms."
+
+# Shifts of the 27 images
+IMAGES = np.array([(i, j, k) for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)])
+
+def periodic_distance(frac_pos_a, frac_pos_b, lattice):
+    "Minimum image distance between two fractional positions"
+    return np.linalg.norm(np.dot(np.asarray(frac_pos_b) - np.asarray(frac_pos_a) + IMAGES, lattice), axis=1).min()
+
+def build_index(frac_positions, lattice):
+    "Periodic KD-tree of the positions: (tree of the 27 images, atom index of each point of the tree)"
+    frac_positions = np.asarray(frac_positions).reshape(-1, 3)
+    images = (frac_positions[None, :, :] + IMAGES[:, None, :]).reshape(-1, 3)
+    atoms = np.tile(np.arange(len(frac_positions)), len(IMAGES))
+    return cKDTree(np.dot(images, lattice)), atoms
+
+def matched_atoms(frac_positions, index, lattice, max_distance=None):
+    "For each position, the nearest atom of the index if it is closer than max_distance (by default the tolerance), or -1"
+    tree, atoms = index
+    distances, points = tree.query(np.dot(np.asarray(frac_positions).reshape(-1, 3), lattice),
+                                   distance_upper_bound=tolerance if max_distance is None else max_distance)
+    found = np.isfinite(distances)
+    return np.where(found, atoms[np.minimum(points, len(atoms) - 1)], -1)
 
 # vacancies
-def find_vacancy(frac_pos_a, frac_pos_b, symbols_a):  
-    vacancies = []
-    for i, pos_a in enumerate(frac_pos_a):
-        found = False
-        for pos_b in frac_pos_b:
-            if cartesian_distance(pos_a, pos_b, lattice_matrix) < tolerance:
-                found = True
-                break
-        if not found:
-            vacancies.append((symbols_a[i], pos_a, i + 1))
-    return vacancies
+def find_vacancy(frac_pos_a, frac_pos_b, symbols_a, lattice_matrix, index_b=None, max_distance=None):  
+    index_b = index_b or build_index(frac_pos_b, lattice_matrix)
+    matches = matched_atoms(frac_pos_a, index_b, lattice_matrix, max_distance)
+    return [(symbols_a[i], frac_pos_a[i], int(i) + 1) for i in np.flatnonzero(matches < 0)]
 
 # substitutional
-def find_susbstitutional(frac_pos_a, frac_pos_b, symbols_a, symbols_b):  
-    susbstitutional = []
-    for i, pos_a in enumerate(frac_pos_a):
-        for j, pos_b in enumerate(frac_pos_b):
-            if cartesian_distance(pos_a, pos_b, lattice_matrix) < tolerance:
-                if symbols_a[i] != symbols_b[j]:
-                    susbstitutional.append((symbols_a[i], symbols_b[j], pos_a, i + 1, j + 1))
-                break
-    return susbstitutional
+def find_susbstitutional(frac_pos_a, frac_pos_b, symbols_a, symbols_b, lattice_matrix, index_b=None, max_distance=None):  
+    index_b = index_b or build_index(frac_pos_b, lattice_matrix)
+    matches = matched_atoms(frac_pos_a, index_b, lattice_matrix, max_distance)
+    return [(symbols_a[i], symbols_b[j], frac_pos_a[i], i + 1, int(j) + 1) for i, j in enumerate(matches)
+            if j >= 0 and symbols_a[i] != symbols_b[j]]
 
 # interstitial
-def find_interstitial(frac_pos_a, frac_pos_b, symbols_a):  
-    interstitial = []
-    for i, pos_a in enumerate(frac_pos_a):
-        found = False
-        for pos_b in frac_pos_b:
-            if cartesian_distance(pos_a, pos_b, lattice_matrix) < tolerance:
-                found = True
-                break
-        if not found:
-            interstitial.append((symbols_a[i], pos_a, i + 1))
-    return interstitial
+def find_interstitial(frac_pos_a, frac_pos_b, symbols_a, lattice_matrix, index_b=None, max_distance=None):  
+    return find_vacancy(frac_pos_a, frac_pos_b, symbols_a, lattice_matrix, index_b, max_distance)
+
+def neighbor_shells(target_frac_position, frac_positions, symbols, lattice_matrix, index=None, n_shells=1):
+    "First n_shells of neighbors of the target (minimum image), each shell is a list of (distance, symbol, position, index)"
+    tree, atoms = index or build_index(frac_positions, lattice_matrix)
+    target = np.dot(target_frac_position, lattice_matrix)
+    n_points = len(atoms)
+
+    # Ask for more neighbors until the last shell is complete
+    k = min(32 * n_shells, n_points)
+    while True:
+        distances, points = tree.query(target, k=k)
+        distances, points = np.atleast_1d(distances), np.atleast_1d(points)
+        neighbors = {}
+        for distance, point in zip(distances, points):
+            i = atoms[point]
+            if i not in neighbors and not np.array_equal(target_frac_position, frac_positions[i]):
+                neighbors[i] = distance
+
+        # Group the neighbors in shells of the same distance (within 0.001 Å)
+        shells = []
+        for i, distance in sorted(neighbors.items(), key=lambda item: (item[1], item[0])):
+            if not shells or not np.isclose(distance, shells[-1][0][0], atol=0.001):
+                shells.append([])
+            shells[-1].append((float(distance), symbols[i], frac_positions[i], int(i) + 1))
+        if k == n_points or (len(shells) > n_shells and distances[-1] > shells[n_shells - 1][0][0] + 0.01):
+            return shells[:n_shells]
+        k = min(2 * k, n_points)
 
 # find the closest neighbors to the defect 
-def find_closest_atoms(target_frac_position, frac_positions, symbols):
-    distances = []
-    for i, frac_pos in enumerate(frac_positions):
-        if not np.array_equal(target_frac_position, frac_pos):
-            distance = cartesian_distance(target_frac_position, frac_pos, lattice_matrix)
-            distances.append((distance, symbols[i], frac_pos, i + 1))
-
-    distances.sort(key=lambda x: x[0])
-
-    if distances:
-        closest_distance = distances[0][0]
-        same_distance_atoms = [atom for atom in distances if np.isclose(atom[0], closest_distance, atol=0.001)]
-        return same_distance_atoms
-    return []
-
-# Find vacancy, substitutional or interstitial defects
-vacancies = find_vacancy(frac_positions_perfect, frac_positions_defect, symbols_perfect)
-susbstitutional = find_susbstitutional(frac_positions_defect, frac_positions_perfect, symbols_defect, symbols_perfect)
-interstitial = find_interstitial(frac_positions_defect, frac_positions_perfect, symbols_defect)
-
-# Get the name of the current folder
-folder_name = os.path.basename(os.getcwd())
-
-# Create 'localized' folder
-localized_folder = f'localized-defects/{folder_name}/Data'
-if not os.path.exists(localized_folder):
-    os.makedirs(localized_folder)
-
-# Save the results in localized_{folder_name}.dat
-output_file = os.path.join(localized_folder, f'neighbor_atoms.dat')
-
-with open(output_file, "w") as file:
-    # Print vacancies
-    if vacancies:
-        for symbol, frac_position, index in vacancies:
-            print(f"\nVacancy: V_{symbol}")
-            print(f"Index in ../perfect/POSCAR: {index}")
-            print(f"Position: {frac_position}")
-
-            file.write(f"\nVacancy: V_{symbol}\n")
-            file.write(f"Index in ../perfect/POSCAR: {index}\n")
-            file.write(f"Position: {frac_position}\n")
-
-            closest_atoms = find_closest_atoms(frac_position, frac_positions_defect, symbols_defect)
-
-            print(f"\nClosest neighbors to the V_{symbol} defect in {folder_name}/POSCAR:")
-            print(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}")
-            file.write(f"\nClosest neighbors to the V_{symbol} defect in {folder_name}/POSCAR:\n")
-            file.write(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}\n")
-            for distance, neighbor_symbol, neighbor_frac_position, neighbor_index in closest_atoms:
-                frac_pos_str = ' '.join(f"{coord:.6f}" for coord in neighbor_frac_position)
-                print(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}")
-                file.write(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}\n")
-    else:
-        print(f"\nThere are no vacancy defects in the {folder_name}/POSCAR")
-        file.write(f"\nThere are no vacancy defects in the {folder_name}/POSCAR\n")
-
-    # Print substitutionals
-    if susbstitutional:
-        for new_symbol, old_symbol, frac_position, old_index, new_index in susbstitutional:
-            print("\n##################################################################")
-            print(f"\nSubstitutional: {new_symbol}_{old_symbol}")
-            print(f"Index in ../perfect/POSCAR: {new_index}")
-            print(f"Index in {folder_name}/POSCAR: {old_index}")
-            print(f"Position: {frac_position}")
-
-            file.write("\n##################################################################\n")
-            file.write(f"\nSubstitutional: {new_symbol}_{old_symbol}\n")
-            file.write(f"Index in ../perfect/POSCAR: {new_index}\n")
-            file.write(f"Index in {folder_name}/POSCAR: {old_index}\n")
-            file.write(f"Position: {frac_position}\n")
-
-            closest_atoms = find_closest_atoms(frac_position, frac_positions_defect, symbols_defect)
-
-            for missed_atom in vacancies:
-                missed_symbol, missed_position, missed_index = missed_atom
-                if cartesian_distance(frac_position, missed_position, lattice_matrix) < tolerance:
-                    closest_atoms.append((cartesian_distance(frac_position, missed_position, lattice_matrix), missed_symbol, missed_position, missed_index))
-
-            if closest_atoms:
-                closest_distance = closest_atoms[0][0]
-                same_distance_atoms = [atom for atom in closest_atoms if np.isclose(atom[0], closest_distance)]
-                same_distance_atoms.sort(key=lambda x: x[0])
-
-                print(f"\nClosest neighbors to the {new_symbol}_{old_symbol} defect in {folder_name}/POSCAR:")
-                print(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}")
-                file.write(f"\nClosest neighbors to the {new_symbol}_{old_symbol} defect in {folder_name}/POSCAR:\n")
-                file.write(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}\n")
-                for distance, neighbor_symbol, neighbor_frac_position, neighbor_index in same_distance_atoms:
+def find_closest_atoms(target_frac_position, frac_positions, symbols, lattice_matrix, index=None):
+    "Atoms at the minimum image distance of the target (first shell of neighbors, within 0.001 Å)"
+    shells = neighbor_shells(target_frac_position, frac_positions, symbols, lattice_matrix, index)
+    return shells[0] if shells else []
+
+def output_path(directory):
+    "localized-defects/<folder_name>/Data/neighbor_atoms.dat inside the defect folder"
+    folder_name = os.path.basename(os.path.abspath(directory))
+    return os.path.join(directory, 'localized-defects', folder_name, 'Data', 'neighbor_atoms.dat')
+
+def write_neighbors(directory, verbose=False):
+    "Compare directory/POSCAR with directory/../perfect/POSCAR and write neighbor_atoms.dat"
+    poscar_defect = read(os.path.join(directory, "POSCAR"))
+    poscar_perfect = read(os.path.join(directory, "..", "perfect", "POSCAR"))
+
+    # Get the lattice matrix to handle any crystal structure
+    lattice_matrix = np.array(poscar_defect.get_cell())
+
+    # Extract fractional positions and symbols
+    frac_positions_defect = poscar_defect.get_scaled_positions()
+    frac_positions_perfect = poscar_perfect.get_scaled_positions()
+    symbols_defect = poscar_defect.get_chemical_symbols()
+    symbols_perfect = poscar_perfect.get_chemical_symbols()
+
+    # Find vacancy, substitutional or interstitial defects
+    # Periodic KD-trees of both structures, built once
+    index_defect = build_index(frac_positions_defect, lattice_matrix)
+    index_perfect = build_index(frac_positions_perfect, lattice_matrix)
+
+    vacancies = find_vacancy(frac_positions_perfect, frac_positions_defect, symbols_perfect, lattice_matrix, index_defect)
+    susbstitutional = find_susbstitutional(frac_positions_defect, frac_positions_perfect, symbols_defect, symbols_perfect, lattice_matrix, index_perfect)
+    interstitial = find_interstitial(frac_positions_defect, frac_positions_perfect, symbols_defect, lattice_matrix, index_perfect)
+
+    # Save the results in localized-defects/{folder_name}/Data/neighbor_atoms.dat
+    folder_name = os.path.basename(os.path.abspath(directory))
+    output_file = output_path(directory)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    with open(output_file, "w") as file:
+        def report(text):
+            "Write a line in neighbor_atoms.dat and also print it"
+            file.write(f"{text}\n")
+            if verbose:
+                print(text)
+
+        # Print vacancies
+        if vacancies:
+            for symbol, frac_position, index in vacancies:
+                report(f"\nVacancy: V_{symbol}")
+                report(f"Index in ../perfect/POSCAR: {index}")
+                report(f"Position: {frac_position}")
+
+                closest_atoms = find_closest_atoms(frac_position, frac_positions_defect, symbols_defect, lattice_matrix, index_defect)
+
+                report(f"\nClosest neighbors to the V_{symbol} defect in {folder_name}/POSCAR:")
+                report(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}")
+                for distance, neighbor_symbol, neighbor_frac_position, neighbor_index in closest_atoms:
                     frac_pos_str = ' '.join(f"{coord:.6f}" for coord in neighbor_frac_position)
-                    print(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}")
-                    file.write(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}\n")
+                    report(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}")
+        else:
+            report(f"\nThere are no vacancy defects in the {folder_name}/POSCAR")
+
+        # Print substitutionals
+        if susbstitutional:
+            for new_symbol, old_symbol, frac_position, old_index, new_index in susbstitutional:
+                report("\n##################################################################")
+                report(f"\nSubstitutional: {new_symbol}_{old_symbol}")
+                report(f"Index in ../perfect/POSCAR: {new_index}")
+                report(f"Index in {folder_name}/POSCAR: {old_index}")
+                report(f"Position: {frac_position}")
+
+                closest_atoms = find_closest_atoms(frac_position, frac_positions_defect, symbols_defect, lattice_matrix, index_defect)
+
+                for missed_atom in vacancies:
+                    missed_symbol, missed_position, missed_index = missed_atom
+                    if periodic_distance(frac_position, missed_position, lattice_matrix) < tolerance:
+                        closest_atoms.append((periodic_distance(frac_position, missed_position, lattice_matrix), missed_symbol, missed_position, missed_index))
+
+                if closest_atoms:
+                    closest_distance = closest_atoms[0][0]
+                    same_distance_atoms = [atom for atom in closest_atoms if np.isclose(atom[0], closest_distance)]
+                    same_distance_atoms.sort(key=lambda x: x[0])
+
+                    report(f"\nClosest neighbors to the {new_symbol}_{old_symbol} defect in {folder_name}/POSCAR:")
+                    report(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}")
+                    for distance, neighbor_symbol, neighbor_frac_position, neighbor_index in same_distance_atoms:
+                        frac_pos_str = ' '.join(f"{coord:.6f}" for coord in neighbor_frac_position)
+                        report(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}")
+        else:
+            report("\n##################################################################")
+            report(f"\nThere are no substitutional defects in the {folder_name}/POSCAR")
+
+        # Print interstitials
+        if interstitial:
+            for symbol, frac_position, index in interstitial:
+                report("\n##################################################################")
+                report(f"Interstitial: {symbol}_i")
+                report(f"Index in {folder_name}/POSCAR: {index}")
+                report(f"Position: {frac_position}")
+
+                closest_atoms = find_closest_atoms(frac_position, frac_positions_defect, symbols_defect, lattice_matrix, index_defect)
+
+                report(f"\nClosest neighbors to the {symbol}_i defect in {folder_name}/POSCAR:")
+                report(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}")
+                for distance, neighbor_symbol, neighbor_frac_position, neighbor_index in closest_atoms:
+                    frac_pos_str = ' '.join(f"{coord:.6f}" for coord in neighbor_frac_position)
+                    report(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}")
+        else:
+            report("\n##################################################################")
+            report(f"\nThere are no interstitial defects in the {folder_name}/POSCAR")
+
+    if verbose:
+        print("\nDefect information was saved in neighbor_atoms.dat.")
+    return output_file
+
+
+def has_perfect(directory):
+    "The defect folders are next to the perfect folder"
+    return os.path.exists(os.path.join(directory, "..", "perfect", "POSCAR"))
+
+"Library mode (--library ROOT): the perfect supercell (positions and periodic KD-tree) is read only once and sent to each process \
+ of the pool, then the POSCAR (before relaxation) and CONTCAR (after relaxation) of every defect folder under ROOT are classified \
+ and all the defects are saved in one table: ROOT/defect_library.csv and ROOT/defect_library.json, with one row per defect: \
+       ----> folder, structure (POSCAR/CONTCAR), type (vacancy, substitutional, interstitial or none), defect (e.g. V_B, C_N, B_i) \
+       ----> site (index in ../perfect/POSCAR, or in the structure for the interstitials), species and position \
+       ----> distance and atoms of the first --shells shells of neighbors \
+ In the CONTCAR the atoms have moved, so its positions are compared with --relaxed-tolerance instead of the tolerance."
+
+LIBRARY = 'defect_library'
+
+# Maximum distance (Å) between a relaxed atom and its site in the perfect supercell
+relaxed_tolerance = 0.5
+
+# Perfect supercells of the library mode, by real path of the perfect folder
+PERFECTS = {}
+
+def load_perfect(perfect_dir):
+    "Positions, symbols, lattice and periodic KD-tree of perfect_dir/POSCAR"
+    poscar = read(os.path.join(perfect_dir, "POSCAR"))
+    lattice_matrix = np.array(poscar.get_cell())
+    frac_positions = poscar.get_scaled_positions()
+    return {'frac_positions': frac_positions, 'symbols': poscar.get_chemical_symbols(),
+            'lattice': lattice_matrix, 'index': build_index(frac_positions, lattice_matrix)}
+
+def init_library(perfects):
+    "Initializer of the pool: the perfect supercells are received once by each process"
+    PERFECTS.update(perfects)
+
+def perfect_of(directory):
+    "Perfect supercell next to the defect folder"
+    perfect_dir = os.path.realpath(os.path.join(directory, "..", "perfect"))
+    if perfect_dir not in PERFECTS:
+        PERFECTS[perfect_dir] = load_perfect(perfect_dir)
+    return PERFECTS[perfect_dir]
+
+def shell_fields(shells, n_shells):
+    "Distance and atoms (symbol + index) of each shell of neighbors"
+    fields = {}
+    for n in range(n_shells):
+        shell = shells[n] if n < len(shells) else []
+        fields[f"shell_{n + 1}_distance"] = round(shell[0][0], 4) if shell else None
+        fields[f"shell_{n + 1}_atoms"] = ' '.join(f"{symbol}{index}" for _, symbol, _, index in shell)
+    return fields
+
+def find_defects(frac_positions, symbols, lattice_matrix, index, perfect, max_distance=None):
+    "Defects of a structure compared with the perfect supercell: (type, defect, site, species, position) of each one"
+    vacancies = find_vacancy(perfect['frac_positions'], frac_positions, perfect['symbols'], lattice_matrix, index, max_distance)
+    susbstitutional = find_susbstitutional(frac_positions, perfect['frac_positions'], symbols, perfect['symbols'],
+                                           perfect['lattice'], perfect['index'], max_distance)
+    interstitial = find_interstitial(frac_positions, perfect['frac_positions'], symbols, perfect['lattice'], perfect['index'], max_distance)
+
+    found = [('vacancy', f"V_{symbol}", site, symbol, position) for symbol, position, site in vacancies]
+    found += [('substitutional', f"{new_symbol}_{old_symbol}", site, new_symbol, position)
+              for new_symbol, old_symbol, position, _, site in susbstitutional]
+    found += [('interstitial', f"{symbol}_i", site, symbol, position) for symbol, position, site in interstitial]
+    return found
+
+def classify_structure(structure, perfect, n_shells=2, max_distance=None):
+    "Defects of the structure (ase Atoms) compared with the perfect supercell, one dictionary per defect"
+    lattice_matrix = np.array(structure.get_cell())
+    frac_positions = structure.get_scaled_positions()
+    symbols = structure.get_chemical_symbols()
+    index = build_index(frac_positions, lattice_matrix)
+
+    rows = []
+    for defect_type, defect, site, species, position in find_defects(frac_positions, symbols, lattice_matrix, index, perfect, max_distance):
+        shells = neighbor_shells(position, frac_positions, symbols, lattice_matrix, index, n_shells)
+        row = {'type': defect_type, 'defect': defect, 'site': int(site), 'species': species,
+               'position': ' '.join(f"{coord:.6f}" for coord in position)}
+        row.update(shell_fields(shells, n_shells))
+        rows.append(row)
+    return rows
+
+def classify_folder(directory, n_shells=2, relaxed_distance=relaxed_tolerance):
+    "Defects of directory/POSCAR and directory/CONTCAR (if the relaxation has started), one dictionary per defect"
+    perfect = perfect_of(directory)
+    rows = []
+    for structure, distance in (("POSCAR", tolerance), ("CONTCAR", relaxed_distance)):
+        file_path = os.path.join(directory, structure)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            continue
+        defects = classify_structure(read(file_path), perfect, n_shells, distance)
+        if not defects:
+            defects = [{'type': 'none', 'defect': '', 'site': None, 'species': '', 'position': '', **shell_fields([], n_shells)}]
+        rows += [{'folder': directory, 'structure': structure, **row} for row in defects]
+    return rows
+
+def write_library(root, dirs, n_shells=2, relaxed_distance=relaxed_tolerance, workers=None):
+    "Classify all the folders with a process pool and write ROOT/defect_library.csv and ROOT/defect_library.json"
+    perfects = {}
+    for directory in dirs:
+        perfect_dir = os.path.realpath(os.path.join(directory, "..", "perfect"))
+        if perfect_dir not in perfects:
+            perfects[perfect_dir] = load_perfect(perfect_dir)
+
+    print(f"{len(dirs)} folders found, {len(perfects)} perfect supercells")
+    task = partial(classify_folder, n_shells=n_shells, relaxed_distance=relaxed_distance)
+    if len(dirs) > 1:
+        with Pool(min(workers or os.cpu_count(), len(dirs)), initializer=init_library, initargs=(perfects,)) as pool:
+            results = pool.map(partial(run_task, task), dirs)
+    else:
+        init_library(perfects)
+        results = [run_task(task, directory) for directory in dirs]
+
+    rows = []
+    for directory, status, info in results:
+        if status == 'failed':
+            print(f"{status:<8} {directory} ({info})")
+            continue
+        for row in info:
+            row['folder'] = os.path.relpath(row['folder'], root)
+            rows.append(row)
+
+    fields = ['folder', 'structure', 'type', 'defect', 'site', 'species', 'position']
+    fields += [f"shell_{n + 1}_{name}" for n in range(n_shells) for name in ('distance', 'atoms')]
+    with open(os.path.join(root, f"{LIBRARY}.csv"), 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    with open(os.path.join(root, f"{LIBRARY}.json"), 'w') as file:
+        json.dump(rows, file, indent=1)
+    print(f"{len(rows)} rows were saved in {os.path.join(root, LIBRARY)}.csv and .json")
+    return rows
+
+"Displacement mode (--displacements): the displacement of every atom between POSCAR and CONTCAR is taken as the minimum image of \
+ the difference of fractional positions (27 images checked at once for all the atoms, in one array operation) and is binned by the \
+ distance from the defect site (found with ../perfect/POSCAR, or given with --center). The relaxation has to die off before the \
+ radius of the largest sphere inside the supercell (half the smallest distance between lattice planes), otherwise the defect \
+ interacts with its periodic images and a larger supercell is needed. The results are saved in: \
+       ----> localized-defects/<folder_name>/Data/displacements.dat    ----> mean and maximum displacement in each radial bin \
+       ----> localized-defects/<folder_name>/Figures/displacements.png ----> displacement of each atom versus distance"
+
+# Width of the radial bins (Å) and displacement (Å) considered as relaxed
+bin_width = 0.5
+threshold = 0.01
+
+def minimum_image(frac_vectors, lattice_matrix):
+    "Shortest Cartesian vectors equivalent to the fractional vectors (N, 3), checking the 27 images of all the vectors at once"
+    frac_vectors = np.asarray(frac_vectors).reshape(-1, 3)
+    frac_vectors = frac_vectors - np.round(frac_vectors)
+    images = np.dot(frac_vectors[:, None, :] + IMAGES[None, :, :], lattice_matrix)
+    nearest = np.einsum('nij,nij->ni', images, images).argmin(axis=1)
+    return images[np.arange(len(images)), nearest]
+
+def inscribed_radius(lattice_matrix):
+    "Radius of the largest sphere inside the cell: half the smallest distance between lattice planes"
+    return 0.5 / np.linalg.norm(np.linalg.inv(lattice_matrix), axis=0).max()
+
+def displacement_field(frac_initial, frac_final, lattice_matrix, center):
+    "Distance of each atom from the center (before relaxation) and its displacement vector (Å)"
+    displacements = minimum_image(np.asarray(frac_final) - np.asarray(frac_initial), lattice_matrix)
+    distances = np.linalg.norm(minimum_image(np.asarray(frac_initial) - center, lattice_matrix), axis=1)
+    return distances, displacements
+
+def radial_bins(distances, norms, width=bin_width):
+    "Number of atoms, mean and maximum displacement in each radial bin: (start of the bins, counts, mean, maximum), empty bins removed"
+    bins = (distances / width).astype(int)
+    n_bins = bins.max() + 1
+    counts = np.bincount(bins, minlength=n_bins)
+    mean = np.bincount(bins, weights=norms, minlength=n_bins) / np.maximum(counts, 1)
+    maximum = np.zeros(n_bins)
+    np.maximum.at(maximum, bins, norms)
+    found = counts > 0
+    return np.arange(n_bins)[found] * width, counts[found], mean[found], maximum[found]
+
+def decay_radius(distances, norms, limit=threshold):
+    "Distance of the farthest atom displaced more than the limit"
+    moved = norms > limit
+    return distances[moved].max() if moved.any() else 0.0
+
+def displacements_paths(directory):
+    "localized-defects/<folder_name>/Data/displacements.dat and Figures/displacements.png inside the defect folder"
+    folder = os.path.join(directory, 'localized-defects', os.path.basename(os.path.abspath(directory)))
+    return os.path.join(folder, 'Data', 'displacements.dat'), os.path.join(folder, 'Figures', 'displacements.png')
+
+def write_displacements(directory, width=bin_width, limit=threshold, center=None, verbose=False):
+    "Displacements from directory/POSCAR to directory/CONTCAR around the defect, saved in displacements.dat and displacements.png"
+    poscar = read(os.path.join(directory, "POSCAR"))
+    contcar = read(os.path.join(directory, "CONTCAR"))
+    if len(poscar) != len(contcar):
+        raise ValueError(f"POSCAR has {len(poscar)} atoms and CONTCAR has {len(contcar)} atoms")
+
+    lattice_matrix = np.array(poscar.get_cell())
+    frac_initial = poscar.get_scaled_positions()
+    symbols = poscar.get_chemical_symbols()
+
+    # Defect site: first defect of the POSCAR compared with ../perfect/POSCAR
+    if center is None:
+        defects = find_defects(frac_initial, symbols, lattice_matrix, build_index(frac_initial, lattice_matrix), perfect_of(directory))
+        if not defects:
+            raise ValueError(f"No defects found in {directory}/POSCAR, use --center")
+        _, name, _, _, center = defects[0]
     else:
-        print("\n##################################################################")
-        print(f"\nThere are no substitutional defects in the {folder_name}/POSCAR")
-        file.write("\n##################################################################\n")
-        file.write(f"\nThere are no substitutional defects in the {folder_name}/POSCAR\n")
-
-    # Print interstitials
-    if interstitial:
-        for symbol, frac_position, index in interstitial:
-            print("\n##################################################################")
-            print(f"Interstitial: {symbol}_i")
-            print(f"Index in {folder_name}/POSCAR: {index}")
-            print(f"Position: {frac_position}")
-
-            file.write("\n##################################################################\n")
-            file.write(f"Interstitial: {symbol}_i\n")
-            file.write(f"Index in {folder_name}/POSCAR: {index}\n")
-            file.write(f"Position: {frac_position}\n")
-
-            closest_atoms = find_closest_atoms(frac_position, frac_positions_defect, symbols_defect)
-
-            print(f"\nClosest neighbors to the {symbol}_i defect in {folder_name}/POSCAR:")
-            print(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}")
-            file.write(f"\nClosest neighbors to the {symbol}_i defect in {folder_name}/POSCAR:\n")
-            file.write(f"{'Index':<10} {'Atom':<10} {'Position':<30} {'Distance (A)':<10}\n")
-            for distance, neighbor_symbol, neighbor_frac_position, neighbor_index in closest_atoms:
-                frac_pos_str = ' '.join(f"{coord:.6f}" for coord in neighbor_frac_position)
-                print(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}")
-                file.write(f"{neighbor_index:<10} {neighbor_symbol:<10} {frac_pos_str:<30} {distance:<10.4f}\n")
+        name = 'center'
+    center = np.asarray(center, dtype=float)
+
+    distances, displacements = displacement_field(frac_initial, contcar.get_scaled_positions(), lattice_matrix, center)
+    norms = np.linalg.norm(displacements, axis=1)
+    starts, counts, mean, maximum = radial_bins(distances, norms, width)
+    radius = decay_radius(distances, norms, limit)
+    sphere = inscribed_radius(lattice_matrix)
+    largest = norms.argmax()
+
+    data_file, figure_file = displacements_paths(directory)
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    os.makedirs(os.path.dirname(figure_file), exist_ok=True)
+
+    summary = [f"Defect: {name} at {' '.join(f'{coord:.6f}' for coord in center)}",
+               f"Largest displacement: {norms[largest]:.4f} A ({symbols[largest]}{largest + 1}, at {distances[largest]:.4f} A)",
+               f"Displacements > {limit} A up to: {radius:.4f} A",
+               f"Radius of the largest sphere inside the supercell: {sphere:.4f} A"]
+    if radius >= sphere:
+        summary.append("The displacements do not die off inside the supercell, a larger supercell is needed")
+
+    with open(data_file, 'w') as file:
+        file.write('\n'.join(summary) + '\n\n')
+        file.write(f"{'r_min (A)':<12} {'r_max (A)':<12} {'Atoms':<8} {'Mean (A)':<12} {'Max (A)':<12}\n")
+        for start, count, mean_norm, max_norm in zip(starts, counts, mean, maximum):
+            file.write(f"{start:<12.4f} {start + width:<12.4f} {count:<8} {mean_norm:<12.6f} {max_norm:<12.6f}\n")
+
+    plt.figure(figsize=(10, 6))
+    plt.scatter(distances, norms, s=8, color='gray', alpha=0.5, label='Atoms')
+    plt.plot(starts + width / 2, mean, 'o-', color='blue', label='Mean in each bin')
+    plt.axvline(sphere, color='red', linestyle='--', label='Largest sphere inside the supercell')
+    plt.axhline(limit, color='green', linestyle=':', label=f'{limit} A')
+    plt.xlabel('Distance from the defect (A)', fontsize=14)
+    plt.ylabel('Displacement (A)', fontsize=14)
+    plt.title(f'{name} - {os.path.basename(os.path.abspath(directory))}')
+    plt.legend()
+    plt.savefig(figure_file, bbox_inches='tight', dpi=150)
+    plt.close()
+
+    if verbose:
+        print('\n'.join(summary))
+        print(f"\nThe displacements were saved in {data_file} and {figure_file}")
+    return data_file
+
+def main():
+    parser = argparse.ArgumentParser(description="Find vacancy, substitutional or interstitial defects by comparing ../perfect/POSCAR with POSCAR.")
+    add_batch_arguments(parser)
+    parser.add_argument('--library', nargs='?', const='.', default=None, metavar='ROOT', help=f"Classify the POSCAR and CONTCAR of every defect folder under ROOT and save {LIBRARY}.csv/.json")
+    parser.add_argument('--shells', type=int, default=2, help="Number of shells of neighbors in the library mode (default: 2)")
+    parser.add_argument('--relaxed-tolerance', type=float, default=relaxed_tolerance, help=f"Maximum displacement (A) of a relaxed atom from its perfect site in the CONTCAR (default: {relaxed_tolerance})")
+    parser.add_argument('--displacements', action='store_true', help="Displacements of the atoms from POSCAR to CONTCAR, binned by the distance from the defect")
+    parser.add_argument('--bin', type=float, default=bin_width, help=f"Width (A) of the radial bins of the displacement mode (default: {bin_width})")
+    parser.add_argument('--threshold', type=float, default=threshold, help=f"Displacement (A) considered as relaxed in the displacement mode (default: {threshold})")
+    parser.add_argument('--center', type=float, nargs=3, default=None, metavar=('X', 'Y', 'Z'), help="Fractional position of the defect site in the displacement mode (default: found with ../perfect/POSCAR)")
+    args = parser.parse_args()
+
+    if args.displacements:
+        task = partial(write_displacements, width=args.bin, limit=args.threshold, center=args.center)
+        if args.dirs is None:
+            task('.', verbose=True)
+        else:
+            dirs = discover_dirs(args.dirs, ['POSCAR', 'CONTCAR'], check=has_perfect)
+            run_batch(task, dirs, inputs=lambda d: [os.path.join(d, "POSCAR"), os.path.join(d, "CONTCAR"), os.path.join(d, "..", "perfect", "POSCAR")],
+                      outputs=lambda d: list(displacements_paths(d)), workers=args.workers, force=args.force, root=args.dirs, name='displacements',
+                      options=lambda d: {'bin': args.bin, 'threshold': args.threshold, 'center': args.center})
+    elif args.library is not None:
+        dirs = discover_dirs(args.library, ['POSCAR'], check=has_perfect)
+        write_library(args.library, dirs, args.shells, args.relaxed_tolerance, args.workers)
+    elif args.dirs is None:
+        write_neighbors('.', verbose=True)
     else:
-        print("\n##################################################################")
-        print(f"\nThere are no interstitial defects in the {folder_name}/POSCAR")
-        file.write("\n##################################################################\n")
-        file.write(f"\nThere are no interstitial defects in the {folder_name}/POSCAR\n")
+        dirs = discover_dirs(args.dirs, ['POSCAR'], check=has_perfect)
+        run_batch(write_neighbors, dirs, inputs=lambda d: [os.path.join(d, "POSCAR"), os.path.join(d, "..", "perfect", "POSCAR")],
+                  outputs=lambda d: [output_path(d)], workers=args.workers, force=args.force, root=args.dirs, name='defects')
 
-print("\nDefect information was saved in neighbor_atoms.dat.")
+if __name__ == '__main__':
+    main()
@@ -3,29 +3,29 @@
 # 2024-11
 
 "Code for search information about the dielectric tensor"
+"The rows are printed as in the <v> lines of vasprun.xml (VASP writes each value with a space and %16.8f)"
 
-import xml.etree.ElementTree as ET
+from vasprun_reader import load_vasprun
 
 file_path = 'vasprun.xml'
 
-tree = ET.parse(file_path)
-root = tree.getroot()
+data = load_vasprun(file_path)
 
-epsilon_ion = root.find(".//varray[@name='epsilon_ion']") # keyword to ionic tensor <varray name="epsilon_ion" >
+epsilon_ion = data.get('epsilon_ion') # keyword to ionic tensor <varray name="epsilon_ion" >
 
 if epsilon_ion is not None:
     print("Ionic dielectric tensor:")
-    for vector in epsilon_ion.findall("v"):
-        print(vector.text)
+    for vector in epsilon_ion:
+        print(''.join(f" {value:16.8f}" for value in vector) + ' ')
 else:
     print("The ionic dielectric tensor was not found in the vasprun.xml file.")
 
 
-epsilon = root.find(".//varray[@name='epsilon']") # keyword to electronic tensor <varray name="epsilon" >
+epsilon = data.get('epsilon') # keyword to electronic tensor <varray name="epsilon" >
 
 if epsilon is not None:
     print("\nElectronic dielectric tensor:")
-    for vector in epsilon.findall("v"):
-        print(vector.text)
+    for vector in epsilon:
+        print(''.join(f" {value:16.8f}" for value in vector) + ' ')
 else:
     print("The electronic dielectric tensor was not found in the vasprun.xml file.")
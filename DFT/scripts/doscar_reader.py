@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import re
+import mmap
+import warnings
+import numpy as np
+from sidecar import load_sidecar
+
+"DOSCAR reader used by dospo.py"
+"The file is memory-mapped and all the numbers after the header are converted in one call (np.fromstring), then the total DOS and \
+ the projected DOS of every atom are stored in a single array: \
+       ----> dos[0, :, :]         ----> total DOS (energy, DOS, integrated DOS), 3 columns for ISPIN=1 and 5 for ISPIN=2 \
+                                       (the other columns are NaN) \
+       ----> dos[atom, :, :]      ----> projected DOS of the atom (energy, s, p_y, p_z, p_x, ...), as in the DOSCAR \
+       ----> dos[atoms].sum(0)    ----> sum over a group of atoms without reading the file again"
+"The arrays are cached in DOSCAR.cache/ (see sidecar.py), so the next runs only memory-map them"
+"Usage: ----> data = load_doscar('DOSCAR') \
+        ----> data['dos'], data['efermi'], data['nedos']"
+
+VERSION = 1
+
+# Numbers written without the E by old VASP versions, e.g. 0.1234-100
+MISSING_EXPONENT = re.compile(rb'(\d)([-+]\d{3})')
+
+
+def parse_numbers(text):
+    "All the numbers of a text block as a flat array"
+    with warnings.catch_warnings():
+        # Unmatched data is only a warning in NumPy, make it an error to try again with the exponents fixed
+        warnings.simplefilter('error', DeprecationWarning)
+        try:
+            return np.fromstring(text, sep=' ')
+        except (ValueError, DeprecationWarning):
+            return np.fromstring(MISSING_EXPONENT.sub(rb'\1E\2', text), sep=' ')
+
+
+def read_doscar(file_path='DOSCAR'):
+    "Parse the DOSCAR file into dos[n_atoms + 1, NEDOS, n_columns]"
+    with open(file_path, 'rb') as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as doscar:
+            header = [doscar.readline() for _ in range(5)]
+            n_atoms = int(header[0].split()[0])
+            energy_line = doscar.readline()
+            emax, emin, nedos, efermi = energy_line.split()[:4]
+            nedos = int(nedos)
+            total_columns = len(doscar.readline().split())
+            doscar.seek(0)
+            data_start = sum(len(line) for line in header) + len(energy_line)
+            numbers = parse_numbers(doscar[data_start:])
+
+    # Each projected block: the energy line (5 numbers) and NEDOS rows
+    n_total = nedos * total_columns
+    n_blocks = n_atoms if numbers.size > n_total else 0
+    block_size = (numbers.size - n_total) // n_atoms if n_blocks else 5
+    columns = (block_size - 5) // nedos if n_blocks else total_columns
+    if n_total + n_blocks * (5 + nedos * columns) != numbers.size:
+        raise ValueError(f"{file_path}: {numbers.size} values, expected {nedos} rows for the total DOS and {n_atoms} atoms")
+
+    dos = np.full((n_blocks + 1, nedos, max(columns, total_columns)), np.nan)
+    dos[0, :, :total_columns] = numbers[:n_total].reshape(nedos, total_columns)
+    if n_blocks:
+        projected = numbers[n_total:].reshape(n_blocks, block_size)[:, 5:]
+        dos[1:, :, :columns] = projected.reshape(n_blocks, nedos, columns)
+
+    return {'dos': dos,
+            'nedos': np.array(nedos),
+            'efermi': np.array(float(efermi)),
+            'total_columns': np.array(total_columns)}
+
+
+def load_doscar(file_path='DOSCAR', rebuild=False):
+    "read_doscar with the binary sidecar"
+    return load_sidecar(file_path, read_doscar, version=VERSION, rebuild=rebuild)
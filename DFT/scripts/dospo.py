@@ -10,34 +10,98 @@
           dos.py 1 --tot --all                     # plot the total DOS and s,p,d-orbitals for the atom 1 \
           dos.py --tot                             # plot the total DOS \
           dos.py 1 --s --x -10 20 --y 0 10         # introduce the y range \
-          dos.py 1 --tot --all --x -10 20 --y 0 10 # introduce the x range"  
+          dos.py 1 --tot --all --x -10 20 --y 0 10 # introduce the x range \
+          dos.py --atoms 1-64,130 --all            # plot the s,p,d-orbitals summed over the atoms 1 to 64 and 130 \
+          dos.py --element B --tot --all           # plot the total DOS and s,p,d-orbitals summed over all the B atoms"  
+"The DOSCAR is read once into dos[atom, energy, column] (atom 0 is the total DOS) and cached in DOSCAR.cache/ (see doscar_reader.py)"
+"The projected DOS of a group of atoms is the sum dos[atoms].sum(0), the species of --element are read from the POSCAR or the OUTCAR. \
+ Together with each LDOS figure, the s, p, d columns are written in a .dat table with the same name"
 
 import numpy as np
 import matplotlib.pyplot as plt
-import re
 import sys
+from doscar_reader import load_doscar
+from outcar_index import scan_outcar, first, last, values
 
-def get_value_from_outcar(key, outcar_file="OUTCAR"):
-    "Extract specific values (NEDOS, ISPIN and E-fermi) from the OUTCAR file"
-    patterns = {
-        "NEDOS": r'number of dos\s+NEDOS\s*=\s*(\d+)',
-        "ISPIN": r'ISPIN\s*=\s*(\d+)',
-        "E-fermi": r'E-fermi\s*:\s*([-\d.]+)'
-    }
-    pattern = patterns.get(key)
-    if not pattern:
-        return None
-
-    with open(outcar_file, 'r') as file:
-        for line in file:
-            match = re.search(pattern, line)
-            if match:
-                return int(match.group(1)) if key in ["NEDOS", "ISPIN"] else float(match.group(1))
-    return None
-
-NEDOS = get_value_from_outcar("NEDOS")
-ISPIN = get_value_from_outcar("ISPIN")
-fermi_energy = get_value_from_outcar("E-fermi")
+# NEDOS, ISPIN and E-fermi (of the final ionic step) from the OUTCAR file, in one scan (see outcar_index.py)
+outcar = scan_outcar("OUTCAR", ["NEDOS", "ISPIN", "E-fermi", "VRHFIN", "ions per type"])
+NEDOS = first(outcar, "NEDOS")
+ISPIN = first(outcar, "ISPIN")
+fermi_energy = last(outcar, "E-fermi")
+
+# dos[0]: total DOS, dos[atom_number]: projected DOS of the atom
+dos = load_doscar("DOSCAR")['dos']
+
+# Columns of each orbital in the projected DOS (spin up, spin down)
+ORBITAL_COLUMNS = {1: {'s': ([1], None), 'p': ([2, 3, 4], None), 'd': ([5, 6, 7, 8, 9], None)},
+                   2: {'s': ([1], [2]), 'p': ([3, 5, 7], [4, 6, 8]), 'd': ([9, 11, 13, 15, 17], [10, 12, 14, 16, 18])}}
+
+def group_dos(atoms):
+    "Columns of the projected DOS summed over the atoms (data[0]: energy, data[1:]: orbitals), as np.loadtxt(..., unpack=True)"
+    block = dos[atoms, :NEDOS].sum(axis=0)
+    block[:, 0] = dos[atoms[0], :NEDOS, 0]
+    return block[:, ~np.isnan(block[0])].T
+
+def read_species(poscar_file="POSCAR", outcar_file="OUTCAR"):
+    "Chemical symbol of each atom, from the POSCAR (VASP 5 format) or from the OUTCAR (VRHFIN and ions per type)"
+    try:
+        with open(poscar_file, 'r') as file:
+            lines = [file.readline() for _ in range(7)]
+        symbols = [symbol.split('/')[0].split('_')[0] for symbol in lines[5].split()]
+        if symbols and all(symbol.isalpha() for symbol in symbols):
+            counts = [int(count) for count in lines[6].split()]
+            return [symbol for symbol, count in zip(symbols, counts) for _ in range(count)]
+    except (OSError, ValueError, IndexError):
+        pass
+
+    index = outcar if outcar_file == "OUTCAR" else scan_outcar(outcar_file, ["VRHFIN", "ions per type"])
+    symbols = values(index, "VRHFIN")
+    counts = first(index, "ions per type", [])
+    return [symbol for symbol, count in zip(symbols, counts) for _ in range(count)]
+
+def parse_atoms(text):
+    "Atom numbers from a selection like 1-64,130"
+    atoms = []
+    for part in text.split(','):
+        start, _, end = part.partition('-')
+        atoms.extend(range(int(start), int(end or start) + 1))
+    return atoms
+
+def select_atoms(argv):
+    "Atom numbers and name of the selection (atom_number, --atoms and/or --element)"
+    atoms, names = [], []
+    for i, arg in enumerate(argv):
+        if arg == '--atoms' and i + 1 < len(argv):
+            atoms.extend(parse_atoms(argv[i + 1]))
+            names.append(f"atoms_{argv[i + 1].replace(',', '_')}")
+        elif arg == '--element' and i + 1 < len(argv):
+            species = read_species()
+            atoms.extend(index + 1 for index, symbol in enumerate(species) if symbol == argv[i + 1])
+            names.append(f"element_{argv[i + 1]}")
+    if not names:
+        if len(argv) > 1 and argv[1].isdigit():
+            return [int(argv[1])], f"atom_{argv[1]}"
+        return None, None
+
+    atoms = sorted(set(atoms))
+    if not atoms or atoms[0] < 1 or atoms[-1] > dos.shape[0] - 1:
+        print(f"Error: the selection {' '.join(names)} has no atoms or atoms out of the range 1-{dos.shape[0] - 1}")
+        sys.exit(1)
+    return atoms, '-'.join(names)
+
+def write_dos_table(filename, data):
+    "Energy and s, p, d projected DOS of the selection (spin down with negative sign)"
+    columns = [data[0] - fermi_energy]
+    header = ['Energy']
+    for orbital, (up, down) in ORBITAL_COLUMNS[ISPIN].items():
+        if max(up + (down or [])) >= len(data):
+            continue
+        columns.append(data[up].sum(axis=0))
+        header.append(f"{orbital}_up" if down else orbital)
+        if down:
+            columns.append(-data[down].sum(axis=0))
+            header.append(f"{orbital}_down")
+    np.savetxt(filename, np.column_stack(columns), fmt='%14.6f', header=' '.join(f"{name:>14}" for name in header)[2:])
 
 # Parse additional axis range arguments
 x_min, x_max = None, None
@@ -52,14 +116,14 @@ def plot_dos_total():
     "Plot total DOS"
     fig, ax = plt.subplots(figsize=(12, 8))
     if ISPIN == 1:
-        dos_data = np.loadtxt("DOSCAR", unpack=True, usecols=(0, 1), skiprows=6, max_rows=NEDOS)
+        dos_data = dos[0, :NEDOS, [0, 1]]
         energies = dos_data[0] - fermi_energy  
         spin_up = dos_data[1]          
         ax.plot(energies, spin_up, linestyle='-', color='r', label='Total DOS')   
         ax.fill_between(energies, spin_up, alpha=0.1, color='r') # Fill between the curve and the x-axis
         
     elif ISPIN == 2:
-        dos_data = np.loadtxt("DOSCAR", unpack=True, usecols=(0, 1, 2), skiprows=6, max_rows=NEDOS)
+        dos_data = dos[0, :NEDOS, [0, 1, 2]]
         energies = dos_data[0] - fermi_energy
         spin_up = dos_data[1]
         spin_down = dos_data[2] * -1
@@ -83,15 +147,14 @@ def plot_dos_total():
     plt.savefig("total_dos.png", dpi=300, bbox_inches='tight')  
     plt.show()
 
-def plot_dos_for_atom(atom_number, orbital_types=None):
-    "Plot DOS for a specific atom and orbitals"
+def plot_dos_for_atom(atoms, name, orbital_types=None):
+    "Plot DOS for a specific atom (or the sum over a group of atoms) and orbitals"
     "data[1]: s-orbital (spin up), data[2]: s-orbital (spin down) \
     data[3]: p_x-orbital (spin up), data[5]: p_y-orbital (spin up), data[7]: p_z-orbital (spin up), \
     data[4]: p_x-orbital (spin down), data[6]: p_y-orbital (spin down), data[8]: p_z-orbital (spin down), \
     data[9]: d_xy-orbital (spin up), data[11]: d_yz-orbital (spin up), data[13]: d_xz-orbital (spin up), data[15]: d_{x²-y²}-orbital (spin up), data[17]: d_z²-orbital (spin up), \
     data[10]: d_xy-orbital (spin down), data[12]: d_yz-orbital (spin down), data[14]: d_xz-orbital (spin down), data[16]: d_{x²-y²}-orbital (spin dow), data[18]: d_z²-orbital (spin down)"    
-    start_line = NEDOS + 8 + (atom_number - 1) * (NEDOS + 1)
-    data = np.loadtxt("DOSCAR", unpack=True, skiprows=start_line - 1, max_rows=NEDOS)
+    data = group_dos(atoms)
 
     energies = data[0] - fermi_energy
     
@@ -152,24 +215,26 @@ def plot_dos_for_atom(atom_number, orbital_types=None):
         ax.set_ylim(y_min, y_max)
               
     if '--s' in sys.argv or '--p' in sys.argv or '--d' in sys.argv:
-        plt.savefig(f"atom_{atom_number}-{orbital_types}_orbital-LDOS.png", dpi=200, bbox_inches='tight')
+        figure_name = f"{name}-{orbital_types}_orbital-LDOS"
     else:
-        plt.savefig(f"atom_{atom_number}-LDOS.png", dpi=200, bbox_inches='tight')
+        figure_name = f"{name}-LDOS"
+    plt.savefig(f"{figure_name}.png", dpi=200, bbox_inches='tight')
+    write_dos_table(f"{figure_name}.dat", data)
     plt.show()
 
-def plot_dos_combined(atom_number, orbital_types=None):
-    "Plot total DOS and orbitals for a specific atom."
+def plot_dos_combined(atoms, name, orbital_types=None):
+    "Plot total DOS and orbitals for a specific atom (or the sum over a group of atoms)."
     fig, ax = plt.subplots(figsize=(12, 8))
 
     if ISPIN == 1:
-        dos_data = np.loadtxt("DOSCAR", unpack=True, usecols=(0, 1), skiprows=6, max_rows=NEDOS)
+        dos_data = dos[0, :NEDOS, [0, 1]]
         energies = dos_data[0] - fermi_energy  
         spin_up = dos_data[1]          
         ax.plot(energies, spin_up, linestyle='-', color='r', label='Total DOS')   
         ax.fill_between(energies, spin_up, alpha=0.1, color='r') # Fill between the curve and the x-axis
         
     elif ISPIN == 2:
-        dos_data = np.loadtxt("DOSCAR", unpack=True, usecols=(0, 1, 2), skiprows=6, max_rows=NEDOS)
+        dos_data = dos[0, :NEDOS, [0, 1, 2]]
         energies = dos_data[0] - fermi_energy
         spin_up = dos_data[1]
         spin_down = dos_data[2] * -1  # Invert spin down for plotting
@@ -179,8 +244,7 @@ def plot_dos_combined(atom_number, orbital_types=None):
         ax.fill_between(energies, spin_down, alpha=0.1, color='r') # Fill for spin down (optional)
             
     # Now plot DOS for the specific atom
-    start_line = NEDOS + 8 + (atom_number - 1) * (NEDOS + 1)
-    data = np.loadtxt("DOSCAR", unpack=True, skiprows=start_line - 1, max_rows=NEDOS)
+    data = group_dos(atoms)
     energies = data[0] - fermi_energy
     
     def plot_dos(x, y, color, label):
@@ -248,32 +312,33 @@ def plot_dos_combined(atom_number, orbital_types=None):
     if y_min is not None and y_max is not None:
         ax.set_ylim(y_min, y_max)
 
-    plt.savefig(f"atom_{atom_number}-TDOS-orbitals.png", dpi=300, bbox_inches='tight')
+    plt.savefig(f"{name}-TDOS-orbitals.png", dpi=300, bbox_inches='tight')
+    write_dos_table(f"{name}-TDOS-orbitals.dat", data)
     plt.show()
 
 if __name__ == '__main__':
     # Initialize variables
-    atom_number = int(sys.argv[1]) if len(sys.argv) > 1 and sys.argv[1].isdigit() else None
     orbital_types = []
     # Check command line arguments
     if len(sys.argv) < 2:
-        print("Usage: dos.py atom_number --s/--p/--d/--all or dos.py --tot or dos.py atom_number --all --tot")
+        print("Usage: dos.py atom_number --s/--p/--d/--all or dos.py --tot or dos.py atom_number --all --tot (or --atoms 1-64,130 / --element B instead of atom_number)")
         sys.exit(1)
 
+    # Atom number or group of atoms
+    atoms, name = select_atoms(sys.argv)
+
     # Parse arguments
     if '--tot' in sys.argv:
         if '--all' in sys.argv:
-            atom_number = int(sys.argv[1]) 
-            plot_dos_combined(atom_number)
+            plot_dos_combined(atoms, name)
         else:
             plot_dos_total()
     else:
-        atom_number = int(sys.argv[1])
         if '--s' in sys.argv:
-            plot_dos_for_atom(atom_number, orbital_types='s')
+            plot_dos_for_atom(atoms, name, orbital_types='s')
         elif '--p' in sys.argv:
-            plot_dos_for_atom(atom_number, orbital_types='p')
+            plot_dos_for_atom(atoms, name, orbital_types='p')
         elif '--d' in sys.argv:
-            plot_dos_for_atom(atom_number, orbital_types='d')
+            plot_dos_for_atom(atoms, name, orbital_types='d')
         elif '--all' in sys.argv:
-            plot_dos_for_atom(atom_number, orbital_types=['s', 'p', 'd'])
+            plot_dos_for_atom(atoms, name, orbital_types=['s', 'p', 'd'])
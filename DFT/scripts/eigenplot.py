@@ -2,196 +2,52 @@
 # Written by Joseph P.Vera
 # 2024-11
 
-import xml.etree.ElementTree as ET
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
-from io import StringIO
 from fractions import Fraction
 import argparse
+from vasprun_reader import load_vasprun
+from band_edges import resolve_band
 
-tree = ET.parse('vasprun.xml')
-root = tree.getroot()
-
-# variables
-VBM = 7.2945
-CBM = 11.7449
+data = load_vasprun('vasprun.xml')
+eigenvalues = data['eigenvalues']    # eigenvalues[spin, kpoint, band, (energy, occupancy)]
 
 "Code for plot the Kohn-Sham states."
 
-"Usage: ----> eigenplot.py                           # By default: VBM=7.2945 and CBM=11.7449 \
+"Usage: ----> eigenplot.py                           # By default: VBM and CBM of ../perfect (see band_edges.py) \
         ----> eigenplot.py --band 0.9 15.2           # Modify the VBM and CBM \
         ----> eigenplot.py --band 0.9 15.2 --res 0.9 # Modify the VBM and CBM, and also rescale for set VBM = 0 and CBM = CBM - VBM"
 
 
 parser = argparse.ArgumentParser(description="Modify the VBM and CBM.")
-parser.add_argument('--band', nargs=2, type=float, default=[VBM, CBM], help="Specifies the values ​​for VBM and CBM. By default: VBM=7.2945 and CBM=11.7449")
+parser.add_argument('--band', nargs=2, type=float, default=None, help="Specifies the values ​​for VBM and CBM. By default: VBM and CBM of ../perfect (see band_edges.py)")
 parser.add_argument('--res', type=float, default=0.0, help="Rescale respect to VBM")
 args = parser.parse_args()
-vbm, cbm = args.band
+vbm, cbm = resolve_band(args.band, '.')
 res = args.res 
 
-# Find the spin numbers, kpoint and band in vasprun.xml
-spin_numbers = []
-kpoint_numbers = []
-band_numbers = []
-
-# Find the spin numbers
-for spin_set in root.findall(".//set"):
-    comment = spin_set.get('comment')
-    if comment and comment.startswith('spin'):
-        spin_number = int(comment.replace('spin', ''))
-        if spin_number not in spin_numbers:
-            spin_numbers.append(spin_number)
-
-# Find the kpoint numbers
-for spin_number in spin_numbers:
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-    if spin_set is not None:
-        for kpoint_set in spin_set.findall(".//set"):
-            comment = kpoint_set.get('comment')
-            if comment and comment.startswith('kpoint'):
-                kpoint_number = int(comment.replace('kpoint ', ''))
-                if kpoint_number not in kpoint_numbers:
-                    kpoint_numbers.append(kpoint_number)
-
-# Find the band numbers
-for spin_number in spin_numbers:
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-    if spin_set is not None:
-        for kpoint_number in kpoint_numbers:
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-            if kpoint_block is not None:
-                for band_set in kpoint_block.findall(".//set"):
-                    comment = band_set.get('comment')
-                    if comment and comment.startswith('band'):
-                        band_number = int(comment.replace('band ', ''))
-                        if band_number not in band_numbers:
-                            band_numbers.append(band_number)
-
-#print("List of spin_numbers:", spin_numbers)
-#print("List of kpoint_numbers:", kpoint_numbers)
-#print("List of band_numbers:", band_numbers)
-
-
-# Store
-results = []
-results.append(f"{'Spin':<6} {'k-point':<10} {'Band':<10} {'tot':<10} {'sum':<10}")
-
-# Iterate through lists of inputs spin numbers, kpoint and band (s, p and d orbitals)
-for spin_number in spin_numbers:
-    # Find the superblock. key word ---> <set comment="spin1"> 
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-
-    if spin_set is not None:
-        for kpoint_number in kpoint_numbers:
-            # find the block. key word ---> <set comment="kpoint 1">  
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-            
-            if kpoint_block is not None:
-                for band_number in band_numbers:
-                    # find subblocks for sum the value and find the tot column and also compute the sum of the 5 biggest numbers of each band. key word ---> <set comment="band 1">
-                    band_subblock = kpoint_block.find(f".//set[@comment='band {band_number}']")
-                    
-                    if band_subblock is not None:
-                        total_sum = 0.0  # total sum
-                        tot_values = []  # store tot
-                        
-                        # subblock
-                        for i, child in enumerate(band_subblock):
-                            # get the values of the columns
-                            columns = child.text.split()
-                            
-                            # Convert to float to calculate the sum
-                            total = float(columns[0]) + float(columns[1]) + float(columns[2])  
-                            total_sum += total  # total sum
-                            tot_values.append(total) 
-                            
-                        # Calculate the sum of the 5 values ​​closest to 1 (the sum of the 5 biggest numbers of each band)
-                        closest_to_one = sorted(tot_values, key=lambda x: abs(x - 1))[:5]
-                        closest_sum = sum(closest_to_one)
-                        
-                        results.append(f"{spin_number:<6} {kpoint_number:<10} {band_number:<10} {total_sum:<10.3f} {closest_sum:<10.3f}")
-                        
-                    else:
-                        print(f"Subblock 'band {band_number}' not found in 'kpoint {kpoint_number}'.")
-            else:
-                print(f"Block 'kpoint {kpoint_number}' not found in 'spin{spin_number}'.")
-    else:
-        print(f"Superblock 'spin{spin_number}' not found.")
-
-# energy and occupancy
-energy_values = []
-occupancy_list = []
-for spin_number in spin_numbers:
-    for kpoint_number in kpoint_numbers:
-        # spin superblock
-        spin_set = root.find(f".//set[@comment='spin {spin_number}']")  # key word ---> <set comment="spin 1"> before to <set comment="kpoint 1">
-        
-        if spin_set is not None:
-            # kpoint block
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']") # key word ---> <set comment="kpoint 1"> after to <set comment="spin 1"> 
-            
-            if kpoint_block is not None:
-                block_values = []  # temporal list to the energy
-                block_occu = [] # temporal list to the occupancy
-                for child in kpoint_block:
-                    if child.text:
-                        columns = child.text.split()
-                        if len(columns) >= 2:
-                            block_values.append(float(columns[0]))  
-                            block_occu.append(float(columns[1]))
-                if block_values: 
-                    energy_values.append(block_values)
-                if block_occu:
-                    occupancy_list.append(block_occu)
-                    
-            else:
-                print(f"Block 'kpoint {kpoint_number}' not found in 'spin {spin_number}'.") # dont confuse with the others blocks
-        else:
-            print(f"Superblock 'spin {spin_number}' not found.") # dont confuse with the others superblocks
-
-# Create the total list by combining results and energy_values
-total_results = []
-for i, result in enumerate(results):
-    if i == 0:
-        total_results.append(f"{result:<10} {'Energy':<10} {'Occ':<10}")
-    else:
-        block_index = (i - 1) // len(band_numbers)  
-        row_index = (i - 1) % len(band_numbers)  
-        energy_value = energy_values[block_index][row_index] if block_index < len(energy_values) and row_index < len(energy_values[block_index]) else ''
-        occupancy_value = occupancy_list[block_index][row_index] if block_index < len(occupancy_list) and row_index < len(occupancy_list[block_index]) else ''
-        total_results.append(f"{result:<10} {energy_value:<10.3f} {occupancy_value:<10.3f}")
-        
-        
-        # Blank line between blocks
-        if row_index == len(band_numbers) - 1 and block_index < len(energy_values) - 1:
-            total_results.append("")
+# The states are plotted straight from the arrays (no text table): bands around the HOMO-LUMO transition of each spin and kpoint
+# Number of bands taken below and above the first band with occupancy < 1.0
+BELOW = 14
+ABOVE = 11
+# Bands that the transition must have below and above to be plotted
+MARGIN = 10
 
+COLORS = np.array(['blue', 'red', 'green'])
 
-# store final results
-final_result = []
-for total in total_results:
-    final_result.append(total)
+def occupancy_colors(occupancy):
+    "Occupied (> 0.9): blue, unoccupied (< 0.1): red, partially occupied: green"
+    return COLORS[np.select([occupancy > 0.9, occupancy < 0.1], [0, 1], 2)]
 
-# for total in final_result:
-#     print(total)
-
-def extract_kpoint_coordinates(tree):
-    
-    # Find the keyword <varray name="kpointlist"> and extract k-point coordinates
-    kpoint_coordinates = []
-    kpointlist = root.find(".//varray[@name='kpointlist']")
-    
-    if kpointlist is not None:
-        for v in kpointlist.findall("v"):
-            coordinates = [float(coord) for coord in v.text.strip().split()]
-            kpoint_coordinates.append(coordinates)
-    else:
-        print("The <varray name='kpointlist'> tag was not found in the file.")
-    
-    return kpoint_coordinates
+def plotted_states(occupancy):
+    "Mask[spin, kpoint, band] of the bands around the first band with occupancy < 1.0 of each spin and kpoint"
+    n_bands = occupancy.shape[-1]
+    below = occupancy < 1.0
+    rupture_point = np.argmax(below, axis=-1)[..., None]
+    valid = below.any(axis=-1)[..., None] & (rupture_point >= MARGIN) & (rupture_point < n_bands - MARGIN)
+    bands = np.arange(n_bands)
+    return valid & (bands >= rupture_point - BELOW) & (bands < rupture_point + ABOVE)
 
 def generate_x_labels(kpt_coords, line_break="\n"):
     result = []
@@ -209,59 +65,26 @@ def generate_x_labels(kpt_coords, line_break="\n"):
             result.append(line_break.join(x_label))
     return result
 
-def plot_eigenvalues(final_result, kpoint_coordinates):
+def plot_eigenvalues(eigenvalues, kpoint_coordinates):
+    mask = plotted_states(eigenvalues[..., 1])
 
-    content = '\n'.join(final_result[1:])  # Skip the first line
-    blocks = content.strip().split('\n\n')
+    # kpoint numbers, energies (res for rescale respect to VBM, by default is 0. Use command --res) and colors of each spin
+    # Without spin polarization the same states are plotted in both subplots
+    states = []
+    for spin in (0, eigenvalues.shape[0] - 1):
+        kpoint_index, band_index = np.nonzero(mask[spin])
+        selected = eigenvalues[spin, kpoint_index, band_index]
+        states.append((kpoint_index + 1, selected[:, 0] - res, occupancy_colors(selected[:, 1])))
+    (kpoint_vals_up, rescale_up, colors_up), (kpoint_vals_down, rescale_down, colors_down) = states
 
-    num_blocks = len(blocks)
-
-    blocks_up = blocks[:num_blocks // 2]
-    blocks_down = blocks[num_blocks // 2:]
-
-    kpoint_vals_up = []
-    energy_vals_up = []
-    colors_up = []
-    
-    kpoint_vals_down = []
-    energy_vals_down = []
-    colors_down = []
-
-    for i, block in enumerate(blocks):
-        data = pd.read_csv(StringIO(block), sep=r'\s+', header=None)
-
-        if data.shape[1] >= 7:
-            subset = data.iloc[:, [1, 5, 6]]  
-            subset.columns = ['kpoint', 'Energy', 'occ']
-
-            occupancy = subset['occ'].to_list()  
-            rupture_point = next((j for j, val in enumerate(occupancy) if val < 1.0), None)
-        
-            if rupture_point is not None and rupture_point >= 10 and rupture_point < len(occupancy) - 10:
-                kpoint_vals = subset['kpoint'][rupture_point - 14:rupture_point + 11].to_list()
-                energy_vals = subset['Energy'][rupture_point - 14:rupture_point + 11].to_list()
-                occupancy_group = occupancy[rupture_point - 14:rupture_point + 11]
-
-                if i < num_blocks // 2:  
-                    kpoint_vals_up.extend(kpoint_vals)
-                    energy_vals_up.extend(energy_vals)
-                    colors_up.extend(['blue' if val > 0.9 else 'red' if val < 0.1 else 'green' for val in occupancy_group])
-                else:  
-                    kpoint_vals_down.extend(kpoint_vals)
-                    energy_vals_down.extend(energy_vals)
-                    colors_down.extend(['blue' if val > 0.9 else 'red' if val < 0.1 else 'green' for val in occupancy_group])
-
-    rescale_up = [valor - res for valor in energy_vals_up] # res for rescale respect to VBM, by default is 0. Use command--res
-    rescale_down = [valor - res for valor in energy_vals_down] # res for rescale respect to VBM, by default is 0. Use command--res
-    
     fig, axs = plt.subplots(1, 2, figsize=(10, 8))  
 
     # Generate formatted x-axis labels from kpoint_coordinates
     kpoint_labels = generate_x_labels(kpoint_coordinates)
 
     # Map each kpoint to its respective label
-    unique_kpoints = sorted(set(kpoint_vals_up + kpoint_vals_down))
-    x_tick_labels = [kpoint_labels[unique_kpoints.index(kpt)] if kpt in unique_kpoints else '' for kpt in unique_kpoints]
+    unique_kpoints = np.unique(np.concatenate((kpoint_vals_up, kpoint_vals_down)))
+    x_tick_labels = [kpoint_labels[kpt - 1] for kpt in unique_kpoints]
     
     # Subplot Spin up
     axs[0].scatter(kpoint_vals_up, rescale_up, color=colors_up, label='Spin Up', s=30) 
@@ -297,7 +120,8 @@ def plot_eigenvalues(final_result, kpoint_coordinates):
     plt.tight_layout()
     plt.savefig('kohn-sham-states.png', dpi=150)
 
-kpoint_coordinates = extract_kpoint_coordinates(tree)
+# k-point coordinates from <varray name="kpointlist">
+kpoint_coordinates = data['kpoints'].tolist()
 
 # Plot eigenvalues with k-point coordinates and formatted labels
-plot_eigenvalues(final_result, kpoint_coordinates)
+plot_eigenvalues(eigenvalues, kpoint_coordinates)
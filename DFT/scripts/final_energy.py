@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import os
+import re
+import mmap
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+from outcar_index import scan_outcar
+
+"Final energies of finished calculations, used by toten.py (--final) and tot.py"
+"Only the last energy block is needed, so the file is memory-mapped and searched backward from the end (rfind), only the pages \
+ at the end of the file are read: \
+       ----> vasprun.xml ----> e_fr_energy of the last <scstep> (last electronic step of the last ionic step) \
+       ----> OUTCAR      ----> last 'energy  without entropy' line and the last 'free  energy   TOTEN' line before it \
+ If the block is not found in this way (e.g. a different format), the file is read with a streaming scan instead \
+ (ET.iterparse for vasprun.xml and outcar_index.py for OUTCAR)."
+"Usage: ----> vasprun_final_energy('vasprun.xml') \
+        ----> outcar_final_energies('OUTCAR') ----> (TOTEN, energy(sigma->0)) as written in the file \
+        ----> run_parallel(vasprun_final_energy, files, workers)"
+
+E_FR_ENERGY = re.compile(rb'<i name="e_fr_energy">\s*([^<\s]+)\s*</i>')
+TOTEN = re.compile(rb'free  energy\s+TOTEN\s*=\s*(-*\d+\.\d+)')
+E_WITHOUT_ENTROPY = re.compile(rb'energy  without entropy\s*=\s*(-*\d+\.\d+)\s+energy\(sigma->0\)\s+=\s+(-*\d+\.\d+)')
+
+
+def map_file(file):
+    "Read-only memory map of an open file (None for an empty file)"
+    if file.seek(0, 2) == 0:
+        return None
+    return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def stream_vasprun_energy(file_path):
+    "e_fr_energy of the last <scstep> read with ET.iterparse"
+    energy = None
+    in_scstep = False
+    try:
+        for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+            if elem.tag == 'scstep':
+                in_scstep = event == 'start'
+            elif event == 'end' and in_scstep and elem.tag == 'i' and elem.get('name') == 'e_fr_energy':
+                energy = float(elem.text.strip())
+            if event == 'end' and elem.tag in ('i', 'v', 'r', 'rc', 'set', 'scstep'):
+                elem.clear()
+    except ET.ParseError:
+        # unfinished calculation, keep the last energy found
+        pass
+    return energy
+
+
+def vasprun_final_energy(file_path):
+    "e_fr_energy of the last electronic step of the last ionic step"
+    with open(file_path, 'rb') as file:
+        vasprun = map_file(file)
+        if vasprun is not None:
+            with vasprun:
+                end = vasprun.rfind(b'</scstep>')
+                start = vasprun.rfind(b'<i name="e_fr_energy">', 0, end) if end >= 0 else -1
+                match = E_FR_ENERGY.match(vasprun, start) if start >= 0 else None
+                if match:
+                    return float(match.group(1))
+    energy = stream_vasprun_energy(file_path)
+    if energy is None:
+        raise ValueError(f"e_fr_energy not found in {file_path}")
+    return energy
+
+
+def outcar_final_energies(file_path):
+    "TOTEN and energy(sigma->0) of the last ionic step (strings as written in the OUTCAR), None if not found"
+    with open(file_path, 'rb') as file:
+        outcar = map_file(file)
+        if outcar is not None:
+            with outcar:
+                start = outcar.rfind(b'energy  without entropy')
+                e0 = E_WITHOUT_ENTROPY.match(outcar, start) if start >= 0 else None
+                toten_start = outcar.rfind(b'free  energy', 0, start) if e0 else -1
+                toten = TOTEN.match(outcar, toten_start) if toten_start >= 0 else None
+                if e0 and toten:
+                    return toten.group(1).decode(), e0.group(2).decode()
+
+    # Streaming scan of the whole OUTCAR
+    index = scan_outcar(file_path, ['TOTEN', 'energy without entropy'])
+    if not index['energy without entropy']:
+        return None
+    offset, (_, e0eV) = index['energy without entropy'][-1]
+    before = [value for position, value in index['TOTEN'] if position < offset]
+    return (before[-1], e0eV) if before else None
+
+
+def run_parallel(function, files, workers=None):
+    "function(file) for each file with a process pool, in the same order as files"
+    if len(files) <= 1:
+        return [function(file) for file in files]
+    with Pool(min(workers or os.cpu_count(), len(files))) as pool:
+        return pool.map(function, files)
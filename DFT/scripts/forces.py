@@ -2,85 +2,188 @@
 # Written by Joseph P.Vera
 # 2024-11
 
+import os
+import sys
+import time
+import argparse
 import xml.etree.ElementTree as ET
 import numpy as np
+from vasprun_reader import load_vasprun
+from outcar_index import scan_outcar, values, PATTERNS, KEYS, convert
 
 "Code for get the maximun force, pressure and drift. The maximum force and pressedure are extract from vasprun.xml file, while \
  drift is extract from OUTCAR file. OPTION: All information can also be found on OUTCAR with keywords: TOTAL-FORCE and total drift."
 
+"Usage: ----> forces.py                 # finished calculation \
+        ----> forces.py --follow        # running calculation: print one row for each new ionic step, like tail -f (Ctrl+C to stop) \
+        ----> forces.py --follow --interval 60"
+"In the --follow mode only the bytes appended since the last check are read: the partial vasprun.xml is fed to an XMLPullParser \
+ (each <calculation> is processed and cleared when it is closed) and the new complete lines of the OUTCAR are searched for the total drift."
+
 file_path = 'vasprun.xml'   
 outcar_file = 'OUTCAR'
 
 def extract_forces_and_stress(file_path):
-    tree = ET.parse(file_path)
-    root = tree.getroot()
-
-    forces_data = []
-    stress_data = []
-
-    # Find the keyword <varray name="forces" >
-    for varray in root.findall(".//varray[@name='forces']"):
-        force_set = []  
-        for v in varray.findall(".//v"):
-            forces = list(map(float, v.text.split()))
-            force_set.append(forces) 
-        forces_data.append(force_set)  
-    
-    # Find the keyword <varray name="stress" >
-    for varray in root.findall(".//varray[@name='stress']"):
-        stress_matrix = []
-        for v in varray.findall(".//v"):
-            row = list(map(float, v.text.split()))
-            stress_matrix.append(row)
-        stress_data.append(stress_matrix)    
-    return forces_data, stress_data
+    "Forces and stress of each ionic step, <varray name=\"forces\" > and <varray name=\"stress\" > (read from the sidecar when possible)"
+    data = load_vasprun(file_path)
+    forces_data = data.get('forces', np.zeros((0, 0, 3)))
+    stress_data = data.get('stress', np.zeros((0, 3, 3)))
+    return forces_data, stress_data, data['symbols']
 
 def find_maximum_force(forces):
-    max_force = float('-inf')  
-    for force in forces:
-        max_force_in_atom = max(abs(force[0]), abs(force[1]), abs(force[2])) 
-        if max_force_in_atom > max_force:
-            max_force = max_force_in_atom  
-    return max_force
+    "Largest Cartesian component (absolute value) of the forces of each ionic step, forces[step, atom, 3]"
+    return np.abs(forces).max(axis=(1, 2), initial=0.0)
 
 def find_pressure(stress_data):
-    pressures = []
-    for matrix in stress_data:
-        trace = matrix[0][0] + matrix[1][1] + matrix[2][2]
-        pressure = trace / 3   
-        pressures.append(pressure)
-    return pressures
+    "Pressure (trace / 3) of each ionic step, stress_data[step, 3, 3]"
+    return np.trace(stress_data, axis1=1, axis2=2) / 3
+
+def analyze_forces(forces, stress, symbols):
+    "All the quantities of each ionic step in one pass over forces[step, atom, 3]"
+    norms = np.linalg.norm(forces, axis=2)          # norms[step, atom]
+    analysis = {'max_force': find_maximum_force(forces),
+                'max_norm': norms.max(axis=1, initial=0.0),
+                'max_atom': norms.argmax(axis=1) + 1 if norms.shape[1] else np.zeros(len(norms), dtype=int),
+                'rms_force': np.sqrt((norms ** 2).mean(axis=1)) if norms.shape[1] else np.zeros(len(norms)),
+                'pressure': find_pressure(stress)}
+    # Maximum norm of the forces on each element (skipped if vasprun.xml has no complete <varray name="forces">, i.e. no finished ionic step)
+    if forces.size == 0:
+        return analysis
+    symbols = np.asarray(symbols)
+    for element in dict.fromkeys(symbols.tolist()):
+        analysis[f'max_{element}'] = norms[:, symbols == element].max(axis=1)
+    return analysis
 
 def find_drift(outcar_file):
+    "Total drift of each ionic step (see outcar_index.py)"
     drift_values = []
     max_drift_values = []
 
-    with open(outcar_file, 'r') as f:
-        lines = f.readlines()
-
-    for line in lines:
-        if "total drift" in line.lower(): 
-            parts = line.split()
-            
-            if len(parts) == 5:  
-                x = float(parts[2])  
-                y = float(parts[3]) 
-                z = float(parts[4]) 
+    for x, y, z in values(scan_outcar(outcar_file, ['total drift']), 'total drift'):
+        drift = np.sqrt(x**2 + y**2 + z**2)
 
-                drift = np.sqrt(x**2 + y**2 + z**2)
-                
-                max_drift = max(x, y, z)
+        max_drift = max(x, y, z)
 
-                drift_values.append(drift)
-                max_drift_values.append(max_drift)    
+        drift_values.append(drift)
+        max_drift_values.append(max_drift)
     return drift_values, max_drift_values
 
-forces, stress = extract_forces_and_stress(file_path)
-max_forces = [find_maximum_force(force_set) for force_set in forces]
-pressures = find_pressure(stress)
-
-drift_values, max_drift_values = find_drift(outcar_file)
-
-print(f"{'MaxForce(eV/Å)':<20} {'Pressure(kB)':<20} {'MaxDrift(eV/Å)':<20}")# {'Tot Drift(eV/Å)':<14}")
-for max_force, pressure, drift, max_drift in zip(max_forces, pressures, drift_values, max_drift_values):
-    print(f"{max_force:<20.4f} {pressure:<20.4f} {max_drift:<20.4f}")# {drift:<14.4f}")
+def read_new_bytes(file_path, position):
+    "Bytes appended to the file after position (the file may not exist yet)"
+    if not os.path.exists(file_path):
+        return b''
+    with open(file_path, 'rb') as file:
+        file.seek(position)
+        return file.read()
+
+def follow_vasprun(file_path):
+    "Generator: each next() returns the (forces, stress) of the ionic steps closed since the last call and if the run finished"
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    position = 0
+    root = None
+    step = {}
+    finished = False
+
+    while True:
+        new_steps = []
+        chunk = read_new_bytes(file_path, position)
+        position += len(chunk)
+        if chunk:
+            parser.feed(chunk)
+            for event, elem in parser.read_events():
+                if event == 'start':
+                    if root is None:
+                        root = elem
+                    continue
+                if elem.tag == 'varray' and elem.get('name') in ('forces', 'stress'):
+                    step[elem.get('name')] = np.array([v.text.split() for v in elem], dtype=float)
+                elif elem.tag == 'calculation':
+                    if 'forces' in step and 'stress' in step:
+                        new_steps.append((step['forces'], step['stress']))
+                    step = {}
+                    # the closed ionic steps are not needed anymore
+                    root.clear()
+                elif elem is root:
+                    finished = True
+        yield new_steps, finished
+
+def follow_drift(outcar_file):
+    "Generator: each next() returns the total drift (x, y, z) of the new complete lines of the OUTCAR"
+    pattern = PATTERNS['total drift']
+    function = KEYS['total drift'][1]
+    position = 0
+    rest = b''
+
+    while True:
+        chunk = read_new_bytes(outcar_file, position)
+        position += len(chunk)
+        text = rest + chunk
+        # the last line may not be complete yet
+        end = text.rfind(b'\n') + 1
+        text, rest = text[:end], text[end:]
+        yield [convert(match.groups(), function) for match in pattern.finditer(text)]
+
+def follow(file_path, outcar_file, interval=10):
+    "Print the maximum force, pressure and drift of each ionic step of a running calculation"
+    steps = follow_vasprun(file_path)
+    drifts = follow_drift(outcar_file)
+    pending, drift_values = [], []
+    number = 0
+
+    print(f"{'Step':<8} {'MaxForce(eV/Å)':<20} {'Pressure(kB)':<20} {'MaxDrift(eV/Å)':<20}", flush=True)
+    while True:
+        new_steps, finished = next(steps)
+        pending.extend(new_steps)
+        drift_values.extend(next(drifts))
+
+        # A row is printed when the step is in the vasprun.xml and its drift in the OUTCAR (or the run finished)
+        while pending and (drift_values or finished):
+            forces, stress = pending.pop(0)
+            number += 1
+            max_force = np.abs(forces).max()
+            pressure = np.trace(stress) / 3
+            max_drift = f"{max(drift_values.pop(0)):<20.4f}" if drift_values else f"{'-':<20}"
+            print(f"{number:<8} {max_force:<20.4f} {pressure:<20.4f} {max_drift}", flush=True)
+
+        if finished:
+            print("The calculation finished.")
+            return
+        time.sleep(interval)
+
+def main():
+    parser = argparse.ArgumentParser(description="Maximum force, pressure and drift of each ionic step.")
+    parser.add_argument('--npz', nargs='?', const='forces.npz', default=None, help="Save the forces, stress and the analysis of each ionic step in a .npz file. By default: forces.npz")
+    parser.add_argument('--follow', action='store_true', help="Follow a running calculation and print each new ionic step")
+    parser.add_argument('--interval', type=float, default=10, help="Seconds between checks in the --follow mode. By default: 10")
+    args = parser.parse_args()
+
+    if args.follow:
+        try:
+            follow(file_path, outcar_file, args.interval)
+        except KeyboardInterrupt:
+            sys.exit(0)
+        return
+
+    forces, stress, symbols = extract_forces_and_stress(file_path)
+    analysis = analyze_forces(forces, stress, symbols)
+    elements = [key[4:] for key in analysis if key.startswith('max_') and key not in ('max_force', 'max_norm', 'max_atom')]
+
+    drift_values, max_drift_values = find_drift(outcar_file)
+
+    "MaxForce: largest Cartesian component, MaxNorm: largest |F| and its atom (Atom, 1-based), RMS: sqrt(mean |F|^2), \
+     Max_<element>: largest |F| on the atoms of the element"
+    print(f"{'MaxForce(eV/Å)':<20} {'Pressure(kB)':<20} {'MaxDrift(eV/Å)':<20} {'MaxNorm(eV/Å)':<16} {'Atom':<8} {'RMS(eV/Å)':<16}"
+          + ''.join(f"{'Max_' + element:<12}" for element in elements))# {'Tot Drift(eV/Å)':<14}")
+    for step, (drift, max_drift) in enumerate(zip(drift_values, max_drift_values)):
+        if step >= len(forces):
+            break
+        print(f"{analysis['max_force'][step]:<20.4f} {analysis['pressure'][step]:<20.4f} {max_drift:<20.4f} "
+              f"{analysis['max_norm'][step]:<16.4f} {analysis['max_atom'][step]:<8} {analysis['rms_force'][step]:<16.4f}"
+              + ''.join(f"{analysis['max_' + element][step]:<12.4f}" for element in elements))# {drift:<14.4f}")
+
+    if args.npz:
+        np.savez(args.npz, forces=forces, stress=stress, symbols=symbols, drift=np.array(drift_values), max_drift=np.array(max_drift_values), **analysis)
+        print(f"The forces and their analysis were saved in {args.npz}")
+
+if __name__ == '__main__':
+    main()
@@ -2,24 +2,13 @@
 # Written by Joseph P.Vera
 # 2025-03
 
-import os
-import xml.etree.ElementTree as ET
 import numpy as np
 import matplotlib.pyplot as plt
 import argparse
+from sweep import collect_sweep, add_sweep_arguments
 
-def extract_toten(root):
-    """
-    Extract the last 'e_wo_entrp' energy from a vasprun.xml file.
-    """
-    energies = root.findall(".//i[@name='e_wo_entrp']")
-    if energies:
-        last_energy = energies[-1].text.strip()
-        return float(last_energy)
-    else:
-        print(f"e_wo_entrp not found")
-        return None
-
+"The last e_wo_entrp of each subfolder is read by sweep.py (process pool, results kept in <folder>/sweep_results.json, \
+ only the new or modified vasprun.xml files are read again)"
 
 def extract_kdensity(subfolder):
     """
@@ -34,35 +23,17 @@ def extract_kdensity(subfolder):
         return None
 
 
-def extract_num_atoms(root):
-    """
-    Extract the number of atoms from a vasprun.xml file.
-    """
-    atoms_element = root.find(".//atoms")
-    if atoms_element is not None:
-        num_atoms = int(atoms_element.text.strip())
-        return num_atoms
-    else:
-        print(f"Number of atoms not found in the file.")
-        return None
-
-
-def extract_data(directory):
+def extract_data(directory, workers=None, force=False):
     kdensity_values = []
     total_energies = {}
 
-    for subfolder in sorted(os.listdir(directory)):
-        vasprun_path = os.path.join(directory, subfolder, "vasprun.xml")
+    for subfolder, values in collect_sweep(directory, workers, force).items():
+        energy = values['energy']
+        kdensity_value = extract_kdensity(subfolder)
 
-        if os.path.exists(vasprun_path):
-            tree = ET.parse(vasprun_path)
-            root = tree.getroot()
-            energy = extract_toten(root)
-            kdensity_value = extract_kdensity(subfolder)
-
-            if energy is not None and kdensity_value is not None:
-                kdensity_values.append(kdensity_value)
-                total_energies[kdensity_value] = energy
+        if energy is not None and kdensity_value is not None:
+            kdensity_values.append(kdensity_value)
+            total_energies[kdensity_value] = energy
 
     return kdensity_values, total_energies
 
@@ -96,14 +67,18 @@ def plot_relative_energies(kdensity_values, relative_energy_increased, relative_
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Plot k-density vs energy data")
+    add_sweep_arguments(parser)
+    args = parser.parse_args()
+
     perfect_dir = 'kdensity-perfect'
     increased_dir = 'kdensity-increased'
     decreased_dir = 'kdensity-decreased'
 
     # Extract data from each directory
-    kdensity_values, perfect_energies = extract_data(perfect_dir)
-    _, increased_energies = extract_data(increased_dir)
-    _, decreased_energies = extract_data(decreased_dir)
+    kdensity_values, perfect_energies = extract_data(perfect_dir, args.workers, args.force)
+    _, increased_energies = extract_data(increased_dir, args.workers, args.force)
+    _, decreased_energies = extract_data(decreased_dir, args.workers, args.force)
 
     # Calculate relative energies in meV
     relative_energy_increased = [np.abs(perfect_energies[kdensity] - increased_energies[kdensity]) * 1000 for kdensity in kdensity_values]
@@ -2,49 +2,147 @@
 # Written by Joseph P.Vera
 # 2024-11
 
-import numpy as np
+import os
+import itertools
 import argparse
+import numpy as np
+from ase.io import read
+
+try:
+    import spglib
+except ImportError:
+    spglib = None
+
+"Code to create the KPOINTS file (Gamma-centered mesh) with a k-density, n_i = ceil(k-density * |b_i|) with the reciprocal lattice \
+ vectors b_i (2*pi included) of the POSCAR, scale factor included"
+
+"Planner (--plan): meshes of many structures for a range of k-densities, the cost of each mesh is the number of irreducible k-points \
+       ----> with spglib    ----> k-points not equivalent by the symmetry of the structure (and time reversal) \
+       ----> without spglib ----> k-points not equivalent by time reversal, k and -k (upper bound) \
+ For each k-density the meshes with n_i or n_i + 1 divisions are compared (all of them have the k-density or more) and the mesh with \
+ the fewest irreducible k-points is kept. The KPOINTS are written in kdensity-<structure>/<k-density>/KPOINTS, the folders of \
+ the convergence test read by kdensity.py, and a k-density is skipped only if all the structures have the same mesh as in a smaller \
+ k-density (every structure has the same k-density folders). The table \
+ is saved in kmesh_plan.dat"
+"Usage: ----> kmesh.py --d 4.0                                                        # KPOINTS for ./POSCAR \
+        ----> kmesh.py --plan perfect/POSCAR increased/POSCAR decreased/POSCAR --d 2 3 4 5 6   # kdensity-perfect/2/KPOINTS, ..."
+
+PLAN = 'kmesh_plan.dat'
+
+
+def reciprocal_lattice(structure):
+    "Reciprocal lattice vectors (rows, 2*pi included) of an ase Atoms"
+    return 2 * np.pi * np.array(structure.cell.reciprocal())
+
+
+def mesh_for_density(reciprocal, kdensity):
+    "Smallest Gamma-centered mesh with the k-density along each reciprocal lattice vector"
+    return tuple(max(1, int(n)) for n in np.ceil(kdensity * np.linalg.norm(reciprocal, axis=1)))
+
 
 def compute_nk_values(poscar_file, kdensity=4.0):
-    k_dist = 1 / kdensity
-
-    with open(poscar_file, 'r') as file:
-        lines = file.readlines()
-        
-        # vectors
-        a_1 = list(map(float, lines[2].split()))  
-        a_2 = list(map(float, lines[3].split()))  
-        a_3 = list(map(float, lines[4].split())) 
-    
-    # lattice parameters
-    a = np.sqrt(a_1[0]**2 + a_1[1]**2 + a_1[2]**2)
-    b = np.sqrt(a_2[0]**2 + a_2[1]**2 + a_2[2]**2)
-    c = np.sqrt(a_3[0]**2 + a_3[1]**2 + a_3[2]**2)
-    
-    # Calculate n_k and round to the nearest integer (kpoints mesh)
-    n_k_1 = int(np.ceil((2*np.pi) / (a*k_dist)))
-    n_k_2 = int(np.ceil((2*np.pi) / (b*k_dist)))
-    n_k_3 = int(np.ceil((2*np.pi) / (c*k_dist)))
-    
+    n_k_1, n_k_2, n_k_3 = mesh_for_density(reciprocal_lattice(read(poscar_file)), kdensity)
     return n_k_1, n_k_2, n_k_3, kdensity
 
+
+def irreducible_kpoints(structure, mesh, use_spglib=True):
+    "Number of irreducible k-points of the Gamma-centered mesh"
+    if use_spglib and spglib is not None:
+        cell = (np.array(structure.cell), structure.get_scaled_positions(), structure.get_atomic_numbers())
+        mapping, _ = spglib.get_ir_reciprocal_mesh(mesh, cell, is_shift=[0, 0, 0])
+        return len(np.unique(mapping))
+
+    # Time reversal only: k and -k are equivalent, except the k-points with 2k = 0 (1 or 2 per direction)
+    invariant = np.prod([1 if n % 2 else 2 for n in mesh])
+    return (int(np.prod(mesh)) + int(invariant)) // 2
+
+
+def cheapest_mesh(structure, kdensity, use_spglib=True):
+    "Mesh with the k-density and the fewest irreducible k-points: (mesh, irreducible k-points)"
+    smallest = mesh_for_density(reciprocal_lattice(structure), kdensity)
+    candidates = itertools.product(*[(n, n + 1) for n in smallest])
+    costs = [(irreducible_kpoints(structure, mesh, use_spglib), int(np.prod(mesh)), mesh) for mesh in candidates]
+    irreducible, _, mesh = min(costs)
+    return mesh, irreducible
+
+
+def structure_name(poscar_file):
+    "Name of the structure: folder of the POSCAR (e.g. perfect/POSCAR ----> perfect)"
+    folder = os.path.basename(os.path.dirname(os.path.abspath(poscar_file)))
+    return folder if os.path.basename(poscar_file) == 'POSCAR' else os.path.splitext(os.path.basename(poscar_file))[0]
+
+
+def plan_meshes(poscar_files, kdensities, use_spglib=True, write=True):
+    "Cheapest mesh of each structure and k-density, one row per pair: (structure, k-density, mesh, k-points, irreducible, folder)"
+    structures = [(structure_name(poscar_file), read(poscar_file)) for poscar_file in poscar_files]
+    kdensities = sorted(kdensities)
+    meshes = {(name, kdensity): cheapest_mesh(structure, kdensity, use_spglib) for name, structure in structures for kdensity in kdensities}
+
+    # A k-density is skipped only if every structure has the same mesh as in a k-density already kept, so all the structures
+    # have the same folders (kdensity.py compares the energies of each k-density)
+    kept = []
+    for kdensity in kdensities:
+        if not kept or any(meshes[name, kdensity][0] not in [meshes[name, previous][0] for previous in kept] for name, _ in structures):
+            kept.append(kdensity)
+
+    rows = []
+    for name, _ in structures:
+        for kdensity in kdensities:
+            mesh, irreducible = meshes[name, kdensity]
+            if kdensity in kept:
+                folder = os.path.join(f"kdensity-{name}", f"{kdensity:g}")
+                if write:
+                    os.makedirs(folder, exist_ok=True)
+                    kpoints_file(*mesh, kdensity, filename=os.path.join(folder, "KPOINTS"))
+            else:
+                same = next(previous for previous in kept if meshes[name, previous][0] == mesh)
+                folder = f"same as {same:g}"
+            rows.append((name, kdensity, mesh, int(np.prod(mesh)), irreducible, folder))
+    return rows
+
+
 def kpoints_file(n_k_1, n_k_2, n_k_3, kdensity, filename="KPOINTS"):
     with open(filename, 'w') as file:
         file.write(f"k-density: {kdensity:.1f}\n")
         file.write("0\n")
         file.write("Gamma\n")
-        file.write(f" {n_k_1:1d} {n_k_2:2d} {n_k_3:2d}\n")  
+        file.write(f" {n_k_1:1d} {n_k_2:2d} {n_k_3:2d}\n")
         file.write(" 0  0  0\n")
 
-parser = argparse.ArgumentParser(description="Generate a KPOINTS file with specified k-density.")
-parser.add_argument("--d", type=float, default=4.0, help="Specify the k-density value. Default is 4.0.")
-args = parser.parse_args()
 
-poscar_file = 'POSCAR'
+def main():
+    parser = argparse.ArgumentParser(description="Generate a KPOINTS file with specified k-density.")
+    parser.add_argument("--d", type=float, nargs='+', default=[4.0], help="Specify the k-density value (several values with --plan). Default is 4.0.")
+    parser.add_argument("--plan", nargs='+', default=None, metavar='POSCAR', help="Plan the meshes of these structures for all the k-densities of --d")
+    parser.add_argument("--no-spglib", action='store_true', help="Count the irreducible k-points with time reversal only")
+    parser.add_argument("--dry-run", action='store_true', help="With --plan, only print the table, the KPOINTS are not written")
+    args = parser.parse_args()
+
+    if args.plan is None:
+        if len(args.d) > 1:
+            parser.error("only one k-density is used without --plan")
+        poscar_file = 'POSCAR'
+
+        # Compute and write the KPOINTS file
+        n_k_1, n_k_2, n_k_3, kdensity = compute_nk_values(poscar_file, args.d[0])
+        kpoints_file(n_k_1, n_k_2, n_k_3, kdensity)
+
+        print(f"k-density: {kdensity}")
+        print(f"k-point mesh: {n_k_1}x{n_k_2}x{n_k_3}")
+        return
+
+    use_spglib = not args.no_spglib
+    if use_spglib and spglib is None:
+        print("spglib is not installed, the irreducible k-points are counted with time reversal only")
+
+    rows = plan_meshes(args.plan, args.d, use_spglib, write=not args.dry_run)
+    lines = [f"{'Structure':<20} {'K-density':<10} {'Mesh':<12} {'K-points':<10} {'Irreducible':<12} {'Folder'}"]
+    for name, kdensity, mesh, total, irreducible, folder in rows:
+        lines.append(f"{name:<20} {kdensity:<10g} {'x'.join(map(str, mesh)):<12} {total:<10} {irreducible:<12} {folder}")
+    print('\n'.join(lines))
+    with open(PLAN, 'w') as file:
+        file.write('\n'.join(lines) + '\n')
 
-# Compute and write the KPOINTS file
-n_k_1, n_k_2, n_k_3, kdensity = compute_nk_values(poscar_file, args.d)
-kpoints_file(n_k_1, n_k_2, n_k_3, kdensity)
 
-print(f"k-density: {kdensity}")
-print(f"k-point mesh: {n_k_1}x{n_k_2}x{n_k_3}")
+if __name__ == '__main__':
+    main()
@@ -5,108 +5,148 @@
 "Code to create the KPOINTS file for HSE06 calculations (path for band structure), using the OUTCAR and KPOINTS files from the band structure \
 and the IBZKPT file from DOS with the PBE calculation"
 
-# Read the OUTCAR file and extract the information 
-with open('../../PBE/bs/OUTCAR') as infile, open('kpoints.dat', 'w') as outfile:
-    copy = False
-    for line in infile:
-        if line.strip() == "k-points in reciprocal lattice and weights: k-points along fcc high symmetry lines":
-            copy = True
-        if copy:
-            outfile.write(line)
-        if line.strip() == "":
-            copy = False
-            
-# Clean kpoints.dat, remove the fourth column for add the zeros column
-with open("kpoints.dat", "r+") as fil:
-    file1 = fil.readlines()
-    fil.seek(0)
-    for line in file1:
-        if "k-points" not in line:
-            if not line.isspace():
-                fil.write(line)
-    fil.truncate()
-    
-# Format kpoints.dat
-with open("kpoints.dat", 'r+') as fopen:
-    string = ""
-    for line in fopen.readlines():
-        string = string + line[:-5] + "\n"  
-
-with open("kpoints.dat", 'w') as fopen:
-    fopen.write(string)
-
-# Read the KPOINTS file, get the labels
-kpoints_dict = {}
-with open('../../PBE/bs/KPOINTS', 'r') as kpoints_file:
-    for line in kpoints_file:
-        # Ignore lines that do not contain k-point data
-        if line.strip() and not line.startswith("k-points") and not line.startswith("#") and not line.startswith("Line-mode") and not line.startswith("reciprocal"):
-            parts = line.split()
-            # Ignore lines that have less than 4 parts or contain a non-numeric character
-            if len(parts) >= 4 and all(part.replace('.', '', 1).isdigit() for part in parts[:3]):  
-                position = tuple(round(float(coord), 8) for coord in parts[:3])  # Take the first three as position 
-                label = parts[3]  # corresponding label
-                # Save only if the position is not already in the dictionary
-                if position not in kpoints_dict:
-                    kpoints_dict[position] = label  # Save in the dictionary
-
-# Read kpoints.dat and add corresponding labels
-with open("kpoints.dat", 'r+') as fopen:
-    lines = fopen.readlines()
-    fopen.seek(0)
-    
-    last_label = None  
-    for line in lines:
-        line_stripped = line.strip()
-        if line_stripped:  # Check that the line is not empty
-            # removing unnecessary zeros
-            position = tuple(round(float(coord), 8) for coord in line_stripped.split()[:3])
-            
-            # Write the original line
-            if position in kpoints_dict:
-                current_label = kpoints_dict[position]
-                # Only write the label if it is not the same as the previous one
-                if current_label != last_label:
-                    fopen.write(f"{line_stripped} {current_label}\n") 
-                    last_label = current_label  # Update the last label
-                else:
-                    fopen.write(f"{line_stripped}\n")  
-            else:
-                fopen.write(f"{line_stripped}\n")  
-
-    fopen.truncate()  
-
-# Clean IBZKPT, remove the "Tetrahedra" section
-with open('../dos/IBZKPT', 'r') as ibzkpt_file:
-    lines = ibzkpt_file.readlines()
-
-# Remove lines starting from "Tetrahedra"
-cleaned_lines = []
-for line in lines:
-    if "Tetrahedra" in line:
-        break  
-    cleaned_lines.append(line)
-
-# Concatenate cleaned IBZKPT with kpoints.dat in KPOINTS file
-with open('KPOINTS', 'w') as output_file:
-   output_file.writelines(cleaned_lines)  
-   with open('kpoints.dat', 'r') as kpoints_data_file:
-      # Read the lines from kpoints.dat and add 3 spaces at the beginning
-      for kpoint_line in kpoints_data_file:
-          output_file.write('   ' + kpoint_line) 
-
-# Count lines in KPOINTS file and modify the second line
-with open('KPOINTS', 'r+') as output_file:
-    lines = output_file.readlines()
-    line_count = len(lines)  # Count the number of lines
-    
-    # Replace the value in the second line with line_count - 3
-    if len(lines) > 1:
-        lines[1] = str(line_count - 3) + "\n"  # Replace with the new value
-
-    # Write modified lines
-    output_file.seek(0)  # Go back to the start of the file
-    output_file.writelines(lines)
-    output_file.truncate()  # Ensure the file has the correct size
-
-print("The files were saved")
+"Each input is read only one time into arrays and the KPOINTS is written at once: \
+       ----> OUTCAR    ----> k-points of the path (block after 'k-points in reciprocal lattice and weights', see outcar_index.py) \
+       ----> KPOINTS   ----> labels of the line-mode KPOINTS (any lattice type), in a dictionary by rounded coordinates \
+       ----> IBZKPT    ----> k-points and weights of the SCF mesh (the Tetrahedra section is removed) \
+ The KPOINTS for HSE06 is the IBZKPT followed by the k-points of the path with zero weight, each label is written only in the first \
+ k-point of a group of k-points with the same label."
+"Usage: ----> kpoints.py                                      # ../../PBE/bs/OUTCAR, ../../PBE/bs/KPOINTS and ../dos/IBZKPT \
+        ----> kpoints.py --bs ../../PBE/bs --dos ../dos      # other folders \
+        ----> kpoints.py --split 8                            # split-01/KPOINTS ... split-08/KPOINTS \
+        ----> kpoints.py --chunk 20                           # split-XX/KPOINTS with 20 k-points of the path in each one \
+        ----> write_hse_kpoints('PBE/bs', 'HSE/dos', 'HSE/band/KPOINTS')  # from python, e.g. for many calculations"
+
+import os
+import argparse
+import numpy as np
+from outcar_index import scan_outcar, first
+
+"Split calculations (--split N or --chunk K): each split-XX/KPOINTS has the full IBZKPT (the SCF mesh is needed in every \
+ calculation) and a part of the path, so the band structure can be run as independent jobs. band.py and \
+ extract_k-path_energies_bandstructure.py join the split-XX/vasprun.xml files in one band structure."
+
+# Decimals of the coordinates used to find the labels (OUTCAR has 8 decimals, a KPOINTS usually has 5 or 6)
+DECIMALS = 4
+
+
+def coordinates_key(coordinates):
+    "Dictionary key of a k-point (adding 0.0 turns -0.0 into 0.0)"
+    return tuple(np.round(np.asarray(coordinates, dtype=float), DECIMALS) + 0.0)
+
+
+def read_path(outcar_file):
+    "k-points of the path (N, 3), from the OUTCAR of the band structure"
+    block = first(scan_outcar(outcar_file, ['k-points along lines']), 'k-points along lines')
+    if block is None:
+        raise ValueError(f"k-points of the path not found in {outcar_file}")
+    return np.array(block.split(), dtype=float).reshape(-1, 4)[:, :3]
+
+
+def read_labels(kpoints_file):
+    "Labels of a line-mode KPOINTS: {rounded coordinates: label}, the first label of each position is kept"
+    with open(kpoints_file) as file:
+        lines = file.read().splitlines()
+    if len(lines) < 4 or not lines[2].strip().lower().startswith('l'):
+        raise ValueError(f"{kpoints_file} is not a line-mode KPOINTS")
+    if lines[3].strip().lower().startswith(('c', 'k')):
+        raise ValueError(f"{kpoints_file} must use reciprocal coordinates to match the k-points of the OUTCAR")
+
+    labels = {}
+    for line in lines[4:]:
+        parts = line.replace('!', ' ').split()
+        if len(parts) < 4:
+            continue
+        try:
+            coordinates = coordinates_key(parts[:3])
+        except ValueError:
+            continue
+        labels.setdefault(coordinates, parts[3])
+    return labels
+
+
+def read_ibzkpt(ibzkpt_file):
+    "Comment, coordinates line (e.g. 'Reciprocal lattice'), k-points (N, 3) and weights (N) of the IBZKPT"
+    with open(ibzkpt_file) as file:
+        lines = file.read().splitlines()
+    n_kpoints = int(lines[1].split()[0])
+    table = np.array([line.split()[:4] for line in lines[3:3 + n_kpoints]], dtype=float).reshape(-1, 4)
+    return lines[0], lines[2], table[:, :3], table[:, 3]
+
+
+def path_labels(path, labels):
+    "Label of each k-point of the path, empty if the label is the same as the last label written"
+    result = []
+    last_label = None
+    for kpoint in path:
+        label = labels.get(coordinates_key(kpoint))
+        if label is not None and label != last_label:
+            result.append(label)
+            last_label = label
+        else:
+            result.append('')
+    return result
+
+
+def hse_kpoints(ibzkpt, path, labels):
+    "Text of the KPOINTS for HSE06: the k-points of the IBZKPT and the k-points of the path with zero weight"
+    comment, coordinates, kpoints, weights = ibzkpt
+    lines = [comment, str(len(kpoints) + len(path)), coordinates]
+    lines += [f"{x:20.14f}{y:20.14f}{z:20.14f}{weight:14.0f}" for (x, y, z), weight in zip(kpoints, weights)]
+    lines += [f"{x:13.8f}{y:12.8f}{z:12.8f}{0:8d}" + (f" {label}" if label else '')
+              for (x, y, z), label in zip(path, path_labels(path, labels))]
+    return '\n'.join(lines) + '\n'
+
+
+def split_path(n_kpoints, n_splits=None, chunk=None):
+    "Slices of the path for n_splits files of similar size, or for files with chunk k-points"
+    if chunk:
+        n_splits = -(-n_kpoints // chunk)
+    n_splits = max(1, min(n_splits or 1, n_kpoints))
+    bounds = np.linspace(0, n_kpoints, n_splits + 1).round().astype(int)
+    return [slice(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def write_hse_kpoints(bs_dir='../../PBE/bs', dos_dir='../dos', output='KPOINTS', n_splits=None, chunk=None):
+    "Read bs_dir/OUTCAR, bs_dir/KPOINTS and dos_dir/IBZKPT and write the KPOINTS for HSE06 (or split-XX/KPOINTS, next to output)"
+    path = read_path(os.path.join(bs_dir, 'OUTCAR'))
+    labels = read_labels(os.path.join(bs_dir, 'KPOINTS'))
+    ibzkpt = read_ibzkpt(os.path.join(dos_dir, 'IBZKPT'))
+
+    if not n_splits and not chunk:
+        with open(output, 'w') as file:
+            file.write(hse_kpoints(ibzkpt, path, labels))
+        return [output]
+
+    # The labels are found in the full path, so the split files have the same labels as the single file
+    lines = hse_kpoints(ibzkpt, path, labels).splitlines(keepends=True)
+    header, path_lines = lines[3:3 + len(ibzkpt[2])], lines[3 + len(ibzkpt[2]):]
+    parts = split_path(len(path), n_splits, chunk)
+    width = max(2, len(str(len(parts))))
+    outputs = []
+    for number, part in enumerate(parts, start=1):
+        split_output = os.path.join(os.path.dirname(output), f"split-{number:0{width}d}", os.path.basename(output))
+        os.makedirs(os.path.dirname(split_output), exist_ok=True)
+        with open(split_output, 'w') as file:
+            file.write(f"{ibzkpt[0]}\n{len(ibzkpt[2]) + part.stop - part.start}\n{ibzkpt[1]}\n")
+            file.writelines(header + path_lines[part])
+        outputs.append(split_output)
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the KPOINTS for HSE06 band structures from the PBE band structure and the IBZKPT.")
+    parser.add_argument('--bs', default='../../PBE/bs', help="Folder of the PBE band structure with OUTCAR and the line-mode KPOINTS (default: ../../PBE/bs)")
+    parser.add_argument('--dos', default='../dos', help="Folder with the IBZKPT (default: ../dos)")
+    parser.add_argument('--output', default='KPOINTS', help="Output file (default: KPOINTS)")
+    split = parser.add_mutually_exclusive_group()
+    split.add_argument('--split', type=int, default=None, metavar='N', help="Write N files split-XX/KPOINTS, each one with the IBZKPT and a part of the path")
+    split.add_argument('--chunk', type=int, default=None, metavar='K', help="Write split-XX/KPOINTS files with K k-points of the path in each one")
+    args = parser.parse_args()
+
+    outputs = write_hse_kpoints(args.bs, args.dos, args.output, args.split, args.chunk)
+    print("The files were saved" if len(outputs) == 1 else f"The files were saved in {len(outputs)} folders split-XX")
+
+
+if __name__ == '__main__':
+    main()
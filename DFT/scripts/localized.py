@@ -2,16 +2,13 @@
 # Written by Joseph P.Vera
 # 2024-11
 
-import xml.etree.ElementTree as ET
 import os
 import argparse
-
-tree = ET.parse('vasprun.xml')
-root = tree.getroot()
-
-# variables
-VBM = 7.2945
-CBM = 11.7449
+from functools import partial
+import numpy as np
+from vasprun_reader import load_vasprun
+from batch import add_batch_arguments, discover_dirs, run_batch
+from band_edges import resolve_band, resolve_bands
 
 "Code use information from vasprun.xml file"
 
@@ -19,349 +16,202 @@ CBM = 11.7449
         ----> localized.py --occ           # only occupied sates within the the band gap, if they exist at all \
         ----> localized.py --nocc          # only unoccupied sates within the the band gap, if they exist at all \
         ----> localized.py --pocc          # only partially occupied sates within the the band gap, if they exist at all \
-        ----> localized.py --band 5.4 11.3 # Modify the VBM and CBM"
+        ----> localized.py --band 5.4 11.3 # Modify the VBM and CBM (by default: VBM and CBM of ../perfect) \
+        ----> localized.py --dirs          # Batch mode, all the defect folders under the current folder (see batch.py)"
         
-"There are three sub codes:  \
-       ----> The first code is used to find the values of spin, kpoints, and bands. \
-       ----> The second code parse the vasprun.xml file (EIGENVAL information) and sort the information about Spin up, kpoint (up), band (up), Spin down \
-              kpoint (down) and band (down), only filters energy values (column 1) between VBM and CBM following the break of 1.000 \
-              in the column 2 (when continuity of 1.00 is broken)(HOMO-LUMO transition). That information is store in lists as band_index_list_up, \
-              kpoint_list_up, spin_list_up, band_index_list_down, kpoint_list_down and spin_list_down. \
-       ----> The third code use the band_index_list_up, kpoint_list_up, spin_list_up, band_index_list_down, kpoint_list_down and spin_list_down lists \
-              and parse each value of the list for get the desired information."    
- 
+"The states are found with array operations over eigenvalues[spin, kpoint, band] and projected[spin, kpoint, band, ion, orbital]:  \
+       ----> find_breaks: the HOMO-LUMO transition, where the continuity of 1.00 in the occupancy is broken (one break per spin and kpoint, \
+              or more if the occupancy goes back to 1.00). \
+       ----> find_states: boolean masks for the bands within 500 bands of each break and between VBM and CBM, the occupancy labels \
+              (np.select) and the filter options. The result are the arrays spin_index, kpoint_index and band_index of the selected states. \
+       ----> ion_totals: s + p + d of each ion for all the selected states at once, only the ions with tot > 0.1 are written."    
  
-# Parse commands arguments for filter options
-parser = argparse.ArgumentParser(description="Parse EIGENVAL and vasprun.xml files with optional filtering by occupancy label.")
-parser.add_argument('--occ', action='store_true', help="Save only Occupied values")
-parser.add_argument('--nocc', action='store_true', help="Save only Unoccupied values")
-parser.add_argument('--pocc', action='store_true', help="Save only Partially Occupied values")
-parser.add_argument('--band', nargs=2, type=float, default=[VBM, CBM], help="Specifies the values ​​for VBM and CBM. By default: VBM=7.2945 and CBM=11.7449")
-args = parser.parse_args()
-vbm, cbm = args.band
-
-# Define filtering options based on arguments
-filter_occupancy = []
-if args.occ:
-    filter_occupancy.append("Occupied")
-if args.nocc:
-    filter_occupancy.append("Unoccupied")
-if args.pocc:
-    filter_occupancy.append("Partially Occupied")
-    
-
-# Find the spin numbers, kpoint, and band in vasprun.xml
-spin_numbers = []
-kpoint_numbers = []
-band_numbers = []
-
-# Find the spin numbers
-for spin_set in root.findall(".//set"):
-    comment = spin_set.get('comment')
-    if comment and comment.startswith('spin'):
-        spin_number = int(comment.replace('spin', ''))
-        if spin_number not in spin_numbers:
-            spin_numbers.append(spin_number)
-
-# Find the kpoint numbers
-for spin_number in spin_numbers:
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-    if spin_set is not None:
-        for kpoint_set in spin_set.findall(".//set"):
-            comment = kpoint_set.get('comment')
-            if comment and comment.startswith('kpoint'):
-                kpoint_number = int(comment.replace('kpoint ', ''))
-                if kpoint_number not in kpoint_numbers:
-                    kpoint_numbers.append(kpoint_number)
-
-# Find the band numbers
-for spin_number in spin_numbers:
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-    if spin_set is not None:
-        for kpoint_number in kpoint_numbers:
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-            if kpoint_block is not None:
-                for band_set in kpoint_block.findall(".//set"):
-                    comment = band_set.get('comment')
-                    if comment and comment.startswith('band'):
-                        band_number = int(comment.replace('band ', ''))
-                        if band_number not in band_numbers:
-                            band_numbers.append(band_number)
-
-#print("List of spin_numbers:", spin_numbers)
-#print("List of kpoint_numbers:", kpoint_numbers)
-#print("List of band_numbers:", band_numbers)
-
-
-"Parsing the vasprun.xml for get information same to EIGENVAL file"
-# Initialize lists to store information
-energy_values = []
-occupancy_list = []
-occupation_status = {}
-
-band_index_list_up = []
-kpoint_list_up = []
-spin_list_up = []
-
-band_index_list_down = []
-kpoint_list_down = []
-spin_list_down = []
-
-eigen_val = []  
-for spin_number in spin_numbers:
-    occupation_status[spin_number] = {}  # Add key for each spin
-
-    # Store the section header for each spin in the eigen_val list
-    eigen_val.append("###########################################################")
-    eigen_val.append(f"                           {'SPIN UP' if spin_number == 1 else 'SPIN DOWN'}                     ")
-    eigen_val.append("###########################################################")
-    
-    for kpoint_number in kpoint_numbers:
-        spin_set = root.find(f".//set[@comment='spin {spin_number}']")
-        if spin_set is not None:
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-            if kpoint_block is not None:
-                block_values, block_occu, block_status, band_indices = [], [], [], []
-
-                for band_index, child in enumerate(kpoint_block, 1):
-                    if child.text:
-                        columns = child.text.split()
-                        if len(columns) >= 2:
-                            energy = float(columns[0])
-                            occupancy = float(columns[1])
-                            # Determine occupancy status
-                            if occupancy == 1.0:
-                                status = "Occupied"
-                            elif occupancy > 0.9:
-                                status = "Occupied"
-                            elif occupancy < 0.1:
-                                status = "Unoccupied"
-                            else:
-                                status = "Partially Occupied"
-
-                            # Store values
-                            block_values.append(energy)
-                            block_occu.append(occupancy)
-                            block_status.append((energy, status))
-                            band_indices.append(band_index)
-
-                if block_values: energy_values.append(block_values)
-                if block_occu: occupancy_list.append(block_occu)
-                if block_status:
-                    occupation_status[spin_number][kpoint_number] = block_status
-
-                for idx in range(1, len(block_occu)):
-                    if block_occu[idx - 1] == 1.0 and block_occu[idx] < 1.0:
-                        start_idx = max(idx - 500, 0)
-                        end_idx = min(idx + 500, len(block_occu))
-                        energies_in_range = block_values[start_idx:end_idx]
-                        occupancies_in_range = block_occu[start_idx:end_idx]
-                        indices_in_range = band_indices[start_idx:end_idx]
-
-                        eigen_val.append("###########################################################")
-                        eigen_val.append(f"                          kpoint {kpoint_number}                   ")
-                        eigen_val.append("###########################################################")
-                        eigen_val.append(f"{'Band':<10} {'Energy':<14} {'Occ':<10} {'Occupancy'}")
-
-                        for band_index, (energy, occupancy) in zip(indices_in_range, zip(energies_in_range, occupancies_in_range)):
-                            if vbm <= energy <= cbm:
-                                label = "Occupied" if occupancy > 0.9 else "Unoccupied" if occupancy < 0.1 else "Partially Occupied"
-                                
-                                # Apply filter if set
-                                if not filter_occupancy or label in filter_occupancy:
-                                    if spin_number == 1:
-                                        band_index_list_up.append(band_index)
-                                        kpoint_list_up.append(kpoint_number)
-                                        spin_list_up.append(spin_number)
-                                    elif spin_number == 2:
-                                        band_index_list_down.append(band_index)
-                                        kpoint_list_down.append(kpoint_number)
-                                        spin_list_down.append(spin_number)
-                                    
-                                    eigen_val.append(f"{band_index:<10} {energy:<14.6f} {occupancy:<10.6f} {label}")
-            else:
-                print(f"Block 'kpoint {kpoint_number}' not found in 'spin {spin_number}'.")
-        else:
-            print(f"Superblock 'spin {spin_number}' not found.")
-
-    if spin_number == 1:
-        eigen_val.append("\n")
-                
-print("Spin Up - Band index list:", band_index_list_up)
-print("Spin Up - kpoint list:", kpoint_list_up)
-print("Spin Up - Spin list:", spin_list_up)
-
-print("Spin Down - Band index list:", band_index_list_down)
-print("Spin Down - kpoint list:", kpoint_list_down)
-print("Spin Down - Spin list:", spin_list_down)
-print("################################################################################")
-
-
-"Parsing the vasprun.xml file using the band_index_list_up, kpoint_list_up, spin_list_up, band_index_list_down, \
- kpoint_list_down lists and spin_list_down as inputs."
  
-vasprun_val = []
-# Spin Up Analysis
-if band_index_list_up and kpoint_list_up and spin_list_up:
-    vasprun_val.append("########################################################################")
-    vasprun_val.append("                               SPIN UP                                  ")
-    vasprun_val.append("########################################################################")
-
-    # Group information by k-point
-    current_kpoint = None
-    band_info = []
-
-    for i in range(len(band_index_list_up)):
-        spin_number = spin_list_up[i]        # input
-        kpoint_number = kpoint_list_up[i]    # input
-        band_number = band_index_list_up[i]  # input
-
-        # Find the spin up (1) superblock
-        spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-
-        if spin_set is not None:
-            # Find the block corresponding to the kpoint
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-
-            if kpoint_block is not None:
-                # If we are in a different k-point from the previous one, write the accumulated information
-                if current_kpoint != kpoint_number:
-                    if band_info:
-                        # Write accumulated information of the previous k-point
-                        vasprun_val.append("\n########################################################################")
-                        vasprun_val.append(f"                               KPOINT {current_kpoint}                             ")
-                        vasprun_val.append("########################################################################")
-                        vasprun_val.extend(band_info)
-
-                        band_info = []  # Reset for the next k-point
-
-                    current_kpoint = kpoint_number  # Update the current k-point
-
-                # Process the bands for this k-point
-                band_subblock = kpoint_block.find(f".//set[@comment='band {band_number}']")
-
-                if band_subblock is not None:
-                    band_info.append(f"\nInformation of {band_subblock.attrib['comment']}:")
-                    band_info.append(f"{'index':<6} {'s':<10} {'p':<10} {'d':<10} {'tot':<10}")
-
-                    # Add information of the band
-                    for j, child in enumerate(band_subblock):
-                        columns = child.text.split()
-                        total_sum = sum(float(value) for value in columns)
-
-                        # Set the decimals
-                        formatted_values = [f"{float(value):.3f}" for value in columns]
-                        formatted_sum = f"{total_sum:.3f}"
-
-                        # Only print if the total (s+p+d) is greater than 0.1
-                        if float(formatted_sum) > 0.1:
-                            band_info.append(f"{j + 1:<6} {formatted_values[0]:<10} {formatted_values[1]:<10} {formatted_values[2]:<10} {formatted_sum:<10}")
-                else:
-                    band_info.append(f"Subblock 'band {band_number}' not found in 'kpoint {kpoint_number}'.\n")
-
-    # Write the information of the last k-point if it exists
-    if band_info:
-        vasprun_val.append("\n########################################################################")
-        vasprun_val.append(f"                               KPOINT {current_kpoint}                             ")
+# Number of bands taken before and after the HOMO-LUMO transition
+WINDOW = 500
+
+# Only the ions with tot > 0.1 (after rounding tot to 3 decimals, i.e. tot >= 0.1005) are written
+CUTOFF = 0.1005
+
+LABELS = np.array(["Occupied", "Unoccupied", "Partially Occupied"])
+
+def occupancy_labels(occupancy):
+    "Occupied (> 0.9), Unoccupied (< 0.1) or Partially Occupied"
+    return LABELS[np.select([occupancy > 0.9, occupancy < 0.1], [0, 1], 2)]
+
+def find_breaks(occupancy):
+    "HOMO-LUMO transitions, occupancy[band - 1] == 1.0 and occupancy[band] < 1.0. Return the arrays (spin, kpoint, band) of each break"
+    is_break = (occupancy[..., :-1] == 1.0) & (occupancy[..., 1:] < 1.0)
+    spin, kpoint, band = np.nonzero(is_break)
+    return spin, kpoint, band + 1
+
+def find_states(eigenvalues, vbm, cbm, filter_occupancy):
+    "Select the states between VBM and CBM within WINDOW bands of each break. Return the break arrays and the selected (break, band) pairs"
+    energy, occupancy = eigenvalues[..., 0], eigenvalues[..., 1]
+    selected = (energy >= vbm) & (energy <= cbm)
+    if filter_occupancy:
+        selected &= np.isin(occupancy_labels(occupancy), filter_occupancy)
+
+    break_spin, break_kpoint, break_band = find_breaks(occupancy)
+
+    # window[break, band]: bands in [break - WINDOW, break + WINDOW)
+    bands = np.arange(eigenvalues.shape[2])
+    window = (bands >= break_band[:, None] - WINDOW) & (bands < break_band[:, None] + WINDOW)
+    window &= selected[break_spin, break_kpoint]
+
+    # States in the order of the report: spin, kpoint, break and band. A state can appear twice if the windows overlap
+    state_break, state_band = np.nonzero(window)
+    return (break_spin, break_kpoint), (state_break, state_band)
+
+def ion_totals(projected, spin_index, kpoint_index, band_index):
+    "Orbitals and tot (sum of the orbitals) of each ion for the selected states"
+    rows = projected[spin_index, kpoint_index, band_index]          # rows[state, ion, orbital]
+    return rows, rows.sum(axis=-1)
+
+
+
+def folder_of(directory):
+    "Name of the defect folder (e.g. V_B_0)"
+    return os.path.basename(os.path.abspath(directory))
+
+def output_path(directory):
+    "localized-defects/<folder_name>/Data/localized_<folder_name>.dat inside the defect folder"
+    folder_name = folder_of(directory)
+    return os.path.join(directory, 'localized-defects', folder_name, 'Data', f'localized_{folder_name}.dat')
+
+def write_localized(directory, band, filter_occupancy, verbose=False):
+    "Find the localized states of the calculation in directory and write localized_<folder_name>.dat"
+    vbm, cbm = resolve_band(band, directory)
+    data = load_vasprun(os.path.join(directory, 'vasprun.xml'))
+    eigenvalues = data['eigenvalues']    # eigenvalues[spin, kpoint, band, (energy, occupancy)]
+    projected = data['projected']        # projected[spin, kpoint, band, ion, orbital]
+
+    (break_spin, break_kpoint), (state_break, state_band) = find_states(eigenvalues, vbm, cbm, filter_occupancy)
+    state_spin = break_spin[state_break]
+    state_kpoint = break_kpoint[state_break]
+
+    energy = eigenvalues[state_spin, state_kpoint, state_band, 0]
+    occupancy = eigenvalues[state_spin, state_kpoint, state_band, 1]
+    labels = occupancy_labels(occupancy)
+
+    if verbose:
+        for spin, name in ((0, "Up"), (1, "Down")):
+            mask = state_spin == spin
+            print(f"Spin {name} - Band index list:", (state_band[mask] + 1).tolist())
+            print(f"Spin {name} - kpoint list:", (state_kpoint[mask] + 1).tolist())
+            print(f"Spin {name} - Spin list:", (state_spin[mask] + 1).tolist())
+        print("################################################################################")
+
+
+    "vasprun.xml (EIGENVAL information): selected states of each break"
+    eigen_val = []
+    for spin in range(eigenvalues.shape[0]):
+        eigen_val.append("###########################################################")
+        eigen_val.append(f"                           {'SPIN UP' if spin == 0 else 'SPIN DOWN'}                     ")
+        eigen_val.append("###########################################################")
+
+        for i in np.flatnonzero(break_spin == spin):
+            eigen_val.append("###########################################################")
+            eigen_val.append(f"                          kpoint {break_kpoint[i] + 1}                   ")
+            eigen_val.append("###########################################################")
+            eigen_val.append(f"{'Band':<10} {'Energy':<14} {'Occ':<10} {'Occupancy'}")
+            for j in np.flatnonzero(state_break == i):
+                eigen_val.append(f"{state_band[j] + 1:<10} {energy[j]:<14.6f} {occupancy[j]:<10.6f} {labels[j]}")
+
+        if spin == 0:
+            eigen_val.append("\n")
+
+
+    "vasprun.xml (PROCAR information): s, p, d and tot of the ions with tot > 0.1 for each selected state"
+    orbitals, totals = ion_totals(projected, state_spin, state_kpoint, state_band)
+
+    vasprun_val = []
+    for spin, title in ((0, "SPIN UP"), (1, "SPIN DOWN")):
+        states = np.flatnonzero(state_spin == spin)
+        if states.size == 0:
+            continue
+        if spin == 1:
+            vasprun_val.append("\n\n\n")
+
         vasprun_val.append("########################################################################")
-        vasprun_val.extend(band_info)
-
-# Spin Down Analysis
-if band_index_list_down and kpoint_list_down and spin_list_down:
-    vasprun_val.append("\n\n\n")
-    vasprun_val.append("########################################################################")
-    vasprun_val.append("                               SPIN DOWN                                ")
-    vasprun_val.append("########################################################################")
-
-    # Group information by k-point
-    current_kpoint = None
-    band_info = []
-
-    for i in range(len(band_index_list_down)):
-        spin_number = spin_list_down[i]        # input
-        kpoint_number = kpoint_list_down[i]    # input
-        band_number = band_index_list_down[i]  # input
-
-        # Find the spin down (2) superblock
-        spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-
-        if spin_set is not None:
-            # Find the block corresponding to the kpoint
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-
-            if kpoint_block is not None:
-                # If we are in a different k-point from the previous one, write the accumulated information
-                if current_kpoint != kpoint_number:
-                    if band_info:
-                        # Write accumulated information of the previous k-point
-                        vasprun_val.append("\n########################################################################")
-                        vasprun_val.append(f"                               KPOINT {current_kpoint}                             ")
-                        vasprun_val.append("########################################################################")
-                        vasprun_val.extend(band_info)
-                        band_info = []  # Reset for the next k-point
-
-                    current_kpoint = kpoint_number  # Update the current k-point
-
-                # Process the bands for this k-point
-                band_subblock = kpoint_block.find(f".//set[@comment='band {band_number}']")
-
-                if band_subblock is not None:
-                    band_info.append(f"\nInformation of {band_subblock.attrib['comment']}:")
-                    band_info.append(f"{'index':<6} {'s':<10} {'p':<10} {'d':<10} {'tot':<10}")
-
-                    # Add information of the band
-                    for j, child in enumerate(band_subblock):
-                        columns = child.text.split()
-                        total_sum = sum(float(value) for value in columns)
-
-                        # Set the decimals
-                        formatted_values = [f"{float(value):.3f}" for value in columns]
-                        formatted_sum = f"{total_sum:.3f}"
-
-                        # Only print if the total is greater than 0.1
-                        if float(formatted_sum) > 0.1:
-                            band_info.append(f"{j + 1:<6} {formatted_values[0]:<10} {formatted_values[1]:<10} {formatted_values[2]:<10} {formatted_sum:<10}")
-                else:
-                    band_info.append(f"Subblock 'band {band_number}' not found in 'kpoint {kpoint_number}'.\n")
-
-    # Write the information of the last k-point if it exists
-    if band_info:
-        vasprun_val.append("\n########################################################################")
-        vasprun_val.append(f"                               KPOINT {current_kpoint}                             ")
+        vasprun_val.append(f"                               {title:<41}")
         vasprun_val.append("########################################################################")
-        vasprun_val.extend(band_info)
-
-# Extract folder name from current directory
-folder_name = os.path.basename(os.getcwd())
-
-# Create 'localized' folder
-localized_folder = f'localized-defects/{folder_name}/Data'
-if not os.path.exists(localized_folder):
-    os.makedirs(localized_folder)
-
-# Save the results in localized_{folder_name}.dat
-output_file = os.path.join(localized_folder, f'localized_{folder_name}.dat')
-
-with open(output_file, 'w') as combined_file:
-    # Write basic information about the defect
-    combined_file.write(f"Defect: {folder_name}\n")
-    combined_file.write(f"\nVBM = {vbm} eV\n")  # Replace vbm with actual value
-    combined_file.write(f"CBM = {cbm} eV\n\n\n")
-    combined_file.write("###########################################################\n")
-    combined_file.write("           vasprun.xml file (EIGENVAL information)                            \n")
-    combined_file.write("###########################################################\n")
-    
-    # Write eigen_val content
-    for val in eigen_val:
-        combined_file.write(f"{val}\n")
-
-    # Optionally add a separator for clarity
-    combined_file.write("\n\n\n\n########################################################################\n")
-    combined_file.write("                  vasprun.xml file (PROCAR information)\n")
-    combined_file.write("########################################################################\n")
-    
-    # Write vasprun_val content
-    for val in vasprun_val:
-        combined_file.write(f"{val}\n")
-
-print(f"The localized_{folder_name}.dat file has been created.")
+
+        current_kpoint = None
+        for j in states:
+            # Header each time the k-point changes
+            if state_kpoint[j] != current_kpoint:
+                current_kpoint = state_kpoint[j]
+                vasprun_val.append("\n########################################################################")
+                vasprun_val.append(f"                               KPOINT {current_kpoint + 1}                             ")
+                vasprun_val.append("########################################################################")
+
+            vasprun_val.append(f"\nInformation of band {state_band[j] + 1}:")
+            vasprun_val.append(f"{'index':<6} {'s':<10} {'p':<10} {'d':<10} {'tot':<10}")
+            for ion in np.flatnonzero(totals[j] >= CUTOFF):
+                s, p, d = orbitals[j, ion, :3]
+                vasprun_val.append(f"{ion + 1:<6} {s:<10.3f} {p:<10.3f} {d:<10.3f} {totals[j, ion]:<10.3f}")
+
+    # Save the results in localized-defects/{folder_name}/Data/localized_{folder_name}.dat
+    folder_name = folder_of(directory)
+    output_file = output_path(directory)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+    with open(output_file, 'w') as combined_file:
+        # Write basic information about the defect
+        combined_file.write(f"Defect: {folder_name}\n")
+        combined_file.write(f"\nVBM = {vbm} eV\n")  # Replace vbm with actual value
+        combined_file.write(f"CBM = {cbm} eV\n\n\n")
+        combined_file.write("###########################################################\n")
+        combined_file.write("           vasprun.xml file (EIGENVAL information)                            \n")
+        combined_file.write("###########################################################\n")
+
+        # Write eigen_val content
+        for val in eigen_val:
+            combined_file.write(f"{val}\n")
+
+        # Optionally add a separator for clarity
+        combined_file.write("\n\n\n\n########################################################################\n")
+        combined_file.write("                  vasprun.xml file (PROCAR information)\n")
+        combined_file.write("########################################################################\n")
+
+        # Write vasprun_val content
+        for val in vasprun_val:
+            combined_file.write(f"{val}\n")
+
+    if verbose:
+        print(f"The localized_{folder_name}.dat file has been created.")
+    return output_file
+
+
+def main():
+    # Parse commands arguments for filter options
+    parser = argparse.ArgumentParser(description="Parse EIGENVAL and vasprun.xml files with optional filtering by occupancy label.")
+    parser.add_argument('--occ', action='store_true', help="Save only Occupied values")
+    parser.add_argument('--nocc', action='store_true', help="Save only Unoccupied values")
+    parser.add_argument('--pocc', action='store_true', help="Save only Partially Occupied values")
+    parser.add_argument('--band', nargs=2, type=float, default=None, help="Specifies the values ​​for VBM and CBM. By default: VBM and CBM of ../perfect (see band_edges.py)")
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    # Define filtering options based on arguments
+    filter_occupancy = []
+    if args.occ:
+        filter_occupancy.append("Occupied")
+    if args.nocc:
+        filter_occupancy.append("Unoccupied")
+    if args.pocc:
+        filter_occupancy.append("Partially Occupied")
+
+    if args.dirs is None:
+        write_localized('.', args.band, filter_occupancy, verbose=True)
+    else:
+        dirs = discover_dirs(args.dirs, ['vasprun.xml'])
+        edges = resolve_bands(args.band, dirs)
+        task = partial(write_localized, band=edges, filter_occupancy=filter_occupancy)
+        run_batch(task, dirs, inputs=lambda d: [os.path.join(d, 'vasprun.xml')], outputs=lambda d: [output_path(d)],
+                  workers=args.workers, force=args.force, root=args.dirs, name='localized',
+                  options=lambda d: {'band': edges[d], 'filter': filter_occupancy})
+
+if __name__ == '__main__':
+    main()
@@ -2,269 +2,178 @@
 # Written by Joseph P.Vera
 # 2024-11
 
-import xml.etree.ElementTree as ET
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import os
-from io import StringIO
+import glob
 import argparse
-
-tree = ET.parse('vasprun.xml')
-root = tree.getroot()
-
-# variables
-VBM = 7.2945
-CBM = 11.7449
+from functools import partial
+from vasprun_reader import load_vasprun
+from batch import add_batch_arguments, discover_dirs, run_batch, is_up_to_date
+from band_edges import resolve_band, resolve_bands
 
 "Code for plot the localized defects. Default Energy versus sum of the 5 heaviest values from tot (each band) (check PROCAR). "
 
-"Usage: ----> locplot.py                 # By default: VBM=7.2945 and CBM=11.7449 \
+"Usage: ----> locplot.py                 # By default: VBM and CBM of ../perfect (see band_edges.py) \
         ----> locplot.py --band 0.9 15.2 # Modify the VBM and CBM \
-        ----> locplot.py --tot           # Modify to use the column tot (s + p + d): Energies versus tot"
-
-        
-parser = argparse.ArgumentParser(description="Modify the VBM and CBM.")
-parser.add_argument('--band', nargs=2, type=float, default=[VBM, CBM], help="Specifies the values ​​for VBM and CBM. By default: VBM=7.2945 and CBM=11.7449")
-parser.add_argument("--tot", action="store_true", help="Use column 3 instead of column 4 in the subset.")
-args = parser.parse_args()
-vbm, cbm = args.band
-
-# Find the spin numbers, kpoint and band in vasprun.xml
-spin_numbers = []
-kpoint_numbers = []
-band_numbers = []
-
-# Find the spin numbers
-for spin_set in root.findall(".//set"):
-    comment = spin_set.get('comment')
-    if comment and comment.startswith('spin'):
-        spin_number = int(comment.replace('spin', ''))
-        if spin_number not in spin_numbers:
-            spin_numbers.append(spin_number)
-
-# Find the kpoint numbers
-for spin_number in spin_numbers:
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-    if spin_set is not None:
-        for kpoint_set in spin_set.findall(".//set"):
-            comment = kpoint_set.get('comment')
-            if comment and comment.startswith('kpoint'):
-                kpoint_number = int(comment.replace('kpoint ', ''))
-                if kpoint_number not in kpoint_numbers:
-                    kpoint_numbers.append(kpoint_number)
-
-# Find the band numbers
-for spin_number in spin_numbers:
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-    if spin_set is not None:
-        for kpoint_number in kpoint_numbers:
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-            if kpoint_block is not None:
-                for band_set in kpoint_block.findall(".//set"):
-                    comment = band_set.get('comment')
-                    if comment and comment.startswith('band'):
-                        band_number = int(comment.replace('band ', ''))
-                        if band_number not in band_numbers:
-                            band_numbers.append(band_number)
-
-#print("Lista de spin_numbers:", spin_numbers)
-#print("Lista de kpoint_numbers:", kpoint_numbers)
-#print("Lista de band_numbers:", band_numbers)
-
-
-# Store
-results = []
-
-results.append(f"{'Spin':<6} {'k-point':<10} {'Band':<10} {'tot':<10} {'sum':<10}")
-
-# Iterate through lists of inputs spin numbers, kpoint and band (s, p and d orbitals)
-for spin_number in spin_numbers:
-    # Find the superblock. key word ---> <set comment="spin1"> 
-    spin_set = root.find(f".//set[@comment='spin{spin_number}']")
-
-    if spin_set is not None:
-        for kpoint_number in kpoint_numbers:
-            # find the block. key word ---> <set comment="kpoint 1">  
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']")
-            
-            if kpoint_block is not None:
-                for band_number in band_numbers:
-                    # find subblocks for sum the value and find the tot column and also compute the sum of the 5 biggest numbers of each band. key word ---> <set comment="band 1">
-                    band_subblock = kpoint_block.find(f".//set[@comment='band {band_number}']")
-                    
-                    if band_subblock is not None:
-                        total_sum = 0.0  # total sum
-                        tot_values = []  # store tot
-                        
-                        # subblock
-                        for i, child in enumerate(band_subblock):
-                            # get the values of the columns
-                            columns = child.text.split()
-                            
-                            # Convert to float to calculate the sum
-                            total = float(columns[0]) + float(columns[1]) + float(columns[2])  
-                            total_sum += total  # total sum
-                            tot_values.append(total) 
-                            
-                        # Calculate the sum of the 5 values ​​closest to 1 (the sum of the 5 biggest numbers of each band)
-                        closest_to_one = sorted(tot_values, key=lambda x: abs(x - 1))[:5]
-                        closest_sum = sum(closest_to_one)
-                        
-                        results.append(f"{spin_number:<6} {kpoint_number:<10} {band_number:<10} {total_sum:<10.3f} {closest_sum:<10.3f}")
-                        
-                    else:
-                        print(f"Subblock 'band {band_number}' not found in 'kpoint {kpoint_number}'.")
-            else:
-                print(f"Block 'kpoint {kpoint_number}' not found in 'spin{spin_number}'.")
-    else:
-        print(f"Superblock 'spin{spin_number}' not found.")
-
-# energy and occupancy
-energy_values = []
-occupancy_list = []
-for spin_number in spin_numbers:
-    for kpoint_number in kpoint_numbers:
-        # spin superblock
-        spin_set = root.find(f".//set[@comment='spin {spin_number}']")  # key word ---> <set comment="spin 1"> before to <set comment="kpoint 1">
-        
-        if spin_set is not None:
-            # kpoint block
-            kpoint_block = spin_set.find(f".//set[@comment='kpoint {kpoint_number}']") # key word ---> <set comment="kpoint 1"> after to <set comment="spin 1"> 
-            
-            if kpoint_block is not None:
-                block_values = []  # temporal list to the energy
-                block_occu = [] # temporal list to the occupancy
-                for child in kpoint_block:
-                    if child.text:
-                        columns = child.text.split()
-                        if len(columns) >= 2:
-                            block_values.append(float(columns[0]))  
-                            block_occu.append(float(columns[1]))
-                if block_values: 
-                    energy_values.append(block_values)
-                if block_occu:
-                    occupancy_list.append(block_occu)
-                    
-            else:
-                print(f"Block 'kpoint {kpoint_number}' not found in 'spin {spin_number}'.") # dont confuse with the others blocks
-        else:
-            print(f"Superblock 'spin {spin_number}' not found.") # dont confuse with the others superblocks
-
-# Create the total list by combining results and energy_values
-total_results = []
-for i, result in enumerate(results):
-    if i == 0:
-        total_results.append(f"{result:<10} {'Energy':<10} {'Occ':<10}")
-    else:
-        block_index = (i - 1) // len(band_numbers)  
-        row_index = (i - 1) % len(band_numbers)  
-        energy_value = energy_values[block_index][row_index] if block_index < len(energy_values) and row_index < len(energy_values[block_index]) else ''
-        occupancy_value = occupancy_list[block_index][row_index] if block_index < len(occupancy_list) and row_index < len(occupancy_list[block_index]) else ''
-        total_results.append(f"{result:<10} {energy_value:<10.3f} {occupancy_value:<10.3f}")
-        
-        
-        # Blank line between blocks
-        if row_index == len(band_numbers) - 1 and block_index < len(energy_values) - 1:
-            total_results.append("")
-
-# store final results
-final_result = []
-for total in total_results:
-    final_result.append(total)
-
-# for total in final_result:
-#     print(total)
-
-def plot_localized(final_result, spin_numbers, kpoint_numbers):
-    folder_name = os.path.basename(os.getcwd())
-    localized_folder = f'localized-defects/{folder_name}/Figures'
-    if not os.path.exists(localized_folder):
-        os.makedirs(localized_folder)
-
-    content = '\n'.join(final_result[1:])
-    blocks = content.strip().split('\n\n')
-
-    if len(spin_numbers) == 0 or len(kpoint_numbers) == 0:
+        ----> locplot.py --tot           # Modify to use the column tot (s + p + d): Energies versus tot \
+        ----> locplot.py --dirs          # Batch mode, all the defect folders under the current folder (see batch.py) \
+        ----> locplot.py --txt           # Also write the table as text \
+        ----> locplot.py --top 3         # Sum of the 3 values of tot closest to 1 (default: 5)"
+
+"The table (spin, kpoint, band, tot, sum, energy, occupancy) is computed once per folder and saved as a NumPy structured array in \
+ localized-defects/<folder_name>/Data/localization_<folder_name>.npy, the next runs (and other analysis, np.load) use this file \
+ while it is newer than vasprun.xml (--force to compute it again). The text table is only written with --txt."
+"The columns are computed for all the bands at once: tot of each ion is the reduction s + p + d of projected[spin, kpoint, band, ion], \
+ and the k values closest to 1 are selected with np.argpartition along the ion axis (no sort of each band)."
+
+
+# Number of values of tot closest to 1 in the column sum
+TOP = 5
+
+# Columns of the localization table, one row per spin, kpoint and band
+TABLE_DTYPE = np.dtype([('spin', 'i4'), ('kpoint', 'i4'), ('band', 'i4'), ('tot', 'f8'), ('sum', 'f8'), ('energy', 'f8'), ('occupancy', 'f8')])
+
+COLORS = np.array(['blue', 'red', 'green'])
+
+def closest_to_one_sum(tot_values, k=TOP):
+    "Sum of the k values closest to 1 along the last axis (ions), for all the bands at once"
+    k = min(k, tot_values.shape[-1])
+    if k <= 0:
+        return np.zeros(tot_values.shape[:-1])
+    nearest = np.argpartition(np.abs(tot_values - 1), k - 1, axis=-1)[..., :k]
+    return np.take_along_axis(tot_values, nearest, axis=-1).sum(axis=-1)
+
+def localization_table(eigenvalues, projected, k=TOP):
+    "Structured array with spin, kpoint, band, tot, sum, energy and occupancy (rows in the order spin, kpoint, band)"
+    n_spins, n_kpoints, n_bands = eigenvalues.shape[:3]
+    table = np.empty((n_spins, n_kpoints, n_bands), dtype=TABLE_DTYPE)
+    table['spin'], table['kpoint'], table['band'] = np.meshgrid(np.arange(1, n_spins + 1), np.arange(1, n_kpoints + 1),
+                                                                np.arange(1, n_bands + 1), indexing='ij')
+
+    # s + p + d for each ion, and the total sum of each band
+    tot_values = projected[..., :3].sum(axis=-1)          # tot_values[spin, kpoint, band, ion]
+    table['tot'] = tot_values.sum(axis=-1)
+
+    # Calculate the sum of the k values closest to 1 (the sum of the k biggest numbers of each band)
+    table['sum'] = closest_to_one_sum(tot_values, k)
+
+    table['energy'] = eigenvalues[..., 0]
+    table['occupancy'] = eigenvalues[..., 1]
+    return table.reshape(-1)
+
+def table_path(directory, extension='.npy', k=TOP):
+    "localized-defects/<folder_name>/Data/localization_<folder_name>.npy inside the defect folder (_top<k> if k is not TOP)"
+    folder_name = os.path.basename(os.path.abspath(directory))
+    top = '' if k == TOP else f'_top{k}'
+    return os.path.join(directory, 'localized-defects', folder_name, 'Data', f'localization_{folder_name}{top}{extension}')
+
+def load_table(directory, rebuild=False, k=TOP):
+    "Localization table of the folder, computed from vasprun.xml only if the .npy file is missing or older than vasprun.xml"
+    vasprun_file = os.path.join(directory, 'vasprun.xml')
+    output_file = table_path(directory, k=k)
+    if not rebuild and is_up_to_date([vasprun_file], [output_file]):
+        return np.load(output_file)
+
+    data = load_vasprun(vasprun_file)
+    table = localization_table(data['eigenvalues'], data['projected'], k)
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    np.save(output_file, table)
+    return table
+
+def write_table_text(table, output_file):
+    "Optional text export of the table: fixed-width columns and a blank line between the blocks of each spin and kpoint"
+    n_bands = int(table['band'].max())
+    row = "%-6d %-10d %-10d %-10.3f %-10.3f %-10.3f %-10.3f\n"
+    blocks = np.column_stack([table[name] for name in TABLE_DTYPE.names]).reshape(-1, n_bands * len(TABLE_DTYPE.names))
+    with open(output_file, 'w') as file:
+        file.write(f"{'Spin':<6} {'k-point':<10} {'Band':<10} {'tot':<10} {'sum':<10} {'Energy':<10} {'Occ':<10}\n")
+        file.write("\n".join((row * n_bands) % tuple(block) for block in blocks))
+    return output_file
+
+def plot_localized(table, localized_folder, vbm, cbm, use_tot=False, verbose=True):
+    "One figure per spin and kpoint: energy versus tot (use_tot) or sum of the k heaviest values from tot"
+    os.makedirs(localized_folder, exist_ok=True)
+
+    if len(table) == 0:
         print("Error: Spin numbers or kpoint numbers are empty.")
         return
 
-    total_combinations = len(spin_numbers) * len(kpoint_numbers)
-
-    if len(blocks) > total_combinations:
-        print(f"Warning: More blocks ({len(blocks)}) than combinations ({total_combinations}).")
-
-    for i, block in enumerate(blocks):
-        if i >= total_combinations:
-            break
-
-        data = pd.read_csv(StringIO(block), sep=r'\s+', header=None)
-        
-        "Column 0 ----> spin number, \
-         Column 1 ----> kpoint number, \
-         Column 2 ----> band number, \
-         Column 3 ----> tot (s + p + d), \
-         Column 4 ----> sum of the 5 heaviest values from tot, \
-         Column 5 ----> energy values, \
-         Column 6 ----> occupancies"
-        if data.shape[1] >= 7:
-            if args.tot:
-                subset = data.iloc[:, [5, 3, 6]]  # column tot 
-            else:
-                subset = data.iloc[:, [5, 4, 6]] # colum sum the 5 heaviest values
-                
-            #subset = data.iloc[:, [5, 4, 6]]
-            subset.columns = ['Energy', 'sum', 'occ']
-
-            spin_index = i // len(kpoint_numbers)
-            kpoint_index = i % len(kpoint_numbers)
-
-            if kpoint_index >= len(kpoint_numbers):
-                print(f"Warning: Index for kpoint exceeds available kpoints.")
-                continue
-            
-            spin = spin_numbers[spin_index]
-            kpoint = kpoint_numbers[kpoint_index]
-
-            plt.figure(figsize=(10, 6))
-            
-            for j in range(len(subset['sum'])):
-                if np.isfinite(subset['sum'].iloc[j]):
-                    if subset['occ'].iloc[j] > 0.9:
-                        color = 'blue'
-                    elif subset['occ'].iloc[j] < 0.1:
-                        color = 'red'
-                    else:
-                        color = 'green'
-                    
-                    plt.scatter(subset['Energy'].iloc[j], subset['sum'].iloc[j], marker='o', color=color)
-
-            occupied_patch = plt.Line2D([0], [0], marker='o', color='w', label='Occupied', markerfacecolor='blue', markersize=10)
-            unoccupied_patch = plt.Line2D([0], [0], marker='o', color='w', label='Unoccupied', markerfacecolor='red', markersize=10)
-            partially_occupied_patch = plt.Line2D([0], [0], marker='o', color='w', label='Partially occupied', markerfacecolor='green', markersize=10)
-            vbm_patch = plt.Line2D([0], [0], color='lightblue', label='VBM')
-            cbm_patch = plt.Line2D([0], [0], color='thistle', label='CBM')
-            plt.legend(handles=[occupied_patch, unoccupied_patch, partially_occupied_patch, vbm_patch, cbm_patch])
-
-            plt.axvspan(subset['Energy'].min() - 0.9, vbm, color='lightblue', alpha=0.4)
-            plt.axvspan(cbm, subset['Energy'].max() + 0.9, color='thistle', alpha=0.4)
-            
-            plt.xlabel('Energy', fontsize=14)
-            plt.ylabel('Localization', fontsize=14)
-            plt.xlim(subset['Energy'].min() - 0.9, subset['Energy'].max() + 0.9)
-
-            if spin == 1:
-                plt.title(f'Spin up - kpoint {kpoint}')
-                plot_filename = f'Spin_up-kpoint_{kpoint}.png'
-                output_file = os.path.join(localized_folder, plot_filename)
-            else:
-                plt.title(f'Spin down - kpoint {kpoint}')
-                plot_filename = f'Spin_down-kpoint_{kpoint}.png'
-                output_file = os.path.join(localized_folder, plot_filename)      
-            plt.savefig(output_file, bbox_inches='tight', dpi=150)
-            plt.close()
-            print("Saving figures ... ")
+    # Blocks of the bands of each spin and kpoint
+    n_bands = int(table['band'].max())
+    for block in table.reshape(-1, n_bands):
+        spin, kpoint = block['spin'][0], block['kpoint'][0]
+        energy = block['energy']
+        localization = block['tot'] if use_tot else block['sum']
+        finite = np.isfinite(localization)
+
+        # Occupied (> 0.9): blue, unoccupied (< 0.1): red, partially occupied: green
+        occupancy = block['occupancy'][finite]
+        colors = COLORS[np.select([occupancy > 0.9, occupancy < 0.1], [0, 1], 2)]
+
+        plt.figure(figsize=(10, 6))
+        plt.scatter(energy[finite], localization[finite], marker='o', color=colors)
+
+        occupied_patch = plt.Line2D([0], [0], marker='o', color='w', label='Occupied', markerfacecolor='blue', markersize=10)
+        unoccupied_patch = plt.Line2D([0], [0], marker='o', color='w', label='Unoccupied', markerfacecolor='red', markersize=10)
+        partially_occupied_patch = plt.Line2D([0], [0], marker='o', color='w', label='Partially occupied', markerfacecolor='green', markersize=10)
+        vbm_patch = plt.Line2D([0], [0], color='lightblue', label='VBM')
+        cbm_patch = plt.Line2D([0], [0], color='thistle', label='CBM')
+        plt.legend(handles=[occupied_patch, unoccupied_patch, partially_occupied_patch, vbm_patch, cbm_patch])
+
+        plt.axvspan(energy.min() - 0.9, vbm, color='lightblue', alpha=0.4)
+        plt.axvspan(cbm, energy.max() + 0.9, color='thistle', alpha=0.4)
+
+        plt.xlabel('Energy', fontsize=14)
+        plt.ylabel('Localization', fontsize=14)
+        plt.xlim(energy.min() - 0.9, energy.max() + 0.9)
+
+        if spin == 1:
+            plt.title(f'Spin up - kpoint {kpoint}')
+            plot_filename = f'Spin_up-kpoint_{kpoint}.png'
         else:
-            print(f"Block {i + 1} does not have enough columns.")
+            plt.title(f'Spin down - kpoint {kpoint}')
+            plot_filename = f'Spin_down-kpoint_{kpoint}.png'
+        plt.savefig(os.path.join(localized_folder, plot_filename), bbox_inches='tight', dpi=150)
+        plt.close()
+        if verbose:
+            print("Saving figures ... ")
 
-plot_localized(final_result, spin_numbers, kpoint_numbers)
+def figures_folder(directory):
+    "localized-defects/<folder_name>/Figures inside the defect folder"
+    folder_name = os.path.basename(os.path.abspath(directory))
+    return os.path.join(directory, 'localized-defects', folder_name, 'Figures')
+
+def write_figures(directory, band=None, use_tot=False, verbose=False, text=False, rebuild=False, k=TOP):
+    "Plot the localization of each spin and kpoint of the calculation in directory (and the text export of the table if text)"
+    vbm, cbm = resolve_band(band, directory)
+    table = load_table(directory, rebuild, k)
+    if text:
+        write_table_text(table, table_path(directory, '.dat', k))
+
+    localized_folder = figures_folder(directory)
+    plot_localized(table, localized_folder, vbm, cbm, use_tot, verbose)
+    return localized_folder
+
+def main():
+    parser = argparse.ArgumentParser(description="Modify the VBM and CBM.")
+    parser.add_argument('--band', nargs=2, type=float, default=None, help="Specifies the values ​​for VBM and CBM. By default: VBM and CBM of ../perfect (see band_edges.py)")
+    parser.add_argument("--tot", action="store_true", help="Use column 3 instead of column 4 in the subset.")
+    parser.add_argument("--top", type=int, default=TOP, help=f"Number of values of tot closest to 1 in the column sum. Default is {TOP}.")
+    parser.add_argument("--txt", action="store_true", help="Also export the localization table as text (localization_<folder>.dat)")
+    add_batch_arguments(parser)
+    args = parser.parse_args()
+
+    if args.dirs is None:
+        write_figures('.', args.band, args.tot, verbose=True, text=args.txt, rebuild=args.force, k=args.top)
+    else:
+        dirs = discover_dirs(args.dirs, ['vasprun.xml'])
+        edges = resolve_bands(args.band, dirs)
+        task = partial(write_figures, band=edges, use_tot=args.tot, text=args.txt, rebuild=args.force, k=args.top)
+        run_batch(task, dirs, inputs=lambda d: [os.path.join(d, 'vasprun.xml')],
+                  outputs=lambda d: sorted(glob.glob(os.path.join(figures_folder(d), '*.png'))),
+                  workers=args.workers, force=args.force, root=args.dirs, name='locplot',
+                  options=lambda d: {'band': edges[d], 'tot': args.tot, 'top': args.top, 'txt': args.txt})
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import re
+import sys
+import mmap
+
+"OUTCAR scanner shared by dospo.py, forces.py, toten.py and kpoints.py"
+"The OUTCAR is memory-mapped (read from the disk only one time) and each requested key is searched in the mapped bytes with a \
+ regular expression that starts with a literal text, so the search jumps between the occurrences instead of testing every line. \
+ Every occurrence of each key is kept with its byte offset: \
+       ----> index['E-fermi']                  ----> [(offset, 5.1234), (offset, 5.1301), ...] \
+       ----> last(index, 'E-fermi')            ----> value of the final ionic step \
+       ----> first(index, 'NEDOS')             ----> value from the header of the OUTCAR \
+       ----> values(index, 'total drift')      ----> all the values, e.g. one (x, y, z) per ionic step"
+"Usage: ----> index = scan_outcar('OUTCAR', ['NEDOS', 'ISPIN', 'E-fermi']) \
+        ----> outcar_index.py OUTCAR E-fermi TOTEN  # print the last value of each key"
+
+NUMBER = rb'(-?\d*\.?\d+(?:[Ee][-+]?\d+)?)'
+
+# key: (regular expression, conversion of the captured groups)
+KEYS = {
+    'NEDOS': (rb'number of dos\s+NEDOS\s*=\s*(\d+)', int),
+    'ISPIN': (rb'ISPIN\s*=\s*(\d+)', int),
+    'NIONS': (rb'number of ions\s+NIONS\s*=\s*(\d+)', int),
+    'ENCUT': (rb'ENCUT\s*=\s*' + NUMBER, float),
+    'E-fermi': (rb'E-fermi\s*:\s*([-\d.]+)', float),
+    'TOTEN': (rb'free  energy\s+TOTEN\s*=\s*(-*\d+\.\d+)', str),
+    'energy without entropy': (rb'energy  without entropy\s*=\s*(-*\d+\.\d+)\s+energy\(sigma->0\)\s+=\s+(-*\d+\.\d+)', str),
+    'total drift': (rb'total drift:\s+' + NUMBER + rb'\s+' + NUMBER + rb'\s+' + NUMBER + rb'[ \t]*\n', float),
+    'VRHFIN': (rb'VRHFIN\s*=\s*([A-Za-z]+)', str),
+    'ions per type': (rb'ions per type\s*=([ \t\d]+)', lambda counts: [int(count) for count in counts.split()]),
+    # block after the comment line of the KPOINTS (e.g. 'k-points along high symmetry lines'), any lattice type
+    'k-points along lines': (rb'k-points in reciprocal lattice and weights:[^\n]*\n'
+                             rb'((?:[ \t]*\S[^\n]*\n)*)', str),
+}
+PATTERNS = {key: re.compile(pattern) for key, (pattern, _) in KEYS.items()}
+
+
+def convert(groups, function):
+    "Apply the conversion to the captured groups, a single value or a tuple"
+    values = tuple(function(group.decode()) for group in groups)
+    return values[0] if len(values) == 1 else values
+
+
+def scan_outcar(file_path='OUTCAR', keys=None):
+    "Every occurrence (offset, value) of the keys in the OUTCAR, searched in the memory-mapped file"
+    keys = list(KEYS) if keys is None else list(keys)
+    index = {key: [] for key in keys}
+
+    with open(file_path, 'rb') as file:
+        if file.seek(0, 2) == 0:
+            return index
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as outcar:
+            for key in keys:
+                function = KEYS[key][1]
+                index[key] = [(match.start(), convert(match.groups(), function)) for match in PATTERNS[key].finditer(outcar)]
+    return index
+
+
+def values(index, key):
+    "All the values of a key"
+    return [value for _, value in index.get(key, [])]
+
+
+def first(index, key, default=None):
+    "First value of a key (e.g. the parameters in the header)"
+    return index[key][0][1] if index.get(key) else default
+
+
+def last(index, key, default=None):
+    "Last value of a key (e.g. the final ionic step)"
+    return index[key][-1][1] if index.get(key) else default
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: outcar_index.py OUTCAR [key ...]")
+        sys.exit(1)
+    keys = sys.argv[2:] or [key for key in KEYS if key != 'k-points along lines']
+    index = scan_outcar(sys.argv[1], keys)
+    for key in keys:
+        print(f"{key:<25} {len(index[key]):<8} {last(index, key)}")
@@ -3,10 +3,22 @@
 # 2024-10
 
 import matplotlib.pyplot as plt
+import os
 import re
 import argparse
-import pandas as pd
 import numpy as np
+from sidecar import load_sidecar
+
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+try:
+    import yaml
+    YamlLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+except ImportError:
+    yaml = None
 
 "Code for plot DOS, PDOS, thermal properties and band structure using the outputs from phonopy calculations."
 "The output are saved with the following names: DOS  ----> total_dos.dat \
@@ -20,11 +32,235 @@ import numpy as np
         ----> phonplot.py --ter                     # Thermal properties \
         ----> phonplot.py --band                    # Band structure \
         ----> phonplot.py --tband                   # band structure with and without NAC \
-        ----> phonplot.py --tdos --x 0 12 --y -1 23 # Total DOS, set y and x-axis range"
+        ----> phonplot.py --tdos --x 0 12 --y -1 23 # Total DOS, set y and x-axis range \
+        ----> phonplot.py --band --input band.hdf5  # Band structure of other file \
+        ----> phonplot.py --pdos --sigma 0.05       # PDOS of mesh.hdf5 (or mesh.yaml) if projected_dos.dat is not found"
+
+"All the .dat files are read by load_dat: the lines with only numbers (negative values and scientific notation included) are \
+ converted to one array in a single call, the lines of other lengths (e.g. other outputs of phonopy in thermal.dat) are removed. \
+ The array is kept in a binary sidecar (e.g. band.dat ----> band.dat.cache/, see sidecar.py), so the next plots do not read the text \
+       ----> total_dos.dat and projected_dos.dat ----> frequency and one column for each DOS (any number of PDOS columns) \
+       ----> thermal.dat                         ----> T, F, S, Cv and E \
+       ----> band.dat, band_nac.dat, ...         ----> bands[band, q-point, (distance, frequency)] and the k-path of the second line"
+
+"The phonopy files band.hdf5, band.yaml, mesh.hdf5 and mesh.yaml are read directly, without the text exports: \
+       ----> band.hdf5 ----> only the datasets distance, frequency and label are read (h5py) \
+       ----> mesh.hdf5 ----> frequency and weight, the eigenvectors are read in blocks of q-points only for the PDOS \
+       ----> band.yaml and mesh.yaml ----> parsed once (PyYAML) and kept in the sidecar as the .dat files \
+ The labels of the band structure are taken from the file (band.conf only for band.dat), and the DOS of the mesh is computed \
+ with a Gaussian of width --sigma (THz), the PDOS with the weight of each atom in the eigenvectors (one column per atom, as \
+ projected_dos.dat). The files are searched in this order: band.hdf5, band.yaml, band.dat and total_dos.dat (projected_dos.dat), \
+ mesh.hdf5, mesh.yaml. h5py and PyYAML are optional, without them only the .dat files are read."
+
+# Increase when the arrays saved in the sidecar change
+VERSION = 1
+
+NUMBER = r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[Ee][-+]?\d+)?'
+NUMERIC_LINE = re.compile(rf'^[ \t]*{NUMBER}(?:[ \t]+{NUMBER})*[ \t]*$', re.M)
+
+# Number of q-points of the eigenvectors read at once from mesh.hdf5
+CHUNK = 64
+
+# Colors of the PDOS columns, the next columns use the default colors of matplotlib
+PDOS_COLORS = ['green', 'orange']
+
+
+def read_dat(file_path):
+    "Rows of numbers of a phonopy .dat file (the most common number of columns) and the numbers of the second line"
+    with open(file_path, 'r') as file:
+        text = file.read()
+
+    rows = NUMERIC_LINE.findall(text)
+    counts = np.array([len(row.split()) for row in rows], dtype=int)
+    n_columns = np.bincount(counts).argmax() if len(counts) else 0
+    values = ' '.join(row for row, count in zip(rows, counts) if count == n_columns)
+    data = np.array(values.split(), dtype=float).reshape(-1, max(n_columns, 1))
+
+    # k-path of band.dat: '#  0.00000000  0.12345678 ...'
+    lines = text.split('\n', 2)
+    try:
+        k_path = np.array(lines[1].lstrip('#').split(), dtype=float) if len(lines) > 1 and lines[1].startswith('#') else np.empty(0)
+    except ValueError:
+        k_path = np.empty(0)
+    return {'data': data, 'k_path': k_path}
+
+
+def load_dat(file_path):
+    "Arrays of read_dat from the sidecar (the text is read only if the sidecar is missing or out of date)"
+    return load_sidecar(file_path, read_dat, version=VERSION)
+
+
+def band_blocks(data):
+    "Split the rows of a band.dat in bands: [band, q-point, (distance, frequency)], a band starts when the distance decreases"
+    starts = np.flatnonzero(np.diff(data[:, 0]) < 0)
+    n_qpoints = starts[0] + 1 if len(starts) else len(data)
+    return np.asarray(data).reshape(-1, n_qpoints, 2)
+
+
+def check_format(file_path):
+    "Raise ImportError if the module needed to read the file is not installed"
+    if file_path.endswith(('.hdf5', '.h5')) and h5py is None:
+        raise ImportError(f"h5py is needed to read {file_path}")
+    if file_path.endswith(('.yaml', '.yml')) and yaml is None:
+        raise ImportError(f"PyYAML is needed to read {file_path}")
+
+
+def find_input(candidates):
+    "First file of the candidates that exists and can be read"
+    for file_path in candidates:
+        if os.path.isfile(file_path):
+            try:
+                check_format(file_path)
+            except ImportError as error:
+                print(f"{error}, skipped")
+                continue
+            return file_path
+    raise FileNotFoundError(f"None of the files {', '.join(candidates)} was found")
+
+
+def band_files(stem):
+    "Files of a band structure in the order they are searched: stem.hdf5, stem.yaml and stem.dat"
+    return [f"{stem}.hdf5", f"{stem}.yaml", f"{stem}.dat"]
+
+
+def decode_labels(labels):
+    "Labels of the segments as an array of str [segment, (start, end)]"
+    return np.array([[label.decode() if isinstance(label, bytes) else str(label) for label in pair] for pair in labels], dtype=str).reshape(-1, 2)
+
+
+def read_band_hdf5(file_path):
+    "Distances, frequencies, q-points per segment and labels of a phonopy band.hdf5 (only these datasets are read)"
+    with h5py.File(file_path, 'r') as file:
+        distances = file['distance'][()]
+        frequencies = file['frequency'][()]
+        labels = decode_labels(file['label'][()]) if 'label' in file else np.empty((0, 2), dtype=str)
+    segments = np.full(len(distances), distances.shape[1]) if distances.ndim == 2 else np.array([len(distances)])
+    return {'distances': distances.reshape(-1),
+            'frequencies': frequencies.reshape(-1, frequencies.shape[-1]),
+            'segments': segments,
+            'labels': labels}
+
+
+def read_band_yaml(file_path):
+    "Same arrays as read_band_hdf5 from a phonopy band.yaml"
+    with open(file_path, 'r') as file:
+        band = yaml.load(file, Loader=YamlLoader)
+    phonons = band['phonon']
+    return {'distances': np.array([phonon['distance'] for phonon in phonons], dtype=float),
+            'frequencies': np.array([[mode['frequency'] for mode in phonon['band']] for phonon in phonons], dtype=float),
+            'segments': np.array(band.get('segment_nqpoint', [len(phonons)]), dtype=int),
+            'labels': decode_labels(band.get('labels', []))}
+
+
+def format_label(label):
+    "Gamma ----> $\\Gamma$ (as in BAND_LABELS of band.conf)"
+    return '$\\Gamma$' if label.lstrip('\\') in ('Gamma', 'G', 'GAMMA') else str(label)
+
+
+def tick_labels(labels):
+    "Labels of the k-path from the labels of the segments, A|B where the path jumps from A to B"
+    if len(labels) == 0:
+        return []
+    ticks = [format_label(labels[0][0])]
+    for (_, end), (start, _) in zip(labels[:-1], labels[1:]):
+        ticks.append(format_label(end) if end == start else f"{format_label(end)}|{format_label(start)}")
+    ticks.append(format_label(labels[-1][1]))
+    return ticks
+
+
+def load_band(file_path):
+    "Band structure of band.dat, band.yaml or band.hdf5: bands[band, q-point, (distance, frequency)], k-path and labels"
+    check_format(file_path)
+    if file_path.endswith('.dat'):
+        band = load_dat(file_path)
+        return {'bands': band_blocks(band['data']), 'k_path': band['k_path'], 'labels': get_band_labels()}
+
+    if file_path.endswith(('.hdf5', '.h5')):
+        band = read_band_hdf5(file_path)
+    else:
+        band = load_sidecar(file_path, read_band_yaml, version=VERSION)
+
+    # The segments are separated by a NaN row, so the jumps of the path (A|B) are not joined by a line
+    bounds = np.cumsum(band['segments'])[:-1]
+    distances = np.insert(np.asarray(band['distances'], dtype=float), bounds, np.nan)
+    frequencies = np.insert(np.asarray(band['frequencies'], dtype=float), bounds, np.nan, axis=0)
+    bands = np.stack(np.broadcast_arrays(distances[None, :], frequencies.T), axis=-1)
+
+    starts = np.concatenate(([0], bounds))
+    k_path = np.append(np.asarray(band['distances'])[starts], band['distances'][-1])
+    return {'bands': bands, 'k_path': k_path, 'labels': tick_labels(band['labels']) or get_band_labels()}
+
+
+def atom_weights(eigenvectors):
+    "Weight of each atom in each mode: eigenvectors[q-point, 3 * atom + xyz, mode] ----> weights[q-point, mode, atom]"
+    n_qpoints, n_rows, n_modes = eigenvectors.shape
+    return (np.abs(eigenvectors) ** 2).reshape(n_qpoints, n_rows // 3, 3, n_modes).sum(axis=2).transpose(0, 2, 1)
+
+
+def read_mesh_hdf5(file_path, projected=False):
+    "Frequencies[q-point, mode] and weights[q-point] of a phonopy mesh.hdf5, and the weights of the atoms if projected"
+    with h5py.File(file_path, 'r') as file:
+        mesh = {'frequencies': file['frequency'][()], 'weights': file['weight'][()]}
+        if projected:
+            if 'eigenvector' not in file:
+                raise ValueError(f"{file_path} has no eigenvectors (run phonopy with EIGENVECTORS = .TRUE.)")
+            eigenvectors = file['eigenvector']
+            mesh['projections'] = np.concatenate([atom_weights(eigenvectors[start:start + CHUNK])
+                                                  for start in range(0, len(eigenvectors), CHUNK)])
+    return mesh
+
+
+def read_mesh_yaml(file_path):
+    "Same arrays as read_mesh_hdf5 from a phonopy mesh.yaml (the weights of the atoms only if the eigenvectors were written)"
+    with open(file_path, 'r') as file:
+        mesh = yaml.load(file, Loader=YamlLoader)
+    phonons = mesh['phonon']
+    data = {'frequencies': np.array([[mode['frequency'] for mode in phonon['band']] for phonon in phonons], dtype=float),
+            'weights': np.array([phonon.get('weight', 1) for phonon in phonons], dtype=float),
+            'symbols': np.array([point['symbol'] for point in mesh.get('points', [])], dtype=str)}
+    if 'eigenvector' in phonons[0]['band'][0]:
+        # eigenvector[q-point, mode, atom, xyz, (real, imaginary)]
+        eigenvectors = np.array([[mode['eigenvector'] for mode in phonon['band']] for phonon in phonons], dtype=float)
+        data['projections'] = (eigenvectors ** 2).sum(axis=(3, 4))
+    return data
+
+
+def gaussian_dos(frequencies, weights, projections=None, sigma=0.1, n_points=1000):
+    "DOS of the mesh (per unit cell) with a Gaussian of width sigma (THz): [frequency, DOS] or [frequency, one PDOS per atom]"
+    frequencies = np.asarray(frequencies, dtype=float)
+    mode_frequencies = frequencies.reshape(-1)
+    mode_weights = np.repeat(np.asarray(weights, dtype=float) / np.sum(weights), frequencies.shape[1])
+    columns = mode_weights[:, None] * (np.asarray(projections).reshape(len(mode_frequencies), -1) if projections is not None else 1.0)
+
+    grid = np.linspace(mode_frequencies.min() - 5 * sigma, mode_frequencies.max() + 5 * sigma, n_points)
+    dos = np.zeros((n_points, columns.shape[1]))
+    block = 4096   # modes per product, the Gaussians of a block are (n_points, block)
+    for start in range(0, len(mode_frequencies), block):
+        gaussians = np.exp(-0.5 * ((grid[:, None] - mode_frequencies[None, start:start + block]) / sigma) ** 2)
+        dos += gaussians @ columns[start:start + block]
+    return np.column_stack((grid, dos / (sigma * np.sqrt(2 * np.pi))))
+
+
+def load_dos(file_path, projected=False, sigma=0.1):
+    "DOS of total_dos.dat, projected_dos.dat, mesh.yaml or mesh.hdf5: [frequency, DOS...] and the symbols of the atoms"
+    check_format(file_path)
+    if file_path.endswith('.dat'):
+        return load_dat(file_path)['data'], get_atomic_symbols()
+
+    if file_path.endswith(('.hdf5', '.h5')):
+        mesh = read_mesh_hdf5(file_path, projected)
+    else:
+        mesh = load_sidecar(file_path, read_mesh_yaml, version=VERSION)
+        if projected and 'projections' not in mesh:
+            raise ValueError(f"{file_path} has no eigenvectors (run phonopy with EIGENVECTORS = .TRUE.)")
+    symbols = [str(symbol) for symbol in mesh['symbols']] if len(mesh.get('symbols', [])) else get_atomic_symbols()
+    return gaussian_dos(mesh['frequencies'], mesh['weights'], mesh['projections'] if projected else None, sigma), symbols
 
 
 def get_atomic_symbols(conf_file='band.conf'): 
     symbols = []
+    if not os.path.isfile(conf_file):
+        return symbols
     with open(conf_file, 'r') as file:
         for line in file:
             if 'ATOM_NAME' in line:
@@ -36,17 +272,10 @@ def get_atomic_symbols(conf_file='band.conf'):
                 break
     return symbols
         
-def plot_total_dos(file_path='total_dos.dat', x_range=None, y_range=None):
-    data = []
-    with open(file_path, 'r') as file:
-        next(file)  # Skip the first line
-        for line in file:
-            columns = line.split()
-            if len(columns) >= 2: 
-                data.append((float(columns[0]), float(columns[1])))
-    
-    # Separate the columns into x and y lists
-    x, y = zip(*data)
+def plot_total_dos(file_path=None, x_range=None, y_range=None, sigma=0.1):
+    file_path = file_path or find_input(['total_dos.dat', 'mesh.hdf5', 'mesh.yaml'])
+    data, _ = load_dos(file_path, sigma=sigma)
+    x, y = data[:, 0], data[:, 1]
     
     plt.figure(figsize=(12, 8))
     plt.plot(x, y, label="Total DOS", color='r')
@@ -65,25 +294,17 @@ def plot_total_dos(file_path='total_dos.dat', x_range=None, y_range=None):
     plt.show()
     plt.close()
 
-def plot_pdos(file_path='projected_dos.dat', x_range=None, y_range=None):
-    data = []
-    with open(file_path, 'r') as file:
-        next(file)  # Skip the first line
-        for line in file:
-            columns = line.split()
-            if len(columns) >= 3: 
-                data.append((float(columns[0]), float(columns[1]), float(columns[2])))
-    
-    # Separate the columns into x, y1, and y2 lists
-    x, y1, y2 = zip(*data)
-
-    symbols = get_atomic_symbols()
+def plot_pdos(file_path=None, x_range=None, y_range=None, sigma=0.1):
+    file_path = file_path or find_input(['projected_dos.dat', 'mesh.hdf5', 'mesh.yaml'])
+    # One curve for each column of the PDOS, with the names of ATOM_NAME (or the atoms of mesh.yaml)
+    data, symbols = load_dos(file_path, projected=True, sigma=sigma)
+    x = data[:, 0]
 
     plt.figure(figsize=(12, 8))
-    plt.plot(x, y1, label=symbols[0], color="green")
-    plt.plot(x, y2, label=symbols[1], color="orange")
-    plt.fill_between(x, y1, alpha=0.1, color="green")
-    plt.fill_between(x, y2, alpha=0.1, color="orange")
+    for i, y in enumerate(data[:, 1:].T):
+        label = symbols[i] if i < len(symbols) else f'Column {i + 2}'
+        line, = plt.plot(x, y, label=label, color=PDOS_COLORS[i] if i < len(PDOS_COLORS) else None)
+        plt.fill_between(x, y, alpha=0.1, color=line.get_color())
     
     plt.xlabel('Frequency (THz)', fontsize=14)
     plt.ylabel('PDOS (States/eV)', fontsize=14)
@@ -101,26 +322,18 @@ def plot_pdos(file_path='projected_dos.dat', x_range=None, y_range=None):
 
 def plot_thermal(file_path='thermal.dat', x_range=None, y_range=None):
     custom_labels = ['Helmholtz Free energy (kJ/mol)', 'Entropy (J/K.mol)', 'Heat Capacity $C_{v}$ (J/K.mol)', 'Energy (kJ/mol)']
-    with open(file_path, 'r') as file:
-        lines = file.readlines()[0:]  # Skip 
+    # Rows of T, F, S, Cv and E (the other lines of the phonopy output are removed)
+    data = load_dat(file_path)['data']
 
-    # Filter lines containing numbers and convert to DataFrame
-    valid_lines = [line for line in lines if all(part.replace('.', '', 1).isdigit() for part in line.split())]
-    
-    data = pd.DataFrame(
-        [line.split() for line in valid_lines],  # Split each line into columns
-        dtype=float  # Convert all values to floats
-    )
-    
-    x_column = data[0]  
-    y_columns = [1, 2, 3, 4]  
+    x_column = data[:, 0]
+    y_columns = [1, 2, 3, 4]
 
     colors = ['g', 'orange', 'b', 'r'] 
     
     plt.figure(figsize=(12, 8))
     
     for i, (y_col, label) in enumerate(zip(y_columns, custom_labels)):
-        plt.plot(x_column, data[y_col], label=label, color=colors[i % len(colors)]) 
+        plt.plot(x_column, data[:, y_col], label=label, color=colors[i % len(colors)])
 
     plt.xlim(x_column.min(), x_column.max())
     plt.xlabel('Temperatura (K)', fontsize = 14)
@@ -138,6 +351,8 @@ def plot_thermal(file_path='thermal.dat', x_range=None, y_range=None):
 
 def get_band_labels(config_file='band.conf'):
     band_labels = []
+    if not os.path.isfile(config_file):
+        return band_labels
     with open(config_file, 'r') as file:
         for line in file:
             if "BAND_LABELS" in line:
@@ -157,34 +372,20 @@ def get_band_labels(config_file='band.conf'):
                 break
     return band_labels
 
-def plot_blocks(data, ax, color, label):
-    is_block_start = np.concatenate(([True], np.diff(data[:, 0]) < 0))
-    block_indices = np.where(is_block_start)[0]
-
-    for i in range(len(block_indices)):
-        if i < len(block_indices) - 1:
-            block_data = data[block_indices[i]:block_indices[i + 1]]
-        else:
-            block_data = data[block_indices[i]:]  # Last block
-
-        ax.plot(block_data[:, 0], block_data[:, 1], linestyle='-', markersize=1, c=color, label=label if i == 0 else "")
-        
-def plot_single_band(nac_file="band.dat", color_nac='r', x_range=None, y_range=None):
-    # Load k_path data from the second line in the band.dat file
-    with open(nac_file, 'r') as file:
-        file.readline()  # Skip the first line
-        k_path_line = file.readline().strip()
-    k_path = list(map(float, k_path_line[1:].split()))  # Convert to float
+def plot_blocks(bands, ax, color, label):
+    "Plot all the bands with one call (one column of frequencies for each band)"
+    lines = ax.plot(bands[0, :, 0], bands[:, :, 1].T, linestyle='-', markersize=1, c=color)
+    lines[0].set_label(label)
 
-    # Load the data (skip header lines)
-    data = np.loadtxt(nac_file, comments='#', skiprows=2)
+def plot_single_band(nac_file=None, color_nac='r', x_range=None, y_range=None):
+    # Load the bands, the k_path and the labels (band.hdf5, band.yaml or band.dat with BAND_LABELS of band.conf)
+    band = load_band(nac_file or find_input(band_files('band')))
+    k_path, band_labels = band['k_path'], band['labels']
 
     fig, ax = plt.subplots()
-    
-    band_labels = get_band_labels()
 
     # Plot data
-    plot_blocks(data, ax, color_nac, 'Without NAC')
+    plot_blocks(band['bands'], ax, color_nac, 'Without NAC')
 
     # Add vertical lines at specified k-path positions
     for x in k_path[1:-1]:
@@ -210,25 +411,18 @@ def plot_single_band(nac_file="band.dat", color_nac='r', x_range=None, y_range=N
     plt.show()
     plt.close()
 
-def plot_mix_band(nac_file="band_nac.dat", no_nac_file="band_nonac.dat", color_nac='xkcd:red', color_no_nac='xkcd:blue', x_range=None, y_range=None):
-    # Load k_path data from the second line in the band.dat file
-    with open(nac_file, 'r') as file:
-        file.readline()  # Skip the first line
-        k_path_line = file.readline().strip()
-    k_path = list(map(float, k_path_line[1:].split()))  # Convert to float
-
-    # Load data for NAC and without NAC (skip header lines)
-    data_nac = np.loadtxt(nac_file, comments='#', skiprows=2)
-    data_no_nac = np.loadtxt(no_nac_file, comments='#', skiprows=2)
+def plot_mix_band(nac_file=None, no_nac_file=None, color_nac='xkcd:red', color_no_nac='xkcd:blue', x_range=None, y_range=None):
+    # Load data for NAC and without NAC, the k_path and labels of the band_nac file
+    band_nac = load_band(nac_file or find_input(band_files('band_nac')))
+    band_no_nac = load_band(no_nac_file or find_input(band_files('band_nonac')))
+    k_path, band_labels = band_nac['k_path'], band_nac['labels']
 
     fig, ax = plt.subplots()
-    
-    band_labels = get_band_labels()
 
     # Plot data with NAC
-    plot_blocks(data_nac, ax, color_nac, 'With NAC')
+    plot_blocks(band_nac['bands'], ax, color_nac, 'With NAC')
     # Plot data without NAC
-    plot_blocks(data_no_nac, ax, color_no_nac, 'Without NAC')
+    plot_blocks(band_no_nac['bands'], ax, color_no_nac, 'Without NAC')
 
     # Add vertical lines at specified k-path positions
     for x in k_path[1:-1]:
@@ -265,22 +459,25 @@ def main():
     
     parser.add_argument('--x', nargs=2, type=float, help='Set x-axis range as two values: min max')
     parser.add_argument('--y', nargs=2, type=float, help='Set y-axis range as two values: min max')
+    parser.add_argument('--input', nargs='+', default=[], metavar='FILE', help='Input files (.dat, .yaml or .hdf5), two files with --tband: NAC and without NAC')
+    parser.add_argument('--sigma', type=float, default=0.1, help='Width (THz) of the Gaussian for the DOS of mesh.hdf5 or mesh.yaml. Default is 0.1.')
     
     args = parser.parse_args()
+    inputs = args.input + [None] * (2 - len(args.input))
     
     x_range = (args.x[0], args.x[1]) if args.x else None
     y_range = (args.y[0], args.y[1]) if args.y else None
 
     if args.tdos:
-        plot_total_dos(x_range=x_range, y_range=y_range)
+        plot_total_dos(inputs[0], x_range=x_range, y_range=y_range, sigma=args.sigma)
     elif args.pdos:
-        plot_pdos(x_range=x_range, y_range=y_range)
+        plot_pdos(inputs[0], x_range=x_range, y_range=y_range, sigma=args.sigma)
     elif args.ter:
-        plot_thermal(x_range=x_range, y_range=y_range)
+        plot_thermal(inputs[0] or 'thermal.dat', x_range=x_range, y_range=y_range)
     elif args.band:
-        plot_single_band(x_range=x_range, y_range=y_range)
+        plot_single_band(inputs[0], x_range=x_range, y_range=y_range)
     elif args.tband:
-        plot_mix_band(x_range=x_range, y_range=y_range)
+        plot_mix_band(inputs[0], inputs[1], x_range=x_range, y_range=y_range)
     else:
         print("No valid argument provided. Please specify one of the following options:")
         print("--tdos, --pdos, --ter, --band, --tband")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import os
+import json
+import shutil
+import hashlib
+import numpy as np
+
+"Binary cache (sidecar) for the parsed output files. The arrays are saved as .npy files in a folder next to the source file \
+ (e.g. vasprun.xml ----> vasprun.xml.cache/) together with meta.json, and the next runs memory-map them instead of parsing the file again."
+"The sidecar is valid while the source file keeps the same size and content hash: \
+       ----> same size and mtime  ----> only the hash of the first and last MiB is checked (fast) \
+       ----> mtime changed        ----> the hash of the full file is checked (e.g. the file was copied), if it is equal the mtime is updated \
+       ----> otherwise            ----> the file is parsed again and the sidecar is rebuilt"
+"Usage: ----> data = load_sidecar('vasprun.xml', read_vasprun, version=1) \
+        ----> data = load_sidecar('vasprun.xml', read_band_data, version=1, suffix='bands.cache')  # second sidecar of the same file"
+
+CHUNK = 1 << 20   # 1 MiB
+
+
+def sample_hash(file_path, size):
+    "Hash of the size, first MiB and last MiB of the file"
+    digest = hashlib.blake2b(str(size).encode())
+    with open(file_path, 'rb') as file:
+        digest.update(file.read(CHUNK))
+        if size > CHUNK:
+            file.seek(max(size - CHUNK, CHUNK))
+            digest.update(file.read(CHUNK))
+    return digest.hexdigest()
+
+
+def full_hash(file_path):
+    "Hash of the full content of the file"
+    digest = hashlib.blake2b()
+    with open(file_path, 'rb') as file:
+        for block in iter(lambda: file.read(16 * CHUNK), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def sidecar_path(file_path, suffix='cache'):
+    "Folder of the sidecar for a source file"
+    return f"{file_path}.{suffix}"
+
+
+def read_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json')) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def is_valid(file_path, meta, version, cache_dir):
+    "Compare the sidecar information with the source file (size, mtime and hash)"
+    if meta is None or meta.get('version') != version:
+        return False
+    stat = os.stat(file_path)
+    if meta['size'] != stat.st_size:
+        return False
+    if meta['mtime_ns'] == stat.st_mtime_ns:
+        return meta['sample_hash'] == sample_hash(file_path, stat.st_size)
+    if meta['full_hash'] == full_hash(file_path):
+        meta['mtime_ns'] = stat.st_mtime_ns
+        write_meta(cache_dir, meta)
+        return True
+    return False
+
+
+def write_meta(cache_dir, meta):
+    try:
+        with open(os.path.join(cache_dir, 'meta.json'), 'w') as file:
+            json.dump(meta, file, indent=1)
+    except OSError:
+        pass
+
+
+def load_arrays(cache_dir, keys):
+    "Memory-map the arrays of the sidecar"
+    return {key: np.load(os.path.join(cache_dir, f"{key}.npy"), mmap_mode='r') for key in keys}
+
+
+def save_arrays(file_path, data, version, cache_dir):
+    "Write the arrays and meta.json, first in a temporary folder and then rename it"
+    tmp_dir = f"{cache_dir}.tmp-{os.getpid()}"
+    stat = os.stat(file_path)
+    meta = {'version': version,
+            'source': os.path.basename(file_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sample_hash': sample_hash(file_path, stat.st_size),
+            'full_hash': full_hash(file_path),
+            'keys': sorted(data)}
+    try:
+        os.makedirs(tmp_dir, exist_ok=True)
+        for key, value in data.items():
+            np.save(os.path.join(tmp_dir, f"{key}.npy"), np.asarray(value))
+        write_meta(tmp_dir, meta)
+        if os.path.isdir(cache_dir):
+            shutil.rmtree(cache_dir)
+        os.rename(tmp_dir, cache_dir)
+    except OSError as error:
+        # Read-only folder or full disk: continue without the sidecar
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        print(f"The sidecar {cache_dir} could not be written: {error}")
+
+
+def load_sidecar(file_path, build, version=1, rebuild=False, suffix='cache'):
+    "Return the arrays of file_path from the sidecar, build(file_path) is called when the sidecar is missing or out of date"
+    cache_dir = sidecar_path(file_path, suffix)
+    meta = read_meta(cache_dir)
+    if not rebuild and is_valid(file_path, meta, version, cache_dir):
+        try:
+            return load_arrays(cache_dir, meta['keys'])
+        except (OSError, ValueError):
+            pass
+
+    data = build(file_path)
+    save_arrays(file_path, data, version, cache_dir)
+    return data
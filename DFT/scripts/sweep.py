@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import os
+import re
+import json
+import mmap
+import xml.etree.ElementTree as ET
+from multiprocessing import Pool
+
+"Collector of the convergence tests (ENCUT and k-density sweeps) used by encut.py and kdensity.py"
+"Only three values are needed from each vasprun.xml: the last e_wo_entrp, ENCUT and the number of atoms. The file is memory-mapped \
+ and the last e_wo_entrp is found searching backward from the end (rfind), ENCUT and <atoms> are found near the top. If a tag is \
+ not found in this way (e.g. a different format), the file is read with a streaming parser (ET.iterparse) instead."
+"The subfolders of a sweep (e.g. cutoff-perfect/400, cutoff-perfect/450, ...) are read with a process pool and the values are kept \
+ in <sweep>/sweep_results.json with the size and mtime of each vasprun.xml, so after adding a new point only the new folder is read."
+"Usage: ----> results = collect_sweep('cutoff-perfect') \
+        ----> results['450'] = {'energy': -43.1234, 'encut': 450, 'atoms': 8}"
+
+STORE = 'sweep_results.json'
+
+# name: (regular expression, search from the end of the file, conversion)
+TAGS = {'energy': (rb'<i name="e_wo_entrp">\s*([^<\s]+)\s*</i>', True, float),
+        'encut': (rb'<i name="ENCUT">\s*([^<\s]+)\s*</i>', False, lambda value: int(float(value))),
+        'atoms': (rb'<atoms>\s*(\d+)\s*</atoms>', False, int)}
+MESSAGES = {'energy': "e_wo_entrp not found",
+            'encut': "ENCUT not found",
+            'atoms': "Number of atoms not found in the file."}
+PATTERNS = {name: re.compile(pattern) for name, (pattern, _, _) in TAGS.items()}
+
+
+def search_values(vasprun_path):
+    "Values of TAGS found in the memory-mapped file (None if not found)"
+    found = dict.fromkeys(TAGS)
+    with open(vasprun_path, 'rb') as file:
+        if file.seek(0, 2) == 0:
+            return found
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as vasprun:
+            for name, (pattern, from_end, function) in TAGS.items():
+                if from_end:
+                    position = vasprun.rfind(pattern[:pattern.index(b'>') + 1])
+                    match = PATTERNS[name].match(vasprun, position) if position >= 0 else None
+                else:
+                    match = PATTERNS[name].search(vasprun)
+                if match:
+                    found[name] = function(match.group(1).decode())
+    return found
+
+
+def stream_values(vasprun_path):
+    "Values of TAGS read with ET.iterparse, for the files where search_values fails"
+    found = dict.fromkeys(TAGS)
+    try:
+        for _, elem in ET.iterparse(vasprun_path, events=('end',)):
+            if elem.tag == 'i' and elem.get('name') == 'e_wo_entrp':
+                found['energy'] = float(elem.text.strip())
+            elif elem.tag == 'i' and elem.get('name') == 'ENCUT' and found['encut'] is None:
+                found['encut'] = int(float(elem.text.strip()))
+            elif elem.tag == 'atoms' and found['atoms'] is None:
+                found['atoms'] = int(elem.text.strip())
+            if elem.tag in ('i', 'v', 'r', 'rc', 'set'):
+                elem.clear()
+    except ET.ParseError:
+        # unfinished calculation, keep the values found until the end of the file
+        pass
+    return found
+
+
+def read_sweep_values(vasprun_path):
+    "Last e_wo_entrp, ENCUT and number of atoms of a vasprun.xml"
+    found = search_values(vasprun_path)
+    if None in found.values():
+        streamed = stream_values(vasprun_path)
+        found = {name: found[name] if found[name] is not None else streamed[name] for name in TAGS}
+    for name, value in found.items():
+        if value is None:
+            print(f"{MESSAGES[name]} ({vasprun_path})")
+    return found
+
+
+def read_store(store_file):
+    try:
+        with open(store_file) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_store(store_file, store):
+    try:
+        with open(store_file, 'w') as file:
+            json.dump(store, file, indent=1)
+    except OSError:
+        pass
+
+
+def collect_sweep(directory, workers=None, force=False):
+    "Values of each subfolder of the sweep with a vasprun.xml, sorted by subfolder name"
+    subfolders = [subfolder for subfolder in sorted(os.listdir(directory))
+                  if os.path.exists(os.path.join(directory, subfolder, "vasprun.xml"))]
+    store_file = os.path.join(directory, STORE)
+    old_store = {} if force else read_store(store_file)
+    store = {subfolder: old_store[subfolder] for subfolder in subfolders if subfolder in old_store}
+
+    # Only the new or modified vasprun.xml files are read
+    pending = []
+    for subfolder in subfolders:
+        stat = os.stat(os.path.join(directory, subfolder, "vasprun.xml"))
+        entry = store.get(subfolder)
+        if not entry or entry['size'] != stat.st_size or entry['mtime_ns'] != stat.st_mtime_ns:
+            store[subfolder] = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+            pending.append(subfolder)
+
+    if pending:
+        paths = [os.path.join(directory, subfolder, "vasprun.xml") for subfolder in pending]
+        if len(paths) == 1:
+            found = [read_sweep_values(paths[0])]
+        else:
+            with Pool(min(workers or os.cpu_count(), len(paths))) as pool:
+                found = pool.map(read_sweep_values, paths)
+        for subfolder, values in zip(pending, found):
+            store[subfolder].update(values)
+
+    # The subfolders that do not exist anymore are removed from the store
+    if pending or len(store) != len(old_store):
+        write_store(store_file, store)
+    return {subfolder: {name: store[subfolder][name] for name in TAGS} for subfolder in subfolders}
+
+
+def add_sweep_arguments(parser):
+    "Options of the collector"
+    parser.add_argument('--workers', type=int, default=None, help="Number of processes to read the vasprun.xml files. By default: number of CPUs")
+    parser.add_argument('--force', action='store_true', help=f"Read again all the vasprun.xml files, ignoring {STORE}")
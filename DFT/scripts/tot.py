@@ -4,16 +4,16 @@
 
 "Code for print the total energy from vaprun.xml files"
 import sys
-from pymatgen.io.vasp.outputs import Vasprun
 import glob
+from final_energy import vasprun_final_energy, run_parallel
+
+"The energy is read from the end of each vasprun.xml (see final_energy.py) and the files are processed in parallel"
 
 def process_vasrun_file(filename):
-    """Load a vasprun.xml file and return its total energy."""
+    """Return the total energy of the last ionic step of a vasprun.xml file."""
     try:
-        vasprun = Vasprun(filename)
-        
-        # Get the total energy from the last ionic step
-        last_energy = vasprun.ionic_steps[-1]['electronic_steps'][-1]['e_fr_energy']
+        # e_fr_energy of the last electronic step of the last ionic step
+        last_energy = vasprun_final_energy(filename)
         
         return last_energy
         
@@ -35,8 +35,7 @@ if __name__ == "__main__":
             print(f"No files found for pattern: {arg}")
             continue
         
-        for filename in files:
-            total_energy = process_vasrun_file(filename)
+        for filename, total_energy in zip(files, run_parallel(process_vasrun_file, files)):
             if total_energy is not None:
                 # Print the filename and its total energy
                 print(f"{filename:<20} {total_energy:<20.8f}")
@@ -3,44 +3,59 @@
 # 2024-10
 
 import sys
-import re
+from outcar_index import scan_outcar
+from final_energy import outcar_final_energies, run_parallel
 
 "Code for print the free energy TOTEN, energy without entropy (F) and energy(sigma->0) (E_0) from OUTCAR file"
 
-def process_file(filename, print_header):
+"Usage: ----> toten.py OUTCAR                 # all the ionic steps \
+        ----> toten.py */OUTCAR --final       # only the last ionic step of each file, read from the end of the file (see final_energy.py)"
+"The files are processed in parallel and printed in the same order"
+
+def read_energies(filename):
+    "free energy TOTEN and energy(sigma->0) of every ionic step, with their position in the file (see outcar_index.py)"
+    index = scan_outcar(filename, ['TOTEN', 'energy without entropy'])
+    free_energies = index['TOTEN']
+    position = 0
+    freeeV = None
+    rows = []
+
+    for offset, (_, e0eV) in index['energy without entropy']:
+        # last free energy before this energy(sigma->0)
+        while position < len(free_energies) and free_energies[position][0] < offset:
+            freeeV = free_energies[position][1]
+            position += 1
+        if freeeV is not None:
+            rows.append((freeeV, e0eV))
+    return rows
+
+def read_final_energies(filename):
+    "free energy TOTEN and energy(sigma->0) of the last ionic step"
+    final = outcar_final_energies(filename)
+    return [final] if final else []
+
+def process_file(filename, print_header, rows=None):
     if print_header:
         # Define column widths for alignment and print header 
         print(f"{'Filename':<20} {'Total energy (eV)':<20} {'F':<20} {'E_0':<20}", end="")
-    
-    with open(filename, 'r') as file:
-        freeeV = None
-        e0eV = None
-        
-        for line in file:
-            if "free  energy" in line:
-                match_free = re.search(r"(-*\d+\.\d+)", line)
-                if match_free:
-                    freeeV = match_free.group(1)
-
-            elif "energy  without entropy" in line:
-                match_e0 = re.search(r"(-*\d+\.\d+)\s+energy\(sigma-\>0\)\s+=\s+(-*\d+\.\d+)", line)
-                if match_e0:
-                    e0eV = match_e0.group(2)
-                    if freeeV is not None:
-                        # Print aligned values 
-                        print(f"\n{filename:<20} {freeeV:<20} {freeeV:<20} {e0eV:<20}", end="")
+
+    for freeeV, e0eV in (read_energies(filename) if rows is None else rows):
+        # Print aligned values 
+        print(f"\n{filename:<20} {freeeV:<20} {freeeV:<20} {e0eV:<20}", end="")
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
+    filenames = [arg for arg in sys.argv[1:] if arg != '--final']
+    if not filenames:
         print("Usage: toten.py OUTCAR")
         sys.exit(1)
 
-    # Process each file passed as an argument
+    # Read all the files in parallel, then print them in order
+    all_rows = run_parallel(read_final_energies if '--final' in sys.argv else read_energies, filenames)
+
     first_file = True
 
-    for arg in sys.argv[1:]:
-        process_file(arg, first_file)
+    for filename, rows in zip(filenames, all_rows):
+        process_file(filename, first_file, rows)
         first_file = False  
 
     print()  
-
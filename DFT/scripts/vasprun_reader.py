@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# Written by Joseph P.Vera
+# 2026-10
+
+import xml.etree.ElementTree as ET
+import numpy as np
+from sidecar import load_sidecar
+
+"Shared reader for the vasprun.xml file, used by localized.py, locplot.py, eigenplot.py, forces.py and dielectric.py"
+"The file is parsed once with iterparse and every element is cleared after use, so the memory does not grow with the size of the file. \
+ The information is stored in NumPy arrays: \
+       ----> eigenvalues[spin, kpoint, band, 2]               # column 0: energy, column 1: occupancy (<eigenvalues> block) \
+       ----> projected[spin, kpoint, band, ion, orbital]      # orbitals in the order of the <field> tags, s p d (LORBIT=10) or s py pz px ... (LORBIT=11) \
+       ----> kpoints[kpoint, 3] and weights[kpoint]           # <varray name='kpointlist'> and <varray name='weights'> \
+       ----> orbitals[orbital]                                # names of the orbitals \
+       ----> forces[step, ion, 3] and stress[step, 3, 3]      # <varray name='forces'> and <varray name='stress'> of each ionic step \
+       ----> symbols[ion]                                     # element of each ion (<array name='atoms'> in <atominfo>) \
+       ----> epsilon[3, 3] and epsilon_ion[3, 3]              # electronic and ionic dielectric tensors"
+"load_vasprun() keeps the arrays in a binary sidecar (vasprun.xml.cache/, see sidecar.py), so the file is parsed only the first time."
+"Usage: ----> data = load_vasprun('vasprun.xml') \
+        ----> data['eigenvalues'][0, 0, :, 0]                 # energies of spin up, kpoint 1"
+
+# Increase when the arrays saved in the sidecar change
+VERSION = 2
+
+# <varray> blocks stored for each ionic step (forces, stress) or only once (dielectric tensors)
+STEP_VARRAYS = ('forces', 'stress')
+TENSOR_VARRAYS = ('epsilon', 'epsilon_ion')
+
+
+def read_vasprun(file_path='vasprun.xml'):
+    "Parse the vasprun.xml file in a single pass and return a dictionary with the arrays"
+    nspin, nkpoints, nbands, nions = 1, None, None, None
+    noncollinear = False
+
+    kpoints, weights = [], []
+    eigenvalues, projected = None, None
+    orbitals = []
+    symbols = []
+    varrays = {name: [] for name in STEP_VARRAYS + TENSOR_VARRAYS}
+    vectors = []                      # rows of the current <varray>
+
+    varray_name = None                # name of the current <varray>
+    in_kpoints = False                # inside <kpoints> (only the first kpointlist is used)
+    in_eigenvalues = False            # inside <eigenvalues>
+    in_projected = False              # inside <projected>
+    in_copy = False                   # inside the copy of <eigenvalues> written in <projected> (skipped)
+    in_symbols = False                # inside <array name="atoms"> of <atominfo>
+    column = 0                        # <c> inside the current <rc>
+    spin = kpoint = band = 0          # indices from <set comment="...">
+    row = 0                           # band (eigenvalues) or ion (projected) inside the current block
+
+    for event, elem in ET.iterparse(file_path, events=('start', 'end')):
+        tag = elem.tag
+
+        if event == 'start':
+            if tag == 'set':
+                comment = elem.get('comment')
+                if comment:
+                    if comment.startswith('spin'):               # <set comment="spin 1"> or <set comment="spin1">
+                        spin = int(comment.replace('spin', '')) - 1
+                    elif comment.startswith('kpoint'):           # <set comment="kpoint 1">
+                        kpoint = int(comment.split()[1]) - 1
+                        row = 0
+                    elif comment.startswith('band'):             # <set comment="band 1">
+                        band = int(comment.split()[1]) - 1
+                        row = 0
+            elif tag == 'varray':
+                varray_name = elem.get('name')
+                vectors = []
+            elif tag == 'kpoints':
+                in_kpoints = not kpoints
+            elif tag == 'eigenvalues':
+                if in_projected:
+                    in_copy = True
+                else:
+                    in_eigenvalues = True
+            elif tag == 'projected':
+                in_projected = True
+                orbitals = []
+            elif tag == 'array':
+                in_symbols = elem.get('name') == 'atoms'
+            elif tag == 'rc':
+                column = 0
+            continue
+
+        # event == 'end'
+        if tag == 'r':
+            if in_eigenvalues:
+                if eigenvalues is None:
+                    eigenvalues = np.zeros((nspin, nkpoints, nbands, 2))
+                eigenvalues[spin, kpoint, row] = list(map(float, elem.text.split()[:2]))
+                row += 1
+            elif in_projected and not in_copy:
+                if projected is None:
+                    nspin_projected = 4 if noncollinear else nspin
+                    projected = np.zeros((nspin_projected, nkpoints, nbands, nions, len(orbitals)))
+                projected[spin, kpoint, band, row] = list(map(float, elem.text.split()))
+                row += 1
+        elif tag == 'v':
+            if in_kpoints and varray_name == 'kpointlist':
+                kpoints.append(list(map(float, elem.text.split())))
+            elif in_kpoints and varray_name == 'weights':
+                weights.append(float(elem.text))
+            elif varray_name in varrays:
+                vectors.append(list(map(float, elem.text.split())))
+        elif tag == 'field' and in_projected and not in_copy:
+            orbitals.append(elem.text.strip())
+        elif tag == 'c' and in_symbols:
+            if column == 0:
+                symbols.append(elem.text.strip())
+            column += 1
+        elif tag == 'array':
+            in_symbols = False
+        elif tag == 'i':
+            name = elem.get('name')
+            if name == 'NBANDS':
+                nbands = int(elem.text)
+            elif name == 'ISPIN':
+                nspin = int(elem.text)
+            elif name == 'LNONCOLLINEAR':
+                noncollinear = elem.text.strip() == 'T'
+        elif tag == 'atoms':
+            nions = int(elem.text)
+        elif tag == 'varray':
+            if varray_name in varrays and vectors:
+                varrays[varray_name].append(vectors)
+            varray_name = None
+        elif tag == 'kpoints':
+            in_kpoints = False
+            nkpoints = len(kpoints)
+        elif tag == 'eigenvalues':
+            in_eigenvalues = in_copy = False
+        elif tag == 'projected':
+            in_projected = False
+
+        elem.clear()
+
+    data = {'kpoints': np.array(kpoints), 'weights': np.array(weights), 'symbols': np.array(symbols)}
+    if eigenvalues is not None:
+        data['eigenvalues'] = eigenvalues
+    if projected is not None:
+        data['projected'] = projected
+        data['orbitals'] = np.array(orbitals)
+    for name in STEP_VARRAYS:
+        if varrays[name]:
+            data[name] = np.array(varrays[name])
+    for name in TENSOR_VARRAYS:
+        if varrays[name]:
+            data[name] = np.array(varrays[name][0])
+    return data
+
+
+def load_vasprun(file_path='vasprun.xml', rebuild=False):
+    "Same as read_vasprun, but the arrays are read from the sidecar when it is up to date with the file"
+    return load_sidecar(file_path, read_vasprun, version=VERSION, rebuild=rebuild)